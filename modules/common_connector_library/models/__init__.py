@@ -15,6 +15,7 @@ from . import common_log_book_ept
 from . import common_log_lines_ept
 from . import account_fiscal_position
 from . import common_product_image_ept
+from . import common_image_cache_ept
 from . import common_product_brand_ept
 from . import product_template
 from . import vendor_stock_ept
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import base64
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+import psycopg2
+import requests
+from odoo import models, fields, api
+from odoo.tools import mute_logger
+
+_logger = logging.getLogger(__name__)
+
+IMAGE_FETCH_THREADS = 8
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_CACHE_DAYS = 90
+
+_thread_data = threading.local()
+
+
+def _get_session():
+    """ Session of the current thread, so the connections to the image hosts are kept alive between images. """
+    session = getattr(_thread_data, "image_session", None)
+    if session is None:
+        session = _thread_data.image_session = requests.Session()
+    return session
+
+
+class CommonImageCacheEpt(models.Model):
+    """
+    Cache of the images downloaded from URLs by the connectors.
+    Images are stored as attachments, so the same image found at many URLs is kept once in the filestore.
+    Cached images are used until they expire as per the Cache-Control of the image host, and are validated
+    with the ETag and Last-Modified of the image afterwards, so an unchanged image is not downloaded again.
+    """
+    _name = "common.image.cache.ept"
+    _description = "Common Image Cache"
+
+    url = fields.Char(required=True, index=True)
+    image = fields.Binary(attachment=True)
+    checksum = fields.Char(index=True, help="SHA1 of the image.")
+    mimetype = fields.Char()
+    etag = fields.Char()
+    last_modified = fields.Char()
+    expires_at = fields.Datetime()
+
+    _sql_constraints = [("url_unique", "unique(url)", "Image of the URL is already cached.")]
+
+    @api.model
+    def get_images_ept(self, urls, timeout=IMAGE_FETCH_TIMEOUT):
+        """
+        Gets the images of the URLs, from the cache or by downloading them in a pool of threads.
+        @param urls: List of image URLs.
+        @param timeout: Timeout of a download in seconds.
+        @return: Dictionary of URL and cache record. URLs which could not be downloaded are not in it.
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        cached_images = {cached_image.url: cached_image for cached_image in self.search([("url", "in", urls)])}
+        now = fields.Datetime.now()
+        images = {url: cached_image for url, cached_image in cached_images.items()
+                  if cached_image.image and cached_image.expires_at and cached_image.expires_at > now}
+
+        # Workers do not access the records, so the validators are read here.
+        requests_to_send = []
+        for url in urls:
+            if url in images:
+                continue
+            cached_image = cached_images.get(url)
+            if cached_image and cached_image.image:
+                requests_to_send.append((url, cached_image.etag, cached_image.last_modified))
+            else:
+                requests_to_send.append((url, False, False))
+        if not requests_to_send:
+            return images
+
+        with ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_THREADS, len(requests_to_send)),
+                                thread_name_prefix="image_fetch") as executor:
+            responses = list(executor.map(partial(self.fetch_image_ept, timeout=timeout), requests_to_send))
+
+        for (url, _etag, _last_modified), response in zip(requests_to_send, responses):
+            if response.get("error"):
+                _logger.info("Image %s could not be downloaded: %s", url, response.get("error"))
+                continue
+            vals = {"etag": response.get("etag"),
+                    "last_modified": response.get("last_modified"),
+                    "expires_at": now + timedelta(seconds=response["max_age"]) if response.get("max_age") else False}
+            cached_image = cached_images.get(url)
+            if not response.get("not_modified"):
+                checksum = hashlib.sha1(response["content"]).hexdigest()
+                vals.update({"mimetype": response.get("mimetype")})
+                if not cached_image or cached_image.checksum != checksum:
+                    vals.update({"image": base64.b64encode(response["content"]), "checksum": checksum})
+            if cached_image:
+                cached_image.write(vals)
+            else:
+                vals.update({"url": url})
+                cached_image = self.create_image_cache_ept(vals)
+            images[url] = cached_image
+        return images
+
+    def create_image_cache_ept(self, vals):
+        """
+        Creates the cache of an image. When another process has cached the same URL meanwhile, the unique
+        constraint is violated and the record cached by it is updated instead.
+        @param vals: Values of the cache record.
+        @return: Cache record.
+        """
+        try:
+            with self.env.cr.savepoint(), mute_logger("odoo.sql_db"):
+                return self.create(vals)
+        except psycopg2.IntegrityError:
+            cached_image = self.search([("url", "=", vals.get("url"))], limit=1)
+            cached_image.write(vals)
+            return cached_image
+
+    def fetch_image_ept(self, image_request, timeout=IMAGE_FETCH_TIMEOUT):
+        """
+        Runs in a worker thread and downloads one image, if it is changed since it was cached.
+        @param image_request: Tuple of URL, ETag and Last-Modified of the cached image.
+        @param timeout: Timeout of the download in seconds.
+        @return: Dictionary of the response.
+        """
+        url, etag, last_modified = image_request
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            response = _get_session().get(url, headers=headers, verify=False, timeout=timeout)
+        except requests.RequestException as error:
+            return {"error": str(error)}
+
+        result = {"etag": response.headers.get("ETag") or etag,
+                  "last_modified": response.headers.get("Last-Modified") or last_modified,
+                  "max_age": self.get_max_age_ept(response.headers.get("Cache-Control"))}
+        if response.status_code == 304:
+            result.update({"not_modified": True})
+        elif response.status_code == 200:
+            result.update({"content": response.content,
+                           "mimetype": (response.headers.get("Content-Type") or "").split(";")[0].strip()})
+        else:
+            result = {"error": "HTTP status %s" % response.status_code}
+        return result
+
+    @staticmethod
+    def get_max_age_ept(cache_control):
+        """
+        Gives the seconds for which an image can be used without validating it, as per the Cache-Control header.
+        @param cache_control: Value of the Cache-Control header.
+        """
+        if not cache_control or "no-cache" in cache_control or "no-store" in cache_control:
+            return 0
+        max_age = re.search(r"max-age=(\d+)", cache_control)
+        return int(max_age.group(1)) if max_age else 0
+
+    @api.autovacuum
+    def _gc_image_cache(self):
+        """ Removes the images which are not downloaded or validated since IMAGE_CACHE_DAYS. """
+        limit_date = fields.Datetime.now() - timedelta(days=IMAGE_CACHE_DAYS)
+        self.search([("write_date", "<", limit_date)]).unlink()
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 import base64
-import requests
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
@@ -28,12 +27,9 @@ class ProductImageEpt(models.Model):
         image_types = ["image/jpeg", "image/png", "image/tiff",
                        "image/vnd.microsoft.icon", "image/x-icon",
                        "image/vnd.djvu", "image/svg+xml", "image/gif"]
-        response = requests.get(url, stream=True, verify=False, timeout=10)
-        if response.status_code == 200:
-            if response.headers["Content-Type"] in image_types:
-                image = base64.b64encode(response.content)
-                if image:
-                    return image
+        cached_image = self.env["common.image.cache.ept"].get_images_ept([url]).get(url)
+        if cached_image and cached_image.mimetype in image_types and cached_image.image:
+            return cached_image.image
         raise UserError(_("Can't find image.\nPlease provide valid Image URL."))
 
     @api.model
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import logging
+import time
+
+from odoo import fields
+
+_logger = logging.getLogger("Shopify")
+
+
+class ShopifyCommitBatch(object):
+    """
+    Groups the records processed by a queue into transactions.
+    Every record runs in its own savepoint, so a failing record is rolled back alone and the batch goes on.
+    The transaction is committed when it has run for the commit interval or holds the maximum number of
+    records, so the number of records per commit follows the time the records take to process.
+    The claim time of the queue being processed is refreshed on every commit, so the queue is not taken over
+    by another worker while it is still processed.
+    """
+
+    def __init__(self, cr, max_records=50, interval=10.0, claimed_queue=None):
+        self.cr = cr
+        self.max_records = max(max_records, 1)
+        self.interval = max(interval, 0)
+        self.claimed_queue = claimed_queue
+        self.pending = 0
+        self.started_at = time.time()
+
+    def run(self, method, *args, **kwargs):
+        """
+        Processes one record in a savepoint and commits the transaction when the batch is full.
+        @param method: Method processing the record.
+        @return: Result of the method and the exception raised by it, if any.
+        """
+        result = error = False
+        try:
+            with self.cr.savepoint():
+                result = method(*args, **kwargs)
+        except Exception as exception:
+            _logger.exception("Record could not be processed and is rolled back.")
+            error = exception
+
+        self.pending += 1
+        if self.pending >= self.max_records or time.time() - self.started_at >= self.interval:
+            self.commit()
+        return result, error
+
+    def commit(self):
+        """
+        Commits the records processed since the last commit.
+        """
+        if self.claimed_queue:
+            self.claimed_queue.filtered("is_process_queue").write({"process_claimed_at": fields.Datetime.now()})
+        self.cr.commit()
+        self.pending = 0
+        self.started_at = time.time()
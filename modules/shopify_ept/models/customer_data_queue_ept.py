@@ -26,6 +26,8 @@ class ShopifyCustomerDataQueueEpt(models.Model):
     common_log_lines_ids = fields.One2many(related="common_log_book_id.log_lines")
     record_created_from = fields.Selection([("webhook", "From Webhook"), ("import_process", "From Import Process")])
     is_process_queue = fields.Boolean("Is Processing Queue", default=False)
+    process_claimed_at = fields.Datetime(copy=False, readonly=True,
+                                         help="Time when a queue worker claimed this queue for processing.")
     running_status = fields.Char(default="Running...")
     is_action_require = fields.Boolean(default=False)
     queue_process_count = fields.Integer(help="It is used know how many time queue is processed")
@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import json
 import logging
 from datetime import datetime
 
-from odoo import models, fields, api
+from odoo import models, fields
 
 _logger = logging.getLogger("Shopify")
 
@@ -26,6 +25,15 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
                                            "shopify_customer_data_queue_line_id",
                                            help="Log lines created against which line.")
     name = fields.Char(string="Customer", help="Shopify Customer Name")
+    shopify_synced_customer_data_preview = fields.Text(
+        string="Customer Data", compute="_compute_shopify_synced_customer_data_preview",
+        help="Data of the customer, decoded only when the queue line is shown.")
+
+    def _compute_shopify_synced_customer_data_preview(self):
+        data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
+        for queue_line in self:
+            queue_line.shopify_synced_customer_data_preview = data_queue_mixin_obj.get_shopify_queue_data_preview(
+                queue_line.shopify_synced_customer_data)
 
     def shopify_create_multi_queue(self, customer_queue_id, customer_ids):
         """
@@ -38,7 +46,8 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
         """
         if customer_queue_id:
             for result in customer_ids:
-                result = result.to_dict()
+                if not isinstance(result, dict):
+                    result = result.to_dict()
                 self.shopify_customer_data_queue_line_create(result, customer_queue_id)
         return True
 
@@ -52,7 +61,7 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
         synced_shopify_customers_line_obj = self.env["shopify.customer.data.queue.line.ept"]
         name = "%s %s" % (result.get("first_name") or "", result.get("last_name") or "")
         customer_id = result.get("id")
-        data = json.dumps(result)
+        data = self.env["data.queue.mixin.ept"].encode_shopify_queue_data(result)
         line_vals = {
             "synced_customer_queue_id": customer_queue_id.id,
             "shopify_customer_data_id": customer_id or "",
@@ -63,62 +72,74 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
         }
         return synced_shopify_customers_line_obj.create(line_vals)
 
-    @api.model
     def sync_shopify_customer_into_odoo(self):
         """
         Change the queue and queue line record state using this compute method
+        Every run claims the queues one by one, so several customer queue crons can process the queues
+        concurrently. Each run stops after 10 queues to give the other workers their share. When called on
+        queue lines, only the queues of those lines are claimed.
         :author: Angel Patel @Emipro Technologies Pvt.Ltd on date 02/11/2019.
         :Task ID: 157065
         """
-        shopify_customer_queue_obj = self.env["shopify.customer.data.queue.ept"]
         common_log_book_obj = self.env["common.log.book.ept"]
         ir_model_obj = self.env["ir.model"]
-        customer_queue_ids = []
-
-        query = """select queue.id
-            from shopify_customer_data_queue_line_ept as queue_line
-            inner join shopify_customer_data_queue_ept as queue on queue_line.synced_customer_queue_id = queue.id
-            where queue_line.state='draft' and queue.is_action_require = 'False'
-            ORDER BY queue_line.create_date ASC limit 500"""
-        self._cr.execute(query)
-        customer_data_queue_list = self._cr.fetchall()
-        if not customer_data_queue_list:
-            return True
-
-        for customer_data_queue_id in customer_data_queue_list:
-            if customer_data_queue_id[0] not in customer_queue_ids:
-                customer_queue_ids.append(customer_data_queue_id[0])
-
-        queues = shopify_customer_queue_obj.browse(customer_queue_ids)
-        for queue in queues:
+        queue_ids = self.synced_customer_queue_id.ids or None
+        handled_queue_ids = []
+
+        for _ in range(10):
+            queue = self.claim_customer_queue(queue_ids, exclude_queue_ids=handled_queue_ids)
+            if not queue:
+                break
+            handled_queue_ids.append(queue.id)
             results = queue.synced_customer_queue_line_ids.filtered(lambda x: x.state == "draft")
 
             queue.queue_process_count += 1
             if queue.queue_process_count > 3:
-                queue.is_action_require = True
+                queue.write({"is_action_require": True, "is_process_queue": False, "process_claimed_at": False})
                 note = "<p>Need to process this customer queue manually.There are 3 attempts been made by " \
                        "automated action to process this queue,<br/>- Ignore, if this queue is already processed.</p>"
                 queue.message_post(body=note)
                 if queue.shopify_instance_id.is_shopify_create_schedule:
                     model_id = ir_model_obj.search([("model", "=", "shopify.customer.data.queue.ept")]).id
                     common_log_book_obj.create_crash_queue_schedule_activity(queue, model_id, note)
+                self._cr.commit()
                 continue
             self._cr.commit()
             results.process_customer_queue_lines()
+            self._cr.commit()
         return True
 
+    def claim_customer_queue(self, queue_ids=None, line_states=("draft",), include_action_required=False,
+                             exclude_queue_ids=None):
+        """
+        This method claims the oldest customer queue having pending lines for the current worker.
+        @param queue_ids: Claim one of these queues only.
+        @param line_states: States of the queue lines to be processed.
+        @param include_action_required: Claim the queues marked as action required too.
+        @param exclude_queue_ids: Queues already handled in this run, which are not claimed again.
+        @return: Claimed customer queue or empty recordset.
+        """
+        return self.env["data.queue.mixin.ept"].claim_shopify_data_queue("shopify.customer.data.queue.ept",
+                                                                         "shopify.customer.data.queue.line.ept",
+                                                                         "synced_customer_queue_id",
+                                                                         queue_ids, line_states,
+                                                                         include_action_required,
+                                                                         exclude_queue_ids)
+
     def process_customer_queue_lines(self):
         """
         This method process the queue lines.
         """
-        shopify_partner_obj = self.env["shopify.res.partner.ept"]
         common_log_book_obj = self.env["common.log.book.ept"]
+        shopify_partner_obj = self.env["shopify.res.partner.ept"]
+        data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
         queues = self.synced_customer_queue_id
 
         for queue in queues:
             instance = queue.shopify_instance_id
             if not instance.active:
                 _logger.info("Instance '{}' is not active.".format(instance.name))
+                queues.write({"is_process_queue": False, "process_claimed_at": False})
                 return True
 
             if queue.common_log_book_id:
@@ -129,34 +150,55 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
                                                           "module": "shopify_ept",
                                                           "shopify_instance_id": instance.id,
                                                           "model_id": model_id})
-                self.env.cr.execute("""update shopify_product_data_queue_ept set is_process_queue = False where 
-                is_process_queue = True""")
-                self._cr.commit()
 
-            commit_count = 0
-            for line in self:
-                commit_count += 1
-                if commit_count == 10:
-                    queue.is_process_queue = True
-                    self._cr.commit()
-                    commit_count = 0
-
-                customer_data = json.loads(line.shopify_synced_customer_data)
-                main_partner = shopify_partner_obj.shopify_create_contact_partner(customer_data, instance, line,
-                                                                                  log_book_id)
-                if main_partner:
-                    for address in customer_data.get("addresses"):
-                        if address.get("default"):
-                            continue
-                        shopify_partner_obj.shopify_create_or_update_address(address, instance, main_partner)
-
-                    line.update({"state": "done", "last_process_date": datetime.now()})
-                else:
+            queue.is_process_queue = True
+            self._cr.commit()
+            commit_batch = instance.get_shopify_commit_batch(queue)
+            lines = self.filtered(lambda x: x.synced_customer_queue_id == queue)
+            customers = [data_queue_mixin_obj.decode_shopify_queue_data(line.shopify_synced_customer_data) or {}
+                         for line in lines]
+            partner_cache = shopify_partner_obj.prepare_shopify_partner_cache(customers, instance)
+            for index, line in enumerate(lines):
+                _, error = commit_batch.run(self.process_customer_queue_line, line, instance, log_book_id,
+                                            partner_cache=partner_cache, customer_data=customers[index])
+                if error:
+                    message = "Error while importing customer of queue line %s: %s" % (line.name, error)
+                    self.env["common.log.lines.ept"].shopify_create_customer_log_line(
+                        message, log_book_id.model_id.id, line, log_book_id)
                     line.update({"state": "failed", "last_process_date": datetime.now()})
-                queue.is_process_queue = False
+                    # The partners of the failed line are rolled back, so the cache is resolved again.
+                    partner_cache = shopify_partner_obj.prepare_shopify_partner_cache(customers[index + 1:], instance)
+            commit_batch.commit()
+            queue.write({"is_process_queue": False, "process_claimed_at": False})
 
             queue.common_log_book_id = log_book_id
             _logger.info("Customer Queue %s is processed." % queue.name)
             if log_book_id and not log_book_id.log_lines:
                 log_book_id.unlink()
         return True
+
+    def process_customer_queue_line(self, line, instance, log_book_id, partner_cache=None, customer_data=None):
+        """
+        This method creates the customer and its addresses of one queue line.
+        @param line: Customer queue line.
+        @param partner_cache: Partners resolved by prepare_shopify_partner_cache for the lines of the queue.
+        @param customer_data: Decoded data of the line, decoded here when not given.
+        """
+        shopify_partner_obj = self.env["shopify.res.partner.ept"]
+
+        if customer_data is None:
+            customer_data = self.env["data.queue.mixin.ept"].decode_shopify_queue_data(
+                line.shopify_synced_customer_data)
+        main_partner = shopify_partner_obj.shopify_create_contact_partner(customer_data, instance, line,
+                                                                          log_book_id, partner_cache=partner_cache)
+        if main_partner:
+            for address in customer_data.get("addresses"):
+                if address.get("default"):
+                    continue
+                shopify_partner_obj.shopify_create_or_update_address(address, instance, main_partner,
+                                                                     partner_cache=partner_cache)
+
+            line.update({"state": "done", "last_process_date": datetime.now()})
+        else:
+            line.update({"state": "failed", "last_process_date": datetime.now()})
+        return main_partner
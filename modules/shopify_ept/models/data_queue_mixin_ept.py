@@ -1,4 +1,20 @@
-from odoo import models
+import base64
+import json
+import zlib
+from datetime import timedelta
+from dateutil import parser
+from pytz import utc
+from odoo import models, fields
+from ..shopify.pyactiveresource import jsoncodec
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+QUEUE_CLAIM_TIMEOUT = timedelta(minutes=30)
+# Payloads smaller than this are stored as plain JSON, as compressing them saves almost nothing.
+QUEUE_DATA_COMPRESS_MIN_SIZE = 512
 
 
 class DataQueueMixinEpt(models.AbstractModel):
@@ -10,5 +26,136 @@ class DataQueueMixinEpt(models.AbstractModel):
         This method will delete completed data queues from database.
         """
         queue_data += ["shopify_product_data_queue_ept", "shopify_order_data_queue_ept",
-                       "shopify_customer_data_queue_ept"]
+                       "shopify_customer_data_queue_ept", "shopify_webhook_inbox_ept"]
         return super(DataQueueMixinEpt, self).delete_data_queue_ept(queue_data)
+
+    def claim_shopify_data_queue(self, queue_model, queue_line_model, queue_field, queue_ids=None,
+                                 line_states=("draft",), include_action_required=False, exclude_queue_ids=None,
+                                 claim=True):
+        """
+        This method claims one queue for the current worker, so several cron workers can process the queues
+        concurrently without picking the same queue.
+        The oldest pending queue line and its queue are locked with FOR UPDATE SKIP LOCKED, so concurrent workers
+        skip the rows already being claimed. As the queue processing commits in between, the claim is kept in
+        is_process_queue with the claim time, and claims older than QUEUE_CLAIM_TIMEOUT are taken over as the
+        worker holding them has crashed. Queues of inactive instances are not claimed.
+        @param queue_model: Model name of the queue.
+        @param queue_line_model: Model name of the queue line.
+        @param queue_field: Field of the queue line, which links it to the queue.
+        @param queue_ids: Claim one of these queues only.
+        @param line_states: States of the queue lines to be processed.
+        @param include_action_required: Claim the queues marked as action required too, as done when the queues
+        are processed manually.
+        @param exclude_queue_ids: Do not claim these queues, like the queues already handled by the current run.
+        @param claim: When False, the queue which would be claimed is only looked up, without locking or claiming
+        it, so another worker can still take it.
+        @return: Claimed queue or empty recordset.
+        """
+        queue_obj = self.env[queue_model]
+        now = fields.Datetime.now()
+
+        where_clause = ""
+        params = [tuple(line_states), now - QUEUE_CLAIM_TIMEOUT]
+        if not include_action_required:
+            where_clause += " and queue.is_action_require = 'False'"
+        if queue_ids:
+            where_clause += " and queue.id in %s"
+            params.append(tuple(queue_ids))
+        if exclude_queue_ids:
+            where_clause += " and queue.id not in %s"
+            params.append(tuple(exclude_queue_ids))
+
+        self.env[queue_line_model].flush([queue_field, "state"])
+        queue_obj.flush(["is_process_queue", "process_claimed_at", "is_action_require", "shopify_instance_id"])
+        self.env["shopify.instance.ept"].flush(["active"])
+        query = """select queue.id
+                from {line_table} as queue_line
+                inner join {queue_table} as queue on queue_line.{queue_field} = queue.id
+                inner join shopify_instance_ept as instance on queue.shopify_instance_id = instance.id
+                and instance.active = 'True'
+                where queue_line.state in %s
+                and (queue.is_process_queue = 'False' or queue.process_claimed_at is null
+                or queue.process_claimed_at < %s){where_clause}
+                ORDER BY queue_line.create_date ASC limit 1
+                {lock_clause}""".format(line_table=self.env[queue_line_model]._table,
+                                        queue_table=queue_obj._table,
+                                        queue_field=queue_field,
+                                        where_clause=where_clause,
+                                        lock_clause=claim and "FOR UPDATE OF queue_line, queue SKIP LOCKED" or "")
+        self._cr.execute(query, params)
+        result = self._cr.fetchone()
+        if not result:
+            return queue_obj
+
+        queue = queue_obj.browse(result[0])
+        if not claim:
+            return queue
+        queue.write({"is_process_queue": True, "process_claimed_at": now})
+        self._cr.commit()
+        return queue
+
+    def encode_shopify_queue_data(self, data):
+        """
+        Encodes the data of a queue line to be stored in its text field.
+        Big payloads are compressed with zstd, or zlib when zstandard is not installed, and stored in base64
+        with the name of the compression as prefix.
+        @param data: Dictionary received from Shopify.
+        @return: Text to store in the queue line.
+        """
+        raw_data = jsoncodec.dumps(data)
+        if len(raw_data) < QUEUE_DATA_COMPRESS_MIN_SIZE:
+            return raw_data.decode("utf-8")
+        if zstandard:
+            return "zstd:" + base64.b64encode(zstandard.ZstdCompressor(level=3).compress(raw_data)).decode("ascii")
+        return "zlib:" + base64.b64encode(zlib.compress(raw_data)).decode("ascii")
+
+    def decode_shopify_queue_data(self, value):
+        """
+        Decodes the data of a queue line stored by encode_shopify_queue_data. Plain JSON is decoded as it is,
+        so the lines created before the payloads were compressed are still processed.
+        @param value: Text stored in the queue line.
+        @return: Dictionary of the data.
+        """
+        if not value:
+            return {}
+        if value.startswith("zstd:"):
+            if not zstandard:
+                raise ImportError("The zstandard python package is needed to decode this queue line.")
+            value = zstandard.ZstdDecompressor().decompress(base64.b64decode(value[5:]))
+        elif value.startswith("zlib:"):
+            value = zlib.decompress(base64.b64decode(value[5:]))
+        return jsoncodec.loads(value)
+
+    def get_shopify_queue_data_preview(self, value):
+        """
+        Gives the data of a queue line as indented JSON, to be shown in the form of the queue line.
+        @param value: Text stored in the queue line.
+        """
+        if not value:
+            return False
+        return json.dumps(self.decode_shopify_queue_data(value), indent=4)
+
+    def get_shopify_updated_at(self, data):
+        """
+        Gives the updated_at of a resource received from Shopify as UTC datetime.
+        @param data: Dictionary of the resource.
+        @return: Datetime or False, if the resource has no valid updated_at.
+        """
+        updated_at = data and data.get("updated_at")
+        if not updated_at:
+            return False
+        try:
+            return parser.parse(updated_at).astimezone(utc).replace(tzinfo=None)
+        except (ValueError, OverflowError):
+            return False
+
+    def is_newer_shopify_data(self, new_data, old_data):
+        """
+        Checks whether the new data of a resource is at least as recent as the old data by their updated_at.
+        Data without updated_at is treated as newer.
+        @param new_data: Dictionary of the resource just received.
+        @param old_data: Dictionary of the resource pending in a queue.
+        """
+        new_updated_at = self.get_shopify_updated_at(new_data)
+        old_updated_at = self.get_shopify_updated_at(old_data)
+        return not new_updated_at or not old_updated_at or new_updated_at >= old_updated_at
@@ -64,22 +64,37 @@ class DeliveryCarrier(models.Model):
             "tracking_company exactly as written in the list above. If the tracking company doesn't match one of the"
             "supported entries, then the shipping status might not be updated properly during the fulfillment process.")
 
-    def shopify_search_create_delivery_carrier(self, line, instance):
+    def shopify_search_create_delivery_carrier(self, line, instance, order_lookup=None):
+        """
+        Searches the carrier of a shipping line of Shopify order and creates it, if not found.
+        @param order_lookup: Records prefetched for the batch by sale.order's prepare_shopify_order_lookup.
+        """
         delivery_source = line.get('source')
         delivery_code = line.get('code')
         delivery_title = line.get('title')
         carrier = self.env['delivery.carrier']
         if delivery_source and delivery_code:
-            carrier = self.search(
-                [('shopify_source', '=', delivery_source), '|', ('shopify_code', '=', delivery_code),
-                 ('shopify_tracking_company', '=', delivery_code)], limit=1)
-            if not carrier:
+            if order_lookup is not None:
+                carrier = order_lookup["carriers"].get((delivery_source, delivery_code), carrier)
+                if carrier:
+                    return carrier
+            else:
                 carrier = self.search(
-                    [('name', '=', delivery_title)], limit=1)
+                    [('shopify_source', '=', delivery_source), '|', ('shopify_code', '=', delivery_code),
+                     ('shopify_tracking_company', '=', delivery_code)], limit=1)
+            if not carrier:
+                if order_lookup is not None:
+                    carrier = order_lookup["carrier_titles"].get(delivery_title, carrier)
+                else:
+                    carrier = self.search(
+                        [('name', '=', delivery_title)], limit=1)
                 if carrier:
                     carrier.write({'shopify_source': delivery_source, 'shopify_code': delivery_code})
             if not carrier:
                 carrier = self.create(
                     {'name': delivery_title, 'shopify_code': delivery_code, 'shopify_source': delivery_source,
                      'product_id': instance.shipping_product_id.id})
+            if order_lookup is not None:
+                order_lookup["carriers"][(delivery_source, delivery_code)] = carrier
+                order_lookup["carrier_titles"].setdefault(delivery_title, carrier)
         return carrier
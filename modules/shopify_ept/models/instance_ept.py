@@ -7,6 +7,7 @@ from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 from .. import shopify
 from ..shopify.pyactiveresource.connection import ForbiddenAccess
+from .commit_batch import ShopifyCommitBatch
 
 _logger = logging.getLogger("Shopify : ")
 
@@ -210,6 +211,29 @@ class ShopifyInstanceEpt(models.Model):
                                           default=_default_shipping_product,
                                           help="This is used for set shipping product in a Carrier.")
 
+    # Performance
+    shopify_order_fetch_threads = fields.Integer("Order Fetch Threads", default=4,
+                                                 help="Number of threads fetching the orders from Shopify in parallel. "
+                                                      "The import window is split into time slices and every "
+                                                      "slice is fetched by its own thread.")
+    shopify_stock_export_threads = fields.Integer("Stock Export Threads", default=4,
+                                                  help="Number of threads setting the stock in Shopify in parallel. "
+                                                       "Every thread sends 250 inventory levels per request.")
+    shopify_fulfillment_export_threads = fields.Integer("Fulfillment Export Threads", default=4,
+                                                        help="Number of threads creating the fulfillments in "
+                                                             "Shopify in parallel. The fulfillments of one order "
+                                                             "are sent by the same thread.")
+    shopify_webhook_intake = fields.Boolean("Process Webhooks in Background",
+                                            help="Webhooks are verified and stored in the webhook inbox, and "
+                                                 "Shopify gets the response at once. The inbox is processed by "
+                                                 "a scheduled action.")
+    shopify_commit_batch_size = fields.Integer("Records per Commit", default=50,
+                                               help="Maximum number of queue records processed in one transaction.")
+    shopify_commit_interval = fields.Integer("Commit Interval (Seconds)", default=10,
+                                             help="The queue processing commits its work at least after these "
+                                                  "many seconds. Fast records are committed in bigger batches, "
+                                                  "slow records in smaller ones.")
+
     _sql_constraints = [('unique_host', 'unique(shopify_host)',
                          "Instance already exists for given host. Host must be Unique for the instance!")]
 
@@ -231,6 +255,14 @@ class ShopifyInstanceEpt(models.Model):
         vals.update({"shopify_default_pos_customer_id": customer.id, "shopify_section_id": sales_team.id})
         return super(ShopifyInstanceEpt, self).create(vals)
 
+    def write(self, vals):
+        """
+        Inherited for clearing the cached webhook routes, when the instance is changed.
+        """
+        if {"active", "shopify_host", "shopify_shared_secret"} & set(vals):
+            self.env["shopify.webhook.ept"].clear_caches()
+        return super(ShopifyInstanceEpt, self).write(vals)
+
     def create_sales_channel(self, name):
         """
         Creates new sales team for Shopify instance.
@@ -273,6 +305,15 @@ class ShopifyInstanceEpt(models.Model):
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 07/10/2019.
         @change: Maulik Barad on Date 01-Oct-2020.
         """
+        shopify.ShopifyResource.set_site(self.prepare_shopify_shop_url(vals))
+        return True
+
+    def prepare_shopify_shop_url(self, vals={}):
+        """
+        Prepares the admin API url of the store with the credentials in it.
+        Worker threads use it to open their own connection, as the connection of Shopify is thread local.
+        @param vals: Dictionary of api_key and password.
+        """
         if vals:
             api_key = vals.get("shopify_api_key")
             password = vals.get("shopify_password")
@@ -285,9 +326,15 @@ class ShopifyInstanceEpt(models.Model):
             shop_url = shop[0] + "//" + api_key + ":" + password + "@" + shop[1] + "/admin/api/2020-07"
         else:
             shop_url = "https://" + api_key + ":" + password + "@" + shop[0] + "/admin/api/2020-07"
+        return shop_url
 
-        shopify.ShopifyResource.set_site(shop_url)
-        return True
+    def get_shopify_commit_batch(self, claimed_queue=None):
+        """
+        Gives the commit batch used by the queue processes of this instance.
+        @param claimed_queue: Queue being processed, its claim is refreshed on every commit.
+        """
+        return ShopifyCommitBatch(self._cr, self.shopify_commit_batch_size, self.shopify_commit_interval,
+                                  claimed_queue)
 
     def toggle_active(self):
         """
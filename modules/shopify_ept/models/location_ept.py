@@ -1,10 +1,8 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import time
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
 
 
 class ShopifyLocationEpt(models.Model):
@@ -58,11 +56,6 @@ class ShopifyLocationEpt(models.Model):
         instance_id = instance.id
         try:
             locations = shopify.Location.find()
-        except ClientError as error:
-            if hasattr(error, "response"):
-                if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(5)
-                    locations = shopify.Location.find()
         except Exception as error:
             raise UserError(error)
         shop = shopify.Shop.current()
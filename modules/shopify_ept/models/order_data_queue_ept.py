@@ -2,18 +2,68 @@
 # See LICENSE file for full copyright and licensing details.
 import time
 import pytz
+import queue
 import re
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from odoo import models, fields, api, _
+from odoo.tools import split_every
 from .. import shopify
 from datetime import datetime, timedelta
 from odoo.exceptions import UserError
-from ..shopify.pyactiveresource.connection import ClientError
 
 utc = pytz.utc
 
 _logger = logging.getLogger("Shopify")
 
+ADDRESS_BULK_FIELDS = "firstName lastName name company address1 address2 city province provinceCode country " \
+                      "countryCodeV2 zip phone"
+
+ORDER_BULK_QUERY = """
+{
+  orders(query: "%(filter)s") {
+    edges {
+      node {
+        id legacyResourceId name email phone note createdAt updatedAt cancelledAt currencyCode taxesIncluded
+        sourceName displayFinancialStatus displayFulfillmentStatus paymentGatewayNames tags
+        totalDiscountsSet { shopMoney { amount } }
+        taxLines { title rate priceSet { shopMoney { amount } } }
+        customer { legacyResourceId firstName lastName email phone defaultAddress { %(address)s } }
+        billingAddress { %(address)s }
+        shippingAddress { %(address)s }
+        fulfillments { location { legacyResourceId } }
+        lineItems {
+          edges {
+            node {
+              id name title sku quantity taxable
+              originalUnitPriceSet { shopMoney { amount } }
+              product { legacyResourceId }
+              variant { legacyResourceId }
+              taxLines { title rate priceSet { shopMoney { amount } } }
+              discountAllocations { allocatedAmountSet { shopMoney { amount } } }
+            }
+          }
+        }
+        shippingLines {
+          edges {
+            node {
+              id title code source
+              originalPriceSet { shopMoney { amount } }
+              taxLines { title rate priceSet { shopMoney { amount } } }
+              discountAllocations { allocatedAmountSet { shopMoney { amount } } }
+            }
+          }
+        }
+      }
+    }
+  }
+}"""
+
+BULK_FULFILLMENT_STATUS = {"FULFILLED": "fulfilled", "PARTIALLY_FULFILLED": "partial", "RESTOCKED": "restocked"}
+# Fields of the orders, which GraphQL does not give, read with one REST call per chunk of bulk orders.
+BULK_ORDER_REST_FIELDS = ("order_number", "checkout_id", "location_id")
+
 class ShopifyOrderDataQueueEpt(models.Model):
     _name = "shopify.order.data.queue.ept"
     _inherit = ['mail.thread', 'mail.activity.mixin']
@@ -47,6 +97,8 @@ class ShopifyOrderDataQueueEpt(models.Model):
                                    ("scheduled_action", "By Scheduled Action")],
                                   help="Identify the process that generated a queue.", default="import")
     is_process_queue = fields.Boolean('Is Processing Queue', default=False)
+    process_claimed_at = fields.Datetime(copy=False, readonly=True,
+                                         help="Time when a queue worker claimed this queue for processing.")
     running_status = fields.Char(default="Running...")
     # order_log_lines = fields.One2many('common.log.lines.ept', 'order_queue_line_id', "log Lines")
     queue_process_count = fields.Integer(string="Queue Process Times",
@@ -129,10 +181,12 @@ class ShopifyOrderDataQueueEpt(models.Model):
         return from_date, to_date
 
     def shopify_create_order_data_queues(self, instance, from_date, to_date, created_by="import",
-                                         order_type="unshipped"):
+                                         order_type="unshipped", use_bulk_operation=False):
         """
         This method used to create order data queues.
+        Pages are consumed as they arrive from the parallel fetcher, so only a few pages are kept in memory.
         @param : self, instance,  from_date, to_date, created_by, order_type
+        @param use_bulk_operation: True to fetch the orders with one GraphQL bulk operation instead of paging them.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 06/11/2019.
         Task Id : 157350
         @change: Maulik Barad on Date 10-Sep-2020.
@@ -140,99 +194,302 @@ class ShopifyOrderDataQueueEpt(models.Model):
         start = time.time()
         order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
         order_queues = []
+        log_book = False
+        order_count = 0
 
         instance.connect_in_shopify()
 
-        api_from_date, api_to_date = self.convert_dates_by_timezone(instance, from_date, to_date)
+        if use_bulk_operation:
+            order_pages = self.shopify_fetch_order_pages_by_bulk_operation(instance, from_date, to_date, order_type)
+        else:
+            order_pages = self.shopify_fetch_order_pages(instance, from_date, to_date, order_type)
+        for orders in order_pages:
+            order_count += len(orders)
+            if order_type == "shipped":
+                order_queues += order_data_queue_line_obj.create_order_data_queue_line(orders, instance,
+                                                                                       created_by)
+            else:
+                if not log_book:
+                    log_book = self.create_shopify_order_log_book(instance)
+                self.process_shopify_orders_directly(orders, instance, log_book)
 
-        try:
-            order_ids = shopify.Order().find(status="any",
-                                             fulfillment_status=order_type,
-                                             updated_at_min=api_from_date,
-                                             updated_at_max=api_to_date, limit=250)
-        except Exception as error:
-            raise UserError(error)
+        if log_book and not log_book.log_lines:
+            log_book.unlink()
 
-        if order_ids:
-            if order_type == "shipped":
-                order_queues = order_data_queue_line_obj.create_order_data_queue_line(order_ids,
-                                                                                      instance,
-                                                                                      created_by)
-            if len(order_ids) >= 250:
-                order_ids, order_queue_list = self.list_all_orders(order_ids, instance, created_by,
-                                                                   order_type)
-                order_queues += order_queue_list
-
-        if order_type == "unshipped" and order_ids:
-            self.process_shopify_orders_directly(order_ids, instance)
-            instance.last_date_order_import = to_date - timedelta(days=2)
+        if order_type == "unshipped":
+            if order_count:
+                instance.last_date_order_import = to_date - timedelta(days=2)
         else:
             instance.last_shipped_order_import_date = to_date - timedelta(days=2)
         end = time.time()
-        _logger.info("Imported Orders in %s seconds." % (str(end - start)))
+        _logger.info("Imported %s Orders in %s seconds." % (order_count, str(end - start)))
         return order_queues
 
-    def process_shopify_orders_directly(self, order_data, instance):
+    def create_shopify_order_log_book(self, instance):
+        """
+        Creates log book for importing the orders.
+        @param instance: Shopify Instance.
+        """
+        common_log_book_obj = self.env["common.log.book.ept"]
+        model_id = self.env["common.log.lines.ept"].get_model_id("sale.order")
+        return common_log_book_obj.create({"type":"import",
+                                           "module":"shopify_ept",
+                                           "shopify_instance_id":instance.id,
+                                           "model_id":model_id})
+
+    def process_shopify_orders_directly(self, order_data, instance, log_book=False):
         """
         This method processes the order data directly, without creating queue lines.
-        @param order_data:
-        @param instance:
+        @param order_data: List of orders.
+        @param instance: Shopify Instance.
+        @param log_book: Log book to use, it is created and removed here if not given.
         """
         sale_order_obj = self.env["sale.order"]
-        common_log_book_obj = self.env["common.log.book.ept"]
-        common_log_lines_obj = self.env["common.log.lines.ept"]
 
-        model_id = common_log_lines_obj.get_model_id("sale.order")
-        log_book = common_log_book_obj.create({"type":"import",
-                                               "module":"shopify_ept",
-                                               "shopify_instance_id":instance.id,
-                                               "model_id":model_id})
+        new_log_book = not log_book
+        if new_log_book:
+            log_book = self.create_shopify_order_log_book(instance)
         order_ids = sale_order_obj.import_shopify_orders(order_data, log_book, is_queue_line=False)
-        if not log_book.log_lines:
+        if new_log_book and not log_book.log_lines:
             log_book.unlink()
         return order_ids
 
-    def list_all_orders(self, result, instance, created_by, order_type):
+    def prepare_order_import_time_slices(self, instance, from_date, to_date):
         """
-        This method used to get the list of orders from Shopify to Odoo.
-        @param : self, result, instance, created_by, order_type
-        @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 06/11/2019.
-        Task_id : 157350
-        Modify on date 27/12/2019 Taken pagination changes
-        @change : Maulik Barad on Date 10-Sep-2020.
+        Splits the import window into time slices, which are fetched in parallel.
+        Slices do not overlap, as Shopify compares updated_at by seconds.
+        @param instance: Shopify Instance.
+        @param from_date: From date in UTC.
+        @param to_date: To date in UTC.
+        @return: List of tuples of from date and to date, converted to the time zone of the store.
         """
-        order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
-        sum_order_list = []
-        order_queue_list = []
-        catch = ""
-
-        while result:
-            page_info = ""
-            if order_type == "unshipped":
-                sum_order_list += result
-            link = shopify.ShopifyResource.connection.response.headers.get('Link')
-            if not link or not isinstance(link, str):
-                return sum_order_list, order_queue_list
-
-            for page_link in link.split(','):
-                if page_link.find('next') > 0:
-                    page_info = page_link.split(';')[0].strip('<>').split('page_info=')[1]
-                    try:
-                        result = shopify.Order().find(limit=250, page_info=page_info)
-                    except ClientError as e:
-                        if hasattr(e, "response"):
-                            if e.response.code == 429 and e.response.msg == "Too Many Requests":
-                                time.sleep(5)
-                                result = shopify.Order().find(limit=250, page_info=page_info)
-                    except Exception as e:
-                        raise UserError(e)
-                    if result and order_type == "shipped":
-                        order_queues = order_data_queue_line_obj.create_order_data_queue_line(result, instance,
-                                                                                              created_by)
-                        order_queue_list += order_queues
-            if catch == page_info:
-                break
-        return sum_order_list, order_queue_list
+        slice_count = max(instance.shopify_order_fetch_threads, 1) * 2
+        slice_length = (to_date - from_date) / slice_count
+        if slice_length < timedelta(hours=1):
+            slice_count = 1
+            slice_length = to_date - from_date
+
+        time_slices = []
+        slice_from = from_date
+        for count in range(slice_count):
+            slice_to = to_date if count == slice_count - 1 else slice_from + slice_length
+            slice_end = slice_to if slice_to == to_date else slice_to - timedelta(seconds=1)
+            time_slices.append(self.convert_dates_by_timezone(instance, slice_from, slice_end))
+            slice_from = slice_to
+        return time_slices
+
+    def shopify_fetch_order_pages(self, instance, from_date, to_date, order_type="unshipped"):
+        """
+        Generator, which fetches the orders of the window in parallel time slices and yields the pages
+        as they arrive. Every slice follows its own Link cursor and all the connections share the leaky bucket
+        of the store, so the call limit is respected no matter how many slices run together.
+        Only the calling thread touches the environment, worker threads only talk to Shopify.
+        @param instance: Shopify Instance.
+        @param from_date: From date in UTC.
+        @param to_date: To date in UTC.
+        @param order_type: Fulfillment status of orders to import.
+        """
+        time_slices = self.prepare_order_import_time_slices(instance, from_date, to_date)
+        thread_count = min(max(instance.shopify_order_fetch_threads, 1), len(time_slices))
+        shop_url = instance.prepare_shopify_shop_url()
+        page_queue = queue.Queue(maxsize=thread_count * 2)
+        stop_event = threading.Event()
+
+        executor = ThreadPoolExecutor(max_workers=thread_count, thread_name_prefix="shopify_order_fetch")
+        try:
+            for api_from_date, api_to_date in time_slices:
+                executor.submit(self.fetch_order_slice_pages, shop_url, page_queue, stop_event,
+                                status="any", fulfillment_status=order_type, updated_at_min=api_from_date,
+                                updated_at_max=api_to_date)
+            running_slices = len(time_slices)
+            while running_slices:
+                page = page_queue.get()
+                if page is None:
+                    running_slices -= 1
+                elif isinstance(page, Exception):
+                    raise UserError(page)
+                else:
+                    yield page
+        finally:
+            stop_event.set()
+            executor.shutdown(wait=False)
+
+    def shopify_fetch_order_pages_by_bulk_operation(self, instance, from_date, to_date, order_type="unshipped"):
+        """
+        Generator, which fetches the orders of the window with one GraphQL bulk operation and yields them
+        250 at a time, as the result is downloaded. The orders are converted to the dictionaries of the REST API,
+        so they are imported like the orders of shopify_fetch_order_pages.
+        GraphQL does not give the fields of BULK_ORDER_REST_FIELDS, so they are read for every chunk with one
+        REST call.
+        @param instance: Shopify Instance.
+        @param from_date: From date in UTC.
+        @param to_date: To date in UTC.
+        @param order_type: Fulfillment status of orders to import.
+        """
+        query_filter = "updated_at:>='%s' AND updated_at:<='%s' AND fulfillment_status:%s" % (
+            from_date.strftime("%Y-%m-%dT%H:%M:%SZ"), to_date.strftime("%Y-%m-%dT%H:%M:%SZ"), order_type)
+        bulk_operation = shopify.BulkOperation.for_shop(instance.shopify_host)
+        try:
+            url = bulk_operation.run(ORDER_BULK_QUERY % {"filter": query_filter, "address": ADDRESS_BULK_FIELDS})
+        except Exception as error:
+            raise UserError(_("Bulk operation of orders failed for instance %s.\nError: %s") % (instance.name,
+                                                                                               str(error)))
+
+        for orders_chunk in split_every(250, bulk_operation.iter_objects(url)):
+            orders_chunk = list(orders_chunk)
+            order_ids = [str(shopify.BulkOperation.get_legacy_id(order.get("legacyResourceId")))
+                         for order, _children in orders_chunk]
+            rest_fields = {str(result.get("id")): result for result in shopify.Order.find_raw(
+                ids=",".join(order_ids), status="any", limit=len(order_ids),
+                fields=",".join(("id",) + BULK_ORDER_REST_FIELDS))}
+            yield [self.prepare_order_from_bulk_operation(order, children, rest_fields.get(order_id))
+                   for order_id, (order, children) in zip(order_ids, orders_chunk)]
+
+    def prepare_order_from_bulk_operation(self, order, children, rest_fields=None):
+        """
+        This method used to convert an order of a bulk operation into the dictionary of the REST API with the
+        fields used by the order import.
+        @param order: Order of the bulk operation.
+        @param children: Line items and shipping lines of the order by type name.
+        @param rest_fields: Fields of BULK_ORDER_REST_FIELDS of the order, read with the REST API.
+        """
+        rest_fields = rest_fields or {}
+        get_legacy_id = shopify.BulkOperation.get_legacy_id
+
+        line_items = []
+        for line in children.get("LineItem", []):
+            line_items.append({"id": get_legacy_id(line.get("id")),
+                               "name": line.get("name"),
+                               "title": line.get("title"),
+                               "sku": line.get("sku"),
+                               "quantity": line.get("quantity"),
+                               "taxable": line.get("taxable"),
+                               "price": self.get_bulk_operation_amount(line.get("originalUnitPriceSet")),
+                               "product_id": get_legacy_id((line.get("product") or {}).get("legacyResourceId")),
+                               "variant_id": get_legacy_id((line.get("variant") or {}).get("legacyResourceId")),
+                               "tax_lines": self.prepare_tax_lines_from_bulk_operation(line.get("taxLines")),
+                               "discount_allocations": self.prepare_discount_allocations_from_bulk_operation(
+                                   line.get("discountAllocations"))})
+
+        shipping_lines = []
+        for line in children.get("ShippingLine", []):
+            shipping_lines.append({"id": get_legacy_id(line.get("id")),
+                                   "title": line.get("title"),
+                                   "code": line.get("code"),
+                                   "source": line.get("source"),
+                                   "price": self.get_bulk_operation_amount(line.get("originalPriceSet")),
+                                   "tax_lines": self.prepare_tax_lines_from_bulk_operation(line.get("taxLines")),
+                                   "discount_allocations": self.prepare_discount_allocations_from_bulk_operation(
+                                       line.get("discountAllocations"))})
+
+        customer = order.get("customer")
+        if customer:
+            customer = {"id": get_legacy_id(customer.get("legacyResourceId")),
+                        "first_name": customer.get("firstName"),
+                        "last_name": customer.get("lastName"),
+                        "email": customer.get("email"),
+                        "phone": customer.get("phone"),
+                        "default_address": self.prepare_address_from_bulk_operation(customer.get("defaultAddress"))}
+
+        gateways = order.get("paymentGatewayNames") or []
+        return {"id": get_legacy_id(order.get("legacyResourceId")),
+                "name": order.get("name"),
+                "order_number": rest_fields.get("order_number"),
+                "checkout_id": rest_fields.get("checkout_id"),
+                "email": order.get("email"),
+                "phone": order.get("phone"),
+                "note": order.get("note"),
+                "created_at": order.get("createdAt"),
+                "updated_at": order.get("updatedAt"),
+                "cancelled_at": order.get("cancelledAt"),
+                "currency": order.get("currencyCode"),
+                "taxes_included": order.get("taxesIncluded"),
+                "source_name": order.get("sourceName"),
+                "financial_status": (order.get("displayFinancialStatus") or "").lower() or None,
+                "fulfillment_status": BULK_FULFILLMENT_STATUS.get(order.get("displayFulfillmentStatus")),
+                "gateway": gateways and gateways[0] or "",
+                "payment_gateway_names": gateways,
+                "tags": ", ".join(order.get("tags") or []),
+                "total_discounts": self.get_bulk_operation_amount(order.get("totalDiscountsSet")) or "0.00",
+                "tax_lines": self.prepare_tax_lines_from_bulk_operation(order.get("taxLines")),
+                "customer": customer,
+                "billing_address": self.prepare_address_from_bulk_operation(order.get("billingAddress")),
+                "shipping_address": self.prepare_address_from_bulk_operation(order.get("shippingAddress")),
+                "location_id": rest_fields.get("location_id"),
+                "fulfillments": [{"location_id": get_legacy_id((fulfillment.get("location") or {}).get(
+                    "legacyResourceId"))} for fulfillment in order.get("fulfillments") or []],
+                "line_items": line_items,
+                "shipping_lines": shipping_lines}
+
+    def get_bulk_operation_amount(self, price_set):
+        """
+        Gives the amount in the currency of the shop of a money bag of a bulk operation.
+        """
+        return ((price_set or {}).get("shopMoney") or {}).get("amount")
+
+    def prepare_tax_lines_from_bulk_operation(self, tax_lines):
+        """
+        Converts the tax lines of a bulk operation into the tax lines of the REST API.
+        """
+        return [{"title": tax_line.get("title"),
+                 "rate": tax_line.get("rate"),
+                 "price": self.get_bulk_operation_amount(tax_line.get("priceSet"))} for tax_line in tax_lines or []]
+
+    def prepare_discount_allocations_from_bulk_operation(self, discount_allocations):
+        """
+        Converts the discount allocations of a bulk operation into the discount allocations of the REST API.
+        """
+        return [{"amount": self.get_bulk_operation_amount(allocation.get("allocatedAmountSet"))}
+                for allocation in discount_allocations or []]
+
+    def prepare_address_from_bulk_operation(self, address):
+        """
+        Converts a mailing address of a bulk operation into the address of the REST API.
+        """
+        if not address:
+            return None
+        return {"first_name": address.get("firstName"),
+                "last_name": address.get("lastName"),
+                "name": address.get("name"),
+                "company": address.get("company"),
+                "address1": address.get("address1"),
+                "address2": address.get("address2"),
+                "city": address.get("city"),
+                "province": address.get("province"),
+                "province_code": address.get("provinceCode"),
+                "country": address.get("country"),
+                "country_code": address.get("countryCodeV2"),
+                "zip": address.get("zip"),
+                "phone": address.get("phone")}
+
+    def fetch_order_slice_pages(self, shop_url, page_queue, stop_event, **params):
+        """
+        Runs in a worker thread. Fetches all pages of one time slice and puts them in the page queue,
+        followed by None when the slice is done. Errors are put in the queue for the calling thread.
+        @param shop_url: Admin API url of the store, as the connection is thread local.
+        @param page_queue: Bounded queue consumed by shopify_fetch_order_pages.
+        @param stop_event: Set by the consumer when it does not need more pages.
+        """
+
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    page_queue.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            shopify.ShopifyResource.set_site(shop_url)
+            for page in shopify.PaginatedIterator(shopify.Order.find_raw(limit=250, **params)):
+                if not page or not put(page):
+                    break
+        except Exception as error:
+            _logger.error("Fetching orders of slice %s failed: %s" % (params.get("updated_at_min"), error))
+            put(error)
+        finally:
+            put(None)
 
     def import_order_process_by_remote_ids(self, instance, order_ids):
         """
@@ -251,13 +508,14 @@ class ShopifyOrderDataQueueEpt(models.Model):
             if len(order_ids.split(',')) <= 50:
                 # order_ids_list is a list of all order ids which response did not given by shopify.
                 order_ids_list = list(set(re.findall(re.compile(r"(\d+)"), order_ids)))
-                results = shopify.Order().find(ids=','.join(order_ids_list), status='any')
+                results = shopify.Order.find_raw(ids=','.join(order_ids_list), status='any')
                 if results:
                     _logger.info('%s Shopify order(s) imported from instance : %s' % (
                         len(results), instance.name))
                     order_ids_list = [order_id.strip() for order_id in order_ids_list]
                     # Below process to identify which id response did not give by Shopify.
-                    [order_ids_list.remove(str(result.id)) for result in results if str(result.id) in order_ids_list]
+                    [order_ids_list.remove(str(result.get("id"))) for result in results
+                     if str(result.get("id")) in order_ids_list]
             else:
                 raise UserError(_('Please enter the Order ids 50 or less'))
             if results:
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import json
 import logging
 from odoo import models, fields
 
@@ -32,83 +31,148 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
                                                          "shopify_order_data_queue_line_id",
                                                          help="Log lines created against which line.")
     name = fields.Char(help="Order Name")
+    order_data_preview = fields.Text(string="Order Data", compute="_compute_order_data_preview",
+                                     help="Data of the order, decoded only when the queue line is shown.")
 
-    def create_order_queue_line(self, order_dict, instance, order_data, customer_name, customer_email, order_queue_id):
-        """
-        Creates order data queue line from order data.
-        @author: Maulik Barad on Date 10-Sep-2020.
-        """
-        order_queue_line_vals = {"shopify_order_id": order_dict.get("id", False),
-                                 "shopify_instance_id": instance.id,
-                                 "order_data": order_data,
-                                 "name": order_dict.get("name", ""),
-                                 "customer_name": customer_name,
-                                 "customer_email": customer_email,
-                                 "shopify_order_data_queue_id": order_queue_id.id}
-        return self.create(order_queue_line_vals)
+    def _compute_order_data_preview(self):
+        data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
+        for queue_line in self:
+            queue_line.order_data_preview = data_queue_mixin_obj.get_shopify_queue_data_preview(
+                queue_line.order_data)
 
     def create_order_data_queue_line(self, orders_data, instance, created_by="import"):
         """
         This method used to create order data queue lines. It creates new queue after 50 order queue
         lines.
+        Queues are resolved once for the whole batch, all queue lines are written with one multi row
+        insert and one notification is sent for all the created queues.
         @param : orders_data, instance
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 06/11/2019.
         Task Id : 157350
         """
         shopify_order_queue_obj = self.env["shopify.order.data.queue.ept"]
-        bus_bus_obj = self.env["bus.bus"]
 
-        count = 0
-        need_to_create_queue = True
         orders_data.reverse()
-        order_queue_list = []
+        if not orders_data:
+            return []
+        if created_by != "webhook":
+            orders_data = [order if isinstance(order, dict) else order.to_dict() for order in orders_data]
 
-        for order in orders_data:
-            if created_by == "webhook":
-                order_queue = shopify_order_queue_obj.search([("created_by", "=", created_by), ("state", "=", "draft"),
-                                                              ("shopify_instance_id", "=", instance.id)])
-                if order_queue:
-                    message = "Order %s added into Order Queue %s." % (order.get("name"), order_queue.name)
-                    need_to_create_queue = False
-                    _logger.info(message)
+        order_queues = shopify_order_queue_obj
+        queue_batches = []
+        if created_by == "webhook":
+            order_queue = shopify_order_queue_obj.search([("created_by", "=", created_by), ("state", "=", "draft"),
+                                                          ("shopify_instance_id", "=", instance.id)], limit=1)
+            if order_queue:
+                orders_data = self.coalesce_webhook_order_queue_lines(order_queue, orders_data)
+                _logger.info("%s Order(s) added into Order Queue %s." % (len(orders_data), order_queue.name))
             else:
-                order = order.to_dict()
-
-            if need_to_create_queue:
+                order_queue = order_queues = self.shopify_create_order_queue(instance, created_by)
+            queue_batches.append((order_queue, orders_data))
+        else:
+            for offset in range(0, len(orders_data), 50):
                 order_queue = self.shopify_create_order_queue(instance, created_by)
-                order_queue_list.append(order_queue.id)
-                message = "Order Queue %s created." % order_queue.name
-                bus_bus_obj.sendone((self._cr.dbname, "res.partner", self.env.user.partner_id.id),
-                                    {"type": "simple_notification", "title": "Shopify Connector",
-                                     "message": message, "sticky": False, "warning": True})
-                need_to_create_queue = False
-                _logger.info(message)
-
-            data = json.dumps(order)
-            try:
-                customer_data = order.get("customer")
-                customer_name = "%s %s" % (customer_data.get("first_name"),
-                                           customer_data.get("last_name"))
-                customer_email = customer_data.get("email")
-                if customer_name == "None None":
-                    customer_name = customer_data.get("default_address").get("name")
-            except:
-                customer_name = False
-                customer_email = False
-
-            self.create_order_queue_line(order, instance, data, customer_name, customer_email, order_queue)
-            if created_by == "webhook" and len(order_queue.order_data_queue_line_ids) >= 50:
-                order_queue.order_data_queue_line_ids.process_import_order_queue_data(update_order=True)
-
-            count += 1
-            if count == 50:
-                count = 0
-                need_to_create_queue = True
-        if not order_queue.order_data_queue_line_ids:
-            order_queue.unlink()
-            order_queue_list.remove(order_queue.id)
-
-        return order_queue_list
+                order_queues += order_queue
+                queue_batches.append((order_queue, orders_data[offset:offset + 50]))
+
+        queue_line_rows = []
+        for order_queue, orders in queue_batches:
+            queue_line_rows += [self.prepare_order_queue_line_row(order, instance, order_queue) for order in orders]
+        self.insert_order_queue_lines(queue_line_rows, order_queues | order_queue)
+
+        if order_queues:
+            self.notify_order_queues_created(order_queues)
+
+        if created_by == "webhook" and len(order_queue.order_data_queue_line_ids) >= 50 and \
+                self.claim_order_queue(order_queue.ids):
+            order_queue.order_data_queue_line_ids.process_import_order_queue_data(update_order=True)
+
+        return order_queues.ids
+
+    def coalesce_webhook_order_queue_lines(self, order_queue, orders_data):
+        """
+        Updates the draft lines of the webhook queue, which are already pending for the orders, with the newest
+        data of the orders instead of adding more lines, so every order is processed once.
+        @param order_queue: Webhook queue of the instance.
+        @param orders_data: List of dictionaries of the orders.
+        @return: Orders, which are not pending in the queue.
+        """
+        data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
+
+        pending_lines = {queue_line.shopify_order_id: queue_line for queue_line in
+                         order_queue.order_data_queue_line_ids if queue_line.state == "draft"}
+        new_orders_data = []
+        for order in orders_data:
+            queue_line = pending_lines.get(str(order.get("id")))
+            if not queue_line:
+                new_orders_data.append(order)
+                continue
+            if data_queue_mixin_obj.is_newer_shopify_data(
+                    order, data_queue_mixin_obj.decode_shopify_queue_data(queue_line.order_data)):
+                queue_line.order_data = data_queue_mixin_obj.encode_shopify_queue_data(order)
+            _logger.info("Order %s is already pending in Order Queue %s." % (order.get("name"), order_queue.name))
+        return new_orders_data
+
+    def prepare_order_queue_line_row(self, order, instance, order_queue):
+        """
+        Prepares the values of one queue line in the column order of insert_order_queue_lines.
+        @param order: Dictionary of the order.
+        @param instance: Shopify Instance.
+        @param order_queue: Queue in which the line will be added.
+        """
+        try:
+            customer_data = order.get("customer")
+            customer_name = "%s %s" % (customer_data.get("first_name"),
+                                       customer_data.get("last_name"))
+            customer_email = customer_data.get("email")
+            if customer_name == "None None":
+                customer_name = customer_data.get("default_address").get("name")
+        except:
+            customer_name = False
+            customer_email = False
+
+        order_data = self.env["data.queue.mixin.ept"].encode_shopify_queue_data(order)
+        return (order_queue.id, instance.id, order.get("id") and str(order.get("id")) or None,
+                order.get("name", ""), order_data, customer_name or None, customer_email or None,
+                self.env.uid, self.env.uid)
+
+    def insert_order_queue_lines(self, queue_line_rows, order_queues):
+        """
+        Writes the queue lines with one multi row insert and recomputes the state of their queues.
+        The ORM would run one insert per line.
+        @param queue_line_rows: Rows prepared by prepare_order_queue_line_row.
+        @param order_queues: Queues of the lines.
+        @return: Ids of created queue lines.
+        """
+        if not queue_line_rows:
+            return []
+        values = ",".join(self._cr.mogrify("""(%s, %s, 'draft', %s, %s, %s, %s, %s, %s, (now() at time zone 'UTC'),
+                                             %s, (now() at time zone 'UTC'))""", row).decode()
+                          for row in queue_line_rows)
+        self._cr.execute("""insert into shopify_order_data_queue_line_ept
+                         (shopify_order_data_queue_id, shopify_instance_id, state, shopify_order_id, name, order_data,
+                         customer_name, customer_email, create_uid, create_date, write_uid, write_date)
+                         values %s returning id""" % values)
+        queue_line_ids = [row[0] for row in self._cr.fetchall()]
+
+        order_queues.invalidate_cache(["order_data_queue_line_ids"])
+        order_queues.modified(["order_data_queue_line_ids"])
+        order_queues.flush()
+        return queue_line_ids
+
+    def notify_order_queues_created(self, order_queues):
+        """
+        Sends one notification per created queue, with a single call to the bus.
+        @param order_queues: Created queues.
+        """
+        channel = (self._cr.dbname, "res.partner", self.env.user.partner_id.id)
+        notifications = []
+        for order_queue in order_queues:
+            message = "Order Queue %s created." % order_queue.name
+            _logger.info(message)
+            notifications.append([channel, {"type": "simple_notification", "title": "Shopify Connector",
+                                            "message": message, "sticky": False, "warning": True}])
+        self.env["bus.bus"].sendmany(notifications)
 
     def shopify_create_order_queue(self, instance, created_by="import"):
         """
@@ -128,54 +192,59 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         """
         This method used to process synced shopify order data in batch of 50 queue lines.
         It will be called from auto queue process cron.
+        Every run claims the queues one by one, so several order queue crons can process the queues
+        concurrently. Each run stops after 10 queues to give the other workers their share, and handles a queue
+        once, so a queue left with draft lines is not counted as crashed again in the same run.
         @param : self
         @author: Haresh Mori @Emipro Technologies Pvt.Ltd on date 07/10/2019.
         Task Id : 157350
         """
         ir_model_obj = self.env["ir.model"]
-        shopify_order_queue_obj = self.env["shopify.order.data.queue.ept"]
         common_log_book_obj = self.env["common.log.book.ept"]
-        order_queue_ids = []
-
-        self.env.cr.execute(
-            """update shopify_order_data_queue_ept set is_process_queue = False where is_process_queue = True""")
-        self._cr.commit()
-
-        query = """select queue.id
-                from shopify_order_data_queue_line_ept as queue_line
-                inner join shopify_order_data_queue_ept as queue on queue_line.shopify_order_data_queue_id = queue.id
-                where queue_line.state='draft' and queue.is_action_require = 'False'
-                ORDER BY queue_line.create_date ASC limit 100"""
-        self._cr.execute(query)
-        order_queue_list = self._cr.fetchall()
-        if not order_queue_list:
-            return True
-
-        for result in order_queue_list:
-            if result[0] not in order_queue_ids:
-                order_queue_ids.append(result[0])
-
-        queues = shopify_order_queue_obj.browse(order_queue_ids)
-        for queue in queues:
+
+        handled_queue_ids = []
+        for _ in range(10):
+            queue = self.claim_order_queue(exclude_queue_ids=handled_queue_ids)
+            if not queue:
+                break
+            handled_queue_ids.append(queue.id)
             order_data_queue_line_ids = queue.order_data_queue_line_ids.filtered(lambda x: x.state == "draft")
 
             # For counting the queue crashes and creating schedule activity for the queue.
             queue.queue_process_count += 1
             if queue.queue_process_count > 3:
-                queue.is_action_require = True
+                queue.write({"is_action_require": True, "is_process_queue": False, "process_claimed_at": False})
                 note = "<p>Need to process this order queue manually.There are 3 attempts been made by " \
                        "automated action to process this queue,<br/>- Ignore, if this queue is already processed.</p>"
                 queue.message_post(body=note)
                 if queue.shopify_instance_id.is_shopify_create_schedule:
                     model_id = ir_model_obj.search([("model", "=", "shopify.order.data.queue.ept")]).id
                     common_log_book_obj.create_crash_queue_schedule_activity(queue, model_id, note)
+                self._cr.commit()
                 continue
 
             self._cr.commit()
             order_data_queue_line_ids.process_import_order_queue_data()
+            self._cr.commit()
 
         return True
 
+    def claim_order_queue(self, queue_ids=None, line_states=("draft",), include_action_required=False,
+                          exclude_queue_ids=None):
+        """
+        This method claims the oldest order queue having pending lines for the current worker.
+        @param queue_ids: Claim one of these queues only.
+        @param line_states: States of the queue lines to be processed.
+        @param include_action_required: Claim the queues marked as action required too.
+        @param exclude_queue_ids: Do not claim these queues.
+        @return: Claimed order queue or empty recordset.
+        """
+        return self.env["data.queue.mixin.ept"].claim_shopify_data_queue("shopify.order.data.queue.ept",
+                                                                         "shopify.order.data.queue.line.ept",
+                                                                         "shopify_order_data_queue_id",
+                                                                         queue_ids, line_states,
+                                                                         include_action_required, exclude_queue_ids)
+
     def process_import_order_queue_data(self, update_order=False):
         """
         -This method processes order queue lines.
@@ -191,6 +260,7 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
             instance = queue_id.shopify_instance_id
             if not instance.active:
                 _logger.info("Instance '{}' is not active.".format(instance.name))
+                queue_id.write({"is_process_queue": False, "process_claimed_at": False})
                 return True
 
             if queue_id.shopify_order_common_log_book_id:
@@ -209,7 +279,7 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
             else:
                 sale_order_obj.import_shopify_orders(self, log_book_id)
 
-            queue_id.is_process_queue = False
+            queue_id.write({"is_process_queue": False, "process_claimed_at": False})
             queue_id.shopify_order_common_log_book_id = log_book_id
             if log_book_id and not log_book_id.log_lines:
                 log_book_id.unlink()
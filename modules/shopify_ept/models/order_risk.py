@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
+from concurrent.futures import ThreadPoolExecutor
+
 from odoo import models, fields
+from .. import shopify
 
 
 class ShopifyOrderRisk(models.Model):
@@ -43,3 +46,43 @@ class ShopifyOrderRisk(models.Model):
                          'odoo_order_id': order.id
                          })
         return flag
+
+    def prefetch_shopify_order_risks(self, instance, shopify_order_ids):
+        """
+        Starts fetching the risks of the orders in worker threads, so the risks are fetched while the orders
+        are validated and created, instead of one serial request per order. All connections share the leaky
+        bucket of the store. The threads only talk to Shopify and stop when all requests are done.
+        @param instance: Shopify Instance.
+        @param shopify_order_ids: Ids of the orders in Shopify.
+        @return: Dictionary of order id and future of its risks.
+        """
+        if not shopify_order_ids:
+            return {}
+        shop_url = instance.prepare_shopify_shop_url()
+        executor = ThreadPoolExecutor(max_workers=max(instance.shopify_order_fetch_threads, 1),
+                                      thread_name_prefix="shopify_order_risk")
+        risk_futures = {str(order_id): executor.submit(self.fetch_shopify_order_risks, shop_url, order_id)
+                        for order_id in shopify_order_ids}
+        executor.shutdown(wait=False)
+        return risk_futures
+
+    def fetch_shopify_order_risks(self, shop_url, shopify_order_id):
+        """
+        Runs in a worker thread and fetches the risks of one order.
+        @param shop_url: Admin API url of the store, as the connection is thread local.
+        @param shopify_order_id: Id of the order in Shopify.
+        """
+        shopify.ShopifyResource.set_site(shop_url)
+        return shopify.OrderRisk().find(order_id=shopify_order_id)
+
+    def get_shopify_order_risks(self, risk_futures, shopify_order_id):
+        """
+        Gives the risks of an order, waiting for the prefetch if it is still running.
+        Orders which were not prefetched are fetched directly.
+        @param risk_futures: Dictionary given by prefetch_shopify_order_risks.
+        @param shopify_order_id: Id of the order in Shopify.
+        """
+        risk_future = risk_futures.pop(str(shopify_order_id), None)
+        if risk_future:
+            return risk_future.result()
+        return shopify.OrderRisk().find(order_id=shopify_order_id)
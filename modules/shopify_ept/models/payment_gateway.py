@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 import json
-import time
 
 from datetime import datetime, timedelta
 from odoo import models, fields
@@ -33,14 +32,8 @@ class ShopifyPaymentGateway(models.Model):
             results = shopify.Order().find(status="any", updated_at_min=from_date,
                                            updated_at_max=to_date, fields=['gateway'], limit=250)
         except ClientError as error:
-            if hasattr(error, "response"):
-                if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(5)
-                    results = shopify.Order().find(status="any", updated_at_min=from_date,
-                                                   updated_at_max=to_date, fields=['gateway'], limit=250)
-                else:
-                    message = str(error.code) + "\n" + json.loads(error.response.body.decode()).get("errors")
-                    raise UserError(message)
+            message = str(error.code) + "\n" + json.loads(error.response.body.decode()).get("errors")
+            raise UserError(message)
         except Exception as error:
             raise UserError(error)
 
@@ -67,11 +60,12 @@ class ShopifyPaymentGateway(models.Model):
         return shopify_payment_gateway
 
     def shopify_search_create_gateway_workflow(self, instance, order_data_queue_line,
-                                               order_response, log_book_id):
+                                               order_response, log_book_id, order_lookup=None):
         """
         This method used to search or create a payment gateway and workflow in odoo when importing orders from
         Shopify to Odoo.
         @param : self, instance, order_data_queue_line,order_response
+        @param order_lookup: Records prefetched for the batch by sale.order's prepare_shopify_order_lookup.
         @return: gateway, workflow
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 12/11/2019.
         Task Id : 157350
@@ -82,12 +76,20 @@ class ShopifyPaymentGateway(models.Model):
         auto_workflow_id = False
 
         gateway = order_response.get('gateway') or "no_payment_gateway"
-        shopify_payment_gateway = self.search_or_create_payment_gateway(instance, gateway)
+        if order_lookup is not None:
+            shopify_payment_gateway = order_lookup["gateways"].get(gateway)
+            if not shopify_payment_gateway:
+                shopify_payment_gateway = order_lookup["gateways"][gateway] = \
+                    self.search_or_create_payment_gateway(instance, gateway)
+            workflow_config = order_lookup["workflows"].get((shopify_payment_gateway.id,
+                                                             order_response.get('financial_status')))
+        else:
+            shopify_payment_gateway = self.search_or_create_payment_gateway(instance, gateway)
 
-        workflow_config = self.env['sale.auto.workflow.configuration.ept'].search(
-            [('shopify_instance_id', '=', instance.id),
-             ('payment_gateway_id', '=', shopify_payment_gateway.id),
-             ('financial_status', '=', order_response.get('financial_status'))])
+            workflow_config = self.env['sale.auto.workflow.configuration.ept'].search(
+                [('shopify_instance_id', '=', instance.id),
+                 ('payment_gateway_id', '=', shopify_payment_gateway.id),
+                 ('financial_status', '=', order_response.get('financial_status'))])
         if not workflow_config:
             message = "- Automatic order process workflow configuration not found for this order " \
                       "%s. \n - System tries to find the workflow based on combination of Payment " \
@@ -1,18 +1,41 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import time
-import json
 import logging
 import re
 from datetime import datetime, timedelta
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import split_every
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
 
 _logger = logging.getLogger("Shopify")
 
+PRODUCT_BULK_QUERY = """
+{
+  products%s {
+    edges {
+      node {
+        id legacyResourceId title descriptionHtml vendor productType handle tags status
+        createdAt updatedAt publishedAt
+        options { id name position values }
+        images { edges { node { id url altText } } }
+        variants {
+          edges {
+            node {
+              id legacyResourceId title sku barcode price compareAtPrice position taxable inventoryPolicy
+              createdAt updatedAt
+              selectedOptions { name value }
+              image { id }
+              inventoryItem { legacyResourceId tracked }
+            }
+          }
+        }
+      }
+    }
+  }
+}"""
+
 
 class ShopifyProductDataQueue(models.Model):
     _name = "shopify.product.data.queue.ept"
@@ -44,6 +67,8 @@ class ShopifyProductDataQueue(models.Model):
                                   help="Identify the process that generated a queue.",
                                   default="import")
     is_process_queue = fields.Boolean("Is Processing Queue", default=False)
+    process_claimed_at = fields.Datetime(copy=False, readonly=True,
+                                         help="Time when a queue worker claimed this queue for processing.")
     running_status = fields.Char(default="Running...")
     is_action_require = fields.Boolean(default=False)
     queue_process_count = fields.Integer(string="Queue Process Times",
@@ -127,9 +152,11 @@ class ShopifyProductDataQueue(models.Model):
         self._cr.commit()
         return product_queue_list
 
-    def shopify_create_product_data_queue(self, instance, skip_existing_product=False, template_ids=""):
+    def shopify_create_product_data_queue(self, instance, skip_existing_product=False, template_ids="",
+                                          use_bulk_operation=False):
         """
         This method used to create a product data queue while syncing product from Shopify to Odoo.
+        @param use_bulk_operation: True to fetch the products with one GraphQL bulk operation instead of paging them.
         @author: Maulik Barad on Date 28-Aug-2020.
         @return: List of Product queues.
         """
@@ -142,26 +169,28 @@ class ShopifyProductDataQueue(models.Model):
                 # The template_ids is a list of all template ids which response did not given by
                 # shopify.
                 template_ids = list(set(re.findall(re.compile(r"(\d+)"), template_ids)))
-                results = shopify.Product().find(ids=",".join(template_ids))
+                results = shopify.Product.find_raw(ids=",".join(template_ids))
                 if results:
                     _logger.info(
                         "Length of Shopify Products %s import from instance : %s" % (len(results), instance.name))
                     template_ids = [template_id.strip() for template_id in template_ids]
                     # Below process to identify which id response did not give by Shopify.
-                    [template_ids.remove(str(result.id)) for result in results if str(result.id) in template_ids]
+                    [template_ids.remove(str(result.get("id"))) for result in results
+                     if str(result.get("id")) in template_ids]
                     product_queue_list += self.create_product_queues(instance, results, False, template_ids)
             else:
                 raise UserError(_("Please enter the product template ids 100 or less"))
+        elif use_bulk_operation:
+            results = product_queue_list = self.shopify_import_products_by_bulk_operation(instance,
+                                                                                         skip_existing_product)
         else:
             if not instance.shopify_last_date_product_import:
-                results = shopify.Product().find(limit=250)
+                results = shopify.Product.find_raw(limit=250)
             else:
-                results = shopify.Product().find(updated_at_min=instance.shopify_last_date_product_import, limit=250)
-
-            product_queue_list += self.create_product_queues(instance, results, skip_existing_product)
+                results = shopify.Product.find_raw(updated_at_min=instance.shopify_last_date_product_import,
+                                                   limit=250)
 
-            if len(results) >= 250:
-                product_queue_list += self.shopify_list_all_products(instance, results, skip_existing_product)
+            product_queue_list += self.shopify_list_all_products(instance, results, skip_existing_product)
             if results:
                 instance.shopify_last_date_product_import = datetime.now()
         if not results:
@@ -171,36 +200,130 @@ class ShopifyProductDataQueue(models.Model):
         return product_queue_list
 
     def shopify_list_all_products(self, instance, result, skip_existing_product):
-        """This method used to call the page wise data of product to import from Shopify to Odoo.
+        """This method used to create the product queues page wise, starting from the given page.
+            The next page is fetched from Shopify while the queues of the current page are created.
             @param : self,result
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 14/10/2019.
             Modify on date 27/12/2019 Taken pagination changes.
         """
         product_queue_list = []
-        catch = ""
-        while result:
-            page_info = ""
-            link = shopify.ShopifyResource.connection.response.headers.get("Link")
-            if not link or not isinstance(link, str):
-                return product_queue_list
-            for page_link in link.split(","):
-                if page_link.find("next") > 0:
-                    page_info = page_link.split(";")[0].strip("<>").split("page_info=")[1]
-                    try:
-                        result = shopify.Product().find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(5)
-                                result = shopify.Product().find(page_info=page_info, limit=250)
-                    except Exception as error:
-                        raise UserError(error)
-                    if result:
-                        product_queue_list += self.create_product_queues(instance, result, skip_existing_product)
-            if catch == page_info:
-                break
+        try:
+            for page in shopify.PaginatedIterator(result, prefetch=True):
+                if page:
+                    product_queue_list += self.create_product_queues(instance, page, skip_existing_product)
+        except UserError:
+            raise
+        except Exception as error:
+            raise UserError(error)
         return product_queue_list
 
+    def shopify_import_products_by_bulk_operation(self, instance, skip_existing_product):
+        """
+        This method used to create the product queues from the result of a GraphQL bulk operation.
+        The result is downloaded as a stream and the queues are created and committed 1000 products at a time,
+        so a full catalog is imported with few calls and the memory does not grow with the size of the store.
+        @param instance: Shopify Instance.
+        @param skip_existing_product: True to skip the products already imported.
+        @return: List of Product queues.
+        """
+        import_start = datetime.now()
+        query_filter = ""
+        if instance.shopify_last_date_product_import:
+            query_filter = '(query: "updated_at:>=\'%s\'")' % instance.shopify_last_date_product_import.strftime(
+                "%Y-%m-%dT%H:%M:%SZ")
+
+        bulk_operation = shopify.BulkOperation.for_shop(instance.shopify_host)
+        try:
+            url = bulk_operation.run(PRODUCT_BULK_QUERY % query_filter)
+        except Exception as error:
+            raise UserError(_("Bulk operation of products failed for instance %s.\nError: %s") % (instance.name,
+                                                                                                 str(error)))
+
+        product_queue_list = []
+        products = (self.prepare_product_from_bulk_operation(product, children)
+                    for product, children in bulk_operation.iter_objects(url))
+        for products_chunk in split_every(1000, products):
+            product_queue_list += self.create_product_queues(instance, products_chunk, skip_existing_product)
+        _logger.info("Created %s Product Queues from bulk operation %s." % (len(product_queue_list),
+                                                                           bulk_operation.operation_id))
+        if product_queue_list:
+            instance.shopify_last_date_product_import = import_start
+        return product_queue_list
+
+    def prepare_product_from_bulk_operation(self, product, children):
+        """
+        This method used to convert a product of a bulk operation into the dictionary of the REST API, which is
+        stored in the queue lines.
+        The published scope is not available in GraphQL, so it is left out and the scope of the existing template
+        is kept by the import.
+        @param product: Product of the bulk operation.
+        @param children: Variants and images of the product by type name.
+        """
+        get_legacy_id = shopify.BulkOperation.get_legacy_id
+        product_id = get_legacy_id(product.get("id"))
+        options = sorted(product.get("options") or [], key=lambda option: option.get("position") or 0)
+        option_names = [option.get("name") for option in options]
+
+        variants = []
+        image_variants = {}
+        for variant in children.get("ProductVariant", []):
+            variant_id = get_legacy_id(variant.get("id"))
+            inventory_item = variant.get("inventoryItem") or {}
+            selected_options = {option.get("name"): option.get("value")
+                                for option in variant.get("selectedOptions") or []}
+            image_id = get_legacy_id((variant.get("image") or {}).get("id"))
+            variant_data = {"id": variant_id,
+                            "product_id": product_id,
+                            "title": variant.get("title"),
+                            "sku": variant.get("sku") or "",
+                            "barcode": variant.get("barcode"),
+                            "price": variant.get("price"),
+                            "compare_at_price": variant.get("compareAtPrice"),
+                            "position": variant.get("position"),
+                            "taxable": variant.get("taxable"),
+                            "inventory_policy": (variant.get("inventoryPolicy") or "").lower(),
+                            "inventory_management": "shopify" if inventory_item.get("tracked") else None,
+                            "inventory_item_id": get_legacy_id(inventory_item.get("legacyResourceId")),
+                            "image_id": image_id,
+                            "created_at": variant.get("createdAt"),
+                            "updated_at": variant.get("updatedAt")}
+            for position in range(1, 4):
+                variant_data["option%s" % position] = selected_options.get(option_names[position - 1]) \
+                    if position <= len(option_names) else None
+            if image_id:
+                image_variants.setdefault(image_id, []).append(variant_id)
+            variants.append(variant_data)
+
+        images = []
+        for position, image in enumerate(children.get("ProductImage", []), 1):
+            image_id = get_legacy_id(image.get("id"))
+            images.append({"id": image_id,
+                           "product_id": product_id,
+                           "position": position,
+                           "alt": image.get("altText"),
+                           "src": image.get("url"),
+                           "variant_ids": image_variants.get(image_id, [])})
+
+        return {"id": product_id,
+                "title": product.get("title"),
+                "body_html": product.get("descriptionHtml"),
+                "vendor": product.get("vendor"),
+                "product_type": product.get("productType"),
+                "handle": product.get("handle"),
+                "tags": ", ".join(product.get("tags") or []),
+                "status": (product.get("status") or "").lower(),
+                "created_at": product.get("createdAt"),
+                "updated_at": product.get("updatedAt"),
+                "published_at": product.get("publishedAt"),
+                "options": [{"id": get_legacy_id(option.get("id")),
+                             "product_id": product_id,
+                             "name": option.get("name"),
+                             "position": option.get("position"),
+                             "values": option.get("values")} for option in options],
+                "variants": variants,
+                "images": images,
+                "image": images and images[0] or None}
+
     def shopify_create_product_queue(self, instance, created_by="import", skip_existing_product=False):
         """
         This method used to create a product queue as per the split requirement of the
@@ -225,12 +348,13 @@ class ShopifyProductDataQueue(models.Model):
         @author: Maulik Barad on Date 01-Sep-2020.
         """
         product_data_queue_line_obj = self.env["shopify.product.data.queue.line.ept"]
+        data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
         product_queue_line_vals = {}
 
         # No need to convert the response into dictionary, when response is coming from webhook.
         if not isinstance(result, dict):
             result = result.to_dict()
-        data = json.dumps(result)
+        data = data_queue_mixin_obj.encode_shopify_queue_data(result)
         product_queue_line_vals.update({"product_data_id": result.get("id"),
                                         "shopify_instance_id": instance and instance.id or False,
                                         "name": result.get("title"),
@@ -299,7 +423,19 @@ class ShopifyProductDataQueue(models.Model):
             message = "Product Queue %s created." % product_data_queue.name
         _logger.info(message)
 
-        self.shopify_create_product_data_queue_line(product_data, instance, product_data_queue)
+        pending_line = product_data_queue.product_data_queue_lines.filtered(
+            lambda queue_line: queue_line.state == "draft" and queue_line.product_data_id == str(
+                product_data.get("id")))[:1]
+        if pending_line:
+            # Only the newest data of a product pending in the queue is kept.
+            data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
+            if data_queue_mixin_obj.is_newer_shopify_data(
+                    product_data, data_queue_mixin_obj.decode_shopify_queue_data(pending_line.synced_product_data)):
+                pending_line.write({"name": product_data.get("title"),
+                                    "synced_product_data": data_queue_mixin_obj.encode_shopify_queue_data(
+                                        product_data)})
+        else:
+            self.shopify_create_product_data_queue_line(product_data, instance, product_data_queue)
 
         if len(self.product_data_queue_lines) == 50:
             product_data_queue.product_data_queue_lines.process_product_queue_line_data()
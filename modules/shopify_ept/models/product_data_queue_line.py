@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from odoo import models, fields
+from odoo import models, fields, api
 from .. import shopify
 
 _logger = logging.getLogger("Shopify")
 
+# Seconds for which the product queue cron claims queues, when not set in the system parameters.
+PRODUCT_QUEUE_TIME_BUDGET = 90
+
 
 class ShopifyProductDataQueueLineEpt(models.Model):
     _name = "shopify.product.data.queue.line.ept"
@@ -26,48 +30,145 @@ class ShopifyProductDataQueueLineEpt(models.Model):
                                            "shopify_product_data_queue_line_id",
                                            help="Log lines created against which line.")
     name = fields.Char(string="Product", help="It contain the name of product")
+    synced_product_data_preview = fields.Text(string="Product Data", compute="_compute_synced_product_data_preview",
+                                              help="Data of the product, decoded only when the queue line is shown.")
+
+    def _compute_synced_product_data_preview(self):
+        data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
+        for queue_line in self:
+            queue_line.synced_product_data_preview = data_queue_mixin_obj.get_shopify_queue_data_preview(
+                queue_line.synced_product_data)
 
-    def auto_import_product_queue_line_data(self):
+    def auto_import_product_queue_line_data(self, time_budget=None):
         """
         This method used to process synced shopify product data in batch of 100 queue lines.
+        Every run claims and processes product queues until its time budget is spent, so several product queue
+        crons can process the queues concurrently. While a queue is processed, the data of the queue expected to be
+        claimed next is decoded and its existing templates and variants are searched in a background thread. That
+        queue is claimed only once the current one is committed, and the prefetched data is dropped when another
+        queue gets claimed.
+        @param time_budget: Seconds for which queues are claimed, taken from the system parameter
+        shopify_ept.product_queue_time_budget when not given.
         @author: Maulik Barad on Date 31-Aug-2020.
         """
-        product_data_queue_obj = self.env["shopify.product.data.queue.ept"]
-        ir_model_obj = self.env["ir.model"]
-        common_log_book_obj = self.env["common.log.book.ept"]
+        if time_budget is None:
+            time_budget = int(self.env["ir.config_parameter"].sudo().get_param(
+                "shopify_ept.product_queue_time_budget", PRODUCT_QUEUE_TIME_BUDGET))
+        deadline = time.time() + time_budget
+        handled_queue_ids = []
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="shopify_product_prefetch") as executor:
+            queue = self.claim_product_queue()
+            prefetch = queue and executor.submit(self.prefetch_product_queue_data, queue.id)
+            while queue:
+                handled_queue_ids.append(queue.id)
+                next_queue = self.claim_product_queue(exclude_queue_ids=handled_queue_ids, claim=False) \
+                    if time.time() < deadline else False
+                next_prefetch = next_queue and executor.submit(self.prefetch_product_queue_data, next_queue.id)
+
+                try:
+                    prefetched_data = prefetch.result()
+                except Exception as error:
+                    _logger.info("Data of product queue %s could not be prefetched: %s" % (queue.name, error))
+                    prefetched_data = None
+                product_data_queue_line_ids = queue.product_data_queue_lines.filtered(lambda x: x.state == "draft")
+                if not product_data_queue_line_ids:
+                    queue.write({"is_process_queue": False, "process_claimed_at": False})
+                elif self.start_product_queue_for_cron(queue):
+                    product_data_queue_line_ids.process_product_queue_line_data(prefetched_data)
+                self._cr.commit()
 
-        query = """select queue.id
-                from shopify_product_data_queue_line_ept as queue_line
-                inner join shopify_product_data_queue_ept as queue on queue_line.product_data_queue_id = queue.id
-                where queue_line.state='draft' and queue.is_action_require = 'False'
-                ORDER BY queue_line.create_date ASC limit 1"""
-        self._cr.execute(query)
-        product_data_queue_id = self._cr.fetchone()
-        if not product_data_queue_id:
-            return
+                if time.time() >= deadline:
+                    break
+                queue = self.claim_product_queue(exclude_queue_ids=handled_queue_ids)
+                if queue and queue != next_queue:
+                    # Another worker took the expected queue, so its prefetched data is not used.
+                    if next_prefetch:
+                        next_prefetch.cancel()
+                    prefetch = executor.submit(self.prefetch_product_queue_data, queue.id)
+                else:
+                    prefetch = next_prefetch
+        return
 
-        queue = product_data_queue_obj.browse(product_data_queue_id)
-        product_data_queue_line_ids = queue.product_data_queue_lines
+    def claim_product_queue(self, queue_ids=None, line_states=("draft",), include_action_required=False,
+                            exclude_queue_ids=None, claim=True):
+        """
+        This method claims the oldest product queue having pending lines for the current worker.
+        @param queue_ids: Claim one of these queues only.
+        @param line_states: States of the queue lines to be processed.
+        @param include_action_required: Claim the queues marked as action required too.
+        @param exclude_queue_ids: Queues already handled in this run, which are not claimed again.
+        @param claim: When False, the queue is only looked up without claiming it.
+        @return: Claimed product queue or empty recordset.
+        """
+        return self.env["data.queue.mixin.ept"].claim_shopify_data_queue("shopify.product.data.queue.ept",
+                                                                         "shopify.product.data.queue.line.ept",
+                                                                         "product_data_queue_id",
+                                                                         queue_ids, line_states,
+                                                                         include_action_required,
+                                                                         exclude_queue_ids, claim)
+
+    def start_product_queue_for_cron(self, queue):
+        """
+        Counts the attempt of the cron to process a claimed product queue, when its processing starts. Queues which
+        crashed 3 times are marked as action required and released.
+        @param queue: Claimed product queue.
+        @return: True if the queue is to be processed.
+        """
+        ir_model_obj = self.env["ir.model"]
+        common_log_book_obj = self.env["common.log.book.ept"]
 
         # For counting the queue crashes and creating schedule activity for the queue.
         queue.queue_process_count += 1
         if queue.queue_process_count > 3:
-            queue.is_action_require = True
+            queue.write({"is_action_require": True, "is_process_queue": False, "process_claimed_at": False})
             note = "<p>Need to process this product queue manually.There are 3 attempts been made by " \
                    "automated action to process this queue,<br/>- Ignore, if this queue is already processed.</p>"
             queue.message_post(body=note)
             if queue.shopify_instance_id.is_shopify_create_schedule:
                 model_id = ir_model_obj.search([("model", "=", "shopify.product.data.queue.ept")]).id
                 common_log_book_obj.create_crash_queue_schedule_activity(queue, model_id, note)
-            return
-
+            self._cr.commit()
+            return False
         self._cr.commit()
-        product_data_queue_line_ids.process_product_queue_line_data()
-        return
+        return True
+
+    def prefetch_product_queue_data(self, queue_id):
+        """
+        Runs in a background thread with its own cursor. Decodes the data of the draft lines of a queue and
+        searches the Shopify templates and variants of the instance which already exist for them.
+        @param queue_id: Id of the product queue.
+        @return: Dictionary of the decoded data by line id, and the ids of the templates by Shopify template id
+        and of the variants by Shopify variant id.
+        """
+        with api.Environment.manage(), self.pool.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            queue_lines = env[self._name].search([("product_data_queue_id", "=", queue_id), ("state", "=", "draft")])
+            instance_id = queue_lines.product_data_queue_id.shopify_instance_id.id
+            data_queue_mixin_obj = env["data.queue.mixin.ept"]
+            product_data = {}
+            for queue_line in queue_lines:
+                product_data[queue_line.id] = data_queue_mixin_obj.decode_shopify_queue_data(
+                    queue_line.synced_product_data)
+
+            template_ids = [str(data.get("id")) for data in product_data.values() if data and data.get("id")]
+            variant_ids = [str(variant.get("id")) for data in product_data.values() if data
+                           for variant in data.get("variants") or [] if variant.get("id")]
+            templates = env["shopify.product.template.ept"].search_read(
+                [("shopify_tmpl_id", "in", template_ids), ("shopify_instance_id", "=", instance_id)],
+                ["shopify_tmpl_id"]) if template_ids else []
+            variants = env["shopify.product.product.ept"].search_read(
+                [("variant_id", "in", variant_ids), ("shopify_instance_id", "=", instance_id)],
+                ["variant_id"]) if variant_ids else []
+
+        return {"product_data": product_data,
+                "templates": {template["shopify_tmpl_id"]: template["id"] for template in templates},
+                "variants": {variant["variant_id"]: variant["id"] for variant in variants}}
 
-    def process_product_queue_line_data(self):
+    def process_product_queue_line_data(self, prefetched_data=None):
         """
         This method processes product queue lines.
+        @param prefetched_data: Data of the queue prepared by prefetch_product_queue_data.
         @author: Maulik Barad on Date 31-Aug-2020.
         """
         shopify_product_template_obj = self.env["shopify.product.template.ept"]
@@ -80,6 +181,7 @@ class ShopifyProductDataQueueLineEpt(models.Model):
             shopify_instance = queue_id.shopify_instance_id
             if not shopify_instance.active:
                 _logger.info("Instance '{}' is not active.".format(shopify_instance.name))
+                queue_id.write({"is_process_queue": False, "process_claimed_at": False})
                 return True
             if queue_id.common_log_book_id:
                 log_book_id = queue_id.common_log_book_id
@@ -89,21 +191,21 @@ class ShopifyProductDataQueueLineEpt(models.Model):
                                                           "shopify_instance_id": shopify_instance.id,
                                                           "model_id": model_id,
                                                           "active": True})
-            self.env.cr.execute(
-                """update shopify_product_data_queue_ept set is_process_queue = False where is_process_queue = True""")
+            queue_id.is_process_queue = True
             self._cr.commit()
-            commit_count = 0
+            commit_batch = shopify_instance.get_shopify_commit_batch(queue_id)
             for product_queue_line in self:
-                commit_count += 1
-                if commit_count == 10:
-                    queue_id.is_process_queue = True
-                    self._cr.commit()
-                    commit_count = 0
-                shopify_product_template_obj.shopify_sync_products(product_queue_line,
-                                                                   False,
-                                                                   shopify_instance,
-                                                                   log_book_id)
-                queue_id.is_process_queue = False
+                _, error = commit_batch.run(shopify_product_template_obj.shopify_sync_products,
+                                            product_queue_line, False, shopify_instance, log_book_id,
+                                            prefetched_data=prefetched_data)
+                if error:
+                    message = "Error while importing product of queue line %s: %s" % (product_queue_line.name,
+                                                                                      error)
+                    self.env["common.log.lines.ept"].shopify_create_product_log_line(message, model_id,
+                                                                                     product_queue_line, log_book_id)
+                    product_queue_line.state = "failed"
+            commit_batch.commit()
+            queue_id.write({"is_process_queue": False, "process_claimed_at": False})
             queue_id.common_log_book_id = log_book_id
             if queue_id.common_log_book_id and not queue_id.common_log_book_id.log_lines:
                 queue_id.common_log_book_id.unlink()
@@ -124,7 +226,7 @@ class ShopifyProductDataQueueLineEpt(models.Model):
             return True
         result = shopify.Product().find(self.product_data_id)
         result = result.to_dict()
-        data = json.dumps(result)
+        data = self.env["data.queue.mixin.ept"].encode_shopify_queue_data(result)
         self.write({"synced_product_data": data, "state": "draft"})
         self._cr.commit()
         self.process_product_queue_line_data()
@@ -1,16 +1,49 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
+import hashlib
 import logging
 from odoo import models, fields, api
 
 _logger = logging.getLogger("Shopify")
 
+# Fields of an address which identify it below its parent, in the order of the match key.
+SHOPIFY_ADDRESS_KEY_FIELDS = ["street", "street2", "city", "zip", "phone", "state_id", "country_id", "company_name"]
+
 
 class ResPartner(models.Model):
     _inherit = "res.partner"
 
     is_shopify_customer = fields.Boolean(string="Is Shopify Customer?", default=False,
                                          help="Used for identified that the customer is imported from Shopify store.")
+    shopify_address_key = fields.Char(compute="_compute_shopify_address_key", store=True, index=True, copy=False,
+                                      help="Hash of the normalised address, used to find the existing address of a "
+                                           "Shopify customer with one indexed search.")
+
+    @api.depends(*SHOPIFY_ADDRESS_KEY_FIELDS)
+    def _compute_shopify_address_key(self):
+        """
+        Computes the address match key of the partners.
+        """
+        for partner in self:
+            partner.shopify_address_key = self.get_shopify_address_key(
+                {field: partner[field].id if partner._fields[field].type == "many2one" else partner[field]
+                 for field in SHOPIFY_ADDRESS_KEY_FIELDS})
+
+    @api.model
+    def get_shopify_address_key(self, vals):
+        """
+        Prepares the address match key from partner values. Texts are compared case insensitively and with
+        the white spaces collapsed, so the key is the same for the addresses matched with =ilike before.
+        @param vals: Dictionary of partner values.
+        @return: SHA1 of the normalised address.
+        """
+        parts = []
+        for field in SHOPIFY_ADDRESS_KEY_FIELDS:
+            value = vals.get(field) or ""
+            if isinstance(value, str):
+                value = " ".join(value.lower().split())
+            parts.append(str(value))
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
 
     @api.model
     def create_shopify_pos_customer(self, order_response, instance):
@@ -1,20 +1,22 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import json
 import logging
 import pytz
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from dateutil import parser
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
 
 utc = pytz.utc
 
+FULFILLMENT_STATUS_CHUNK_SIZE = 250
+
 _logger = logging.getLogger("Shopify")
 
 
@@ -136,9 +138,10 @@ class SaleOrder(models.Model):
 
         return partner, delivery_address, invoice_address
 
-    def set_shopify_location_and_warehouse(self, order_response, instance, pos_order):
+    def set_shopify_location_and_warehouse(self, order_response, instance, pos_order, order_lookup=None):
         """
         This method sets shopify location and warehouse related to that location in order.
+        @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
         @author: Maulik Barad on Date 11-Sep-2020.
         """
         shopify_location = shopify_location_obj = self.env["shopify.location.ept"]
@@ -149,7 +152,9 @@ class SaleOrder(models.Model):
         else:
             shopify_location_id = False
 
-        if shopify_location_id:
+        if shopify_location_id and order_lookup is not None:
+            shopify_location = order_lookup["locations"].get(str(shopify_location_id), shopify_location_obj)
+        elif shopify_location_id:
             shopify_location = shopify_location_obj.search(
                 [("shopify_location_id", "=", shopify_location_id),
                  ("instance_id", "=", instance.id)],
@@ -163,21 +168,22 @@ class SaleOrder(models.Model):
         return {"shopify_location_id": shopify_location and shopify_location.id or False,
                 "warehouse_id": warehouse_id, "is_pos_order": pos_order}
 
-    def create_shopify_order_lines(self, lines, order_response, instance):
+    def create_shopify_order_lines(self, lines, order_response, instance, order_lookup=None):
         """
         This method creates sale order line and discount line for Shopify order.
+        @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
         @author: Maulik Barad on Date 11-Sep-2020.
         """
         total_discount = order_response.get("total_discounts", 0.0)
         order_number = order_response.get("order_number")
 
         for line in lines:
-            shopify_product = self.search_shopify_product_for_order_line(line, instance)
+            shopify_product = self.search_shopify_product_for_order_line(line, instance, order_lookup)
             product = shopify_product.product_id
 
             order_line = self.shopify_create_sale_order_line(line, product, line.get("quantity"),
                                                              product.name, line.get("price"),
-                                                             order_response)
+                                                             order_response, order_lookup=order_lookup)
             if float(total_discount) > 0.0:
                 discount_amount = 0.0
                 for discount_allocation in line.get("discount_allocations"):
@@ -188,30 +194,34 @@ class SaleOrder(models.Model):
                     self.shopify_create_sale_order_line({}, instance.discount_product_id, 1,
                                                         product.name, float(discount_amount) * -1,
                                                         order_response, previous_line=order_line,
-                                                        is_discount=True)
+                                                        is_discount=True, order_lookup=order_lookup)
                     _logger.info("Created discount line for Odoo order(%s) and Shopify order is (%s)"
                                  % (self.name, order_number))
         return
 
-    def create_shopify_shipping_lines(self, order_response, instance):
+    def create_shopify_shipping_lines(self, order_response, instance, order_lookup=None):
         """
         Creates shipping lines for shopify orders.
+        @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
         @author: Maulik Barad on Date 11-Sep-2020.
         """
         delivery_carrier_obj = self.env["delivery.carrier"]
         for line in order_response.get("shipping_lines", []):
-            carrier = delivery_carrier_obj.shopify_search_create_delivery_carrier(line, instance)
+            carrier = delivery_carrier_obj.shopify_search_create_delivery_carrier(line, instance, order_lookup)
             if carrier:
                 self.write({"carrier_id": carrier.id})
                 shipping_product = carrier.product_id
                 self.shopify_create_sale_order_line(line, shipping_product, 1,
                                                     shipping_product.name or line.get("title"),
-                                                    line.get("price"), order_response, is_shipping=True)
+                                                    line.get("price"), order_response, is_shipping=True,
+                                                    order_lookup=order_lookup)
         return
 
     def import_shopify_orders(self, order_data_lines, log_book, is_queue_line=True):
         """
         This method used to create a sale orders in Odoo.
+        All orders of the batch are decoded first, so the records they need are searched once for the
+        whole batch by prepare_shopify_order_lookup.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 11/11/2019.
         Task Id : 157350
         @change: By Maulik Barad on Date 21-Sep-2020.
@@ -219,132 +229,255 @@ class SaleOrder(models.Model):
         order_risk_obj = self.env["shopify.order.risk"]
 
         order_ids = []
-        commit_count = 0
         instance = log_book.shopify_instance_id
 
         instance.connect_in_shopify()
 
-        for order_data_line in order_data_lines:
-            commit_count += 1
-            if commit_count == 5:
-                self._cr.commit()
-                commit_count = 0
-            if is_queue_line:
-                order_data = order_data_line.order_data
-                order_response = json.loads(order_data)
-            else:
-                if not isinstance(order_data_line, dict):
-                    order_response = order_data_line.to_dict()
-                else:
-                    order_response = order_data_line
-                order_data_line = False
-
-            order_number = order_response.get("order_number")
-            _logger.info("Started processing Shopify order(%s) and order id is(%s)"
-                         % (order_number, order_response.get("id")))
-            sale_order = self.search([("shopify_order_id", "=", order_response.get("id")),
-                                      ("shopify_instance_id", "=", instance.id),
-                                      ("shopify_order_number", "=", order_number)])
-            if not sale_order:
-                sale_order = self.search([("shopify_instance_id", "=", instance.id),
-                                          ("client_order_ref", "=", order_response.get("name"))])
-
-            if sale_order:
-                if order_data_line:
-                    order_data_line.write({"state": "done", "processed_at": datetime.now(),
-                                           "sale_order_id": sale_order.id})
-                    self._cr.commit()
-                _logger.info("Done the Process of order Because Shopify Order(%s) is exist in Odoo and "
-                             "Odoo order is(%s)" % (order_number, sale_order.name))
-                continue
+        orders = self.prepare_shopify_order_responses(order_data_lines, is_queue_line)
+        order_lookup = self.prepare_shopify_order_lookup([order_response for _, order_response in orders], instance)
+        risk_futures = order_risk_obj.prefetch_shopify_order_risks(
+            instance, [order_response.get("id") for _, order_response in orders
+                       if order_response.get("id") and not self.get_existing_shopify_order(order_response,
+                                                                                           order_lookup)])
+
+        commit_batch = instance.get_shopify_commit_batch(
+            order_data_lines.shopify_order_data_queue_id if is_queue_line else None)
+        for order_data_line, order_response in orders:
+            sale_order, error = commit_batch.run(self.import_shopify_order, order_data_line, order_response,
+                                                 instance, log_book, order_lookup, risk_futures)
+            if error:
+                message = "Error while importing Shopify Order(%s) and id (%s): %s" % (
+                    order_response.get("order_number"), order_response.get("id"), error)
+                self.create_shopify_log_line(message, order_data_line, log_book, order_response.get("name"))
+                # Records created for the rolled back order may be in the lookup.
+                order_lookup = self.prepare_shopify_order_lookup([response for _, response in orders], instance)
+            elif sale_order:
+                order_ids.append(sale_order.id)
+        commit_batch.commit()
 
-            pos_order = True if order_response.get("source_name", "") == "pos" else False
-            partner, delivery_address, invoice_address = self.prepare_shopify_customer_and_addresses(
-                order_response, pos_order, instance, order_data_line, log_book)
-            if not partner:
-                continue
+        return order_ids
 
-            lines = order_response.get("line_items")
-            if self.check_mismatch_details(lines, instance, order_number, order_data_line, log_book):
-                _logger.info("Mismatch details found in this Shopify Order(%s) and id (%s)" % (
-                    order_number, order_response.get("id")))
-                if order_data_line:
-                    order_data_line.write({"state": "failed", "processed_at": datetime.now()})
-                continue
+    def import_shopify_order(self, order_data_line, order_response, instance, log_book, order_lookup, risk_futures):
+        """
+        This method used to create a sale order in Odoo from one Shopify order.
+        @param order_data_line: Queue line of the order.
+        @param order_response: Order data received from Shopify.
+        @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
+        @param risk_futures: Risks of the orders being fetched by prefetch_shopify_order_risks.
+        @return: Sale order created for the Shopify order.
+        """
+        order_risk_obj = self.env["shopify.order.risk"]
 
-            sale_order = self.shopify_create_order(instance, partner, delivery_address, invoice_address,
-                                                   order_data_line, order_response, log_book)
-            if not sale_order:
-                message = "Configuration missing in Odoo while importing Shopify Order(%s) and id (%s)" % (
-                    order_number, order_response.get("id"))
-                _logger.info(message)
-                self.create_shopify_log_line(message, order_data_line, log_book, order_response.get("name"))
-                continue
-            order_ids.append(sale_order.id)
+        order_number = order_response.get("order_number")
+        _logger.info("Started processing Shopify order(%s) and order id is(%s)"
+                     % (order_number, order_response.get("id")))
+        sale_order = self.get_existing_shopify_order(order_response, order_lookup)
 
-            location_vals = self.set_shopify_location_and_warehouse(order_response, instance, pos_order)
-            sale_order.write(location_vals)
+        if sale_order:
+            if order_data_line:
+                order_data_line.write({"state": "done", "processed_at": datetime.now(),
+                                       "sale_order_id": sale_order.id})
+            _logger.info("Done the Process of order Because Shopify Order(%s) is exist in Odoo and "
+                         "Odoo order is(%s)" % (order_number, sale_order.name))
+            return False
 
-            risk_result = shopify.OrderRisk().find(order_id=order_response.get("id"))
-            if risk_result:
-                order_risk_obj.shopify_create_risk_in_order(risk_result, sale_order)
-                risk = sale_order.risk_ids.filtered(lambda x: x.recommendation != "accept")
-                if risk:
-                    sale_order.is_risky_order = True
+        pos_order = True if order_response.get("source_name", "") == "pos" else False
+        partner, delivery_address, invoice_address = self.prepare_shopify_customer_and_addresses(
+            order_response, pos_order, instance, order_data_line, log_book)
+        if not partner:
+            return False
 
-            _logger.info("Creating order lines for Odoo order(%s) and Shopify order is (%s)." % (
-                sale_order.name, order_number))
-            sale_order.create_shopify_order_lines(lines, order_response, instance)
+        lines = order_response.get("line_items")
+        if self.check_mismatch_details(lines, instance, order_number, order_data_line, log_book, order_lookup):
+            _logger.info("Mismatch details found in this Shopify Order(%s) and id (%s)" % (
+                order_number, order_response.get("id")))
+            if order_data_line:
+                order_data_line.write({"state": "failed", "processed_at": datetime.now()})
+            return False
 
-            _logger.info("Created order lines for Odoo order(%s) and Shopify order is (%s)"
-                         % (sale_order.name, order_number))
+        sale_order = self.shopify_create_order(instance, partner, delivery_address, invoice_address,
+                                               order_data_line, order_response, log_book, order_lookup)
+        if not sale_order:
+            message = "Configuration missing in Odoo while importing Shopify Order(%s) and id (%s)" % (
+                order_number, order_response.get("id"))
+            _logger.info(message)
+            self.create_shopify_log_line(message, order_data_line, log_book, order_response.get("name"))
+            return False
+        order_lookup["orders"][(str(order_response.get("id")), str(order_number))] = sale_order
 
-            sale_order.create_shopify_shipping_lines(order_response, instance)
-            _logger.info("Created Shipping lines for order (%s)." % sale_order.name)
+        location_vals = self.set_shopify_location_and_warehouse(order_response, instance, pos_order,
+                                                                order_lookup)
+        sale_order.write(location_vals)
 
-            _logger.info("Starting auto workflow process for Odoo order(%s) and Shopify order is (%s)"
-                         % (sale_order.name, order_number))
+        risk_result = order_risk_obj.get_shopify_order_risks(risk_futures, order_response.get("id"))
+        if risk_result:
+            order_risk_obj.shopify_create_risk_in_order(risk_result, sale_order)
+            risk = sale_order.risk_ids.filtered(lambda x: x.recommendation != "accept")
+            if risk:
+                sale_order.is_risky_order = True
 
-            if not sale_order.is_risky_order:
-                if sale_order.shopify_order_status == "fulfilled":
-                    sale_order.auto_workflow_process_id.shipped_order_workflow_ept(sale_order)
-                else:
-                    sale_order.process_orders_and_invoices_ept()
+        _logger.info("Creating order lines for Odoo order(%s) and Shopify order is (%s)." % (
+            sale_order.name, order_number))
+        sale_order.create_shopify_order_lines(lines, order_response, instance, order_lookup)
 
-            _logger.info("Done auto workflow process for Odoo order(%s) and Shopify order is (%s)"
-                         % (sale_order.name, order_number))
+        _logger.info("Created order lines for Odoo order(%s) and Shopify order is (%s)"
+                     % (sale_order.name, order_number))
 
-            if order_data_line:
-                order_data_line.write({"state": "done", "processed_at": datetime.now(),
-                                       "sale_order_id": sale_order.id})
-            _logger.info("Processed the Odoo Order %s process and Shopify Order (%s)"
-                         % (sale_order.name, order_number))
+        sale_order.create_shopify_shipping_lines(order_response, instance, order_lookup)
+        _logger.info("Created Shipping lines for order (%s)." % sale_order.name)
 
-        return order_ids
+        _logger.info("Starting auto workflow process for Odoo order(%s) and Shopify order is (%s)"
+                     % (sale_order.name, order_number))
+
+        if not sale_order.is_risky_order:
+            if sale_order.shopify_order_status == "fulfilled":
+                sale_order.auto_workflow_process_id.shipped_order_workflow_ept(sale_order)
+            else:
+                sale_order.process_orders_and_invoices_ept()
+
+        _logger.info("Done auto workflow process for Odoo order(%s) and Shopify order is (%s)"
+                     % (sale_order.name, order_number))
+
+        if order_data_line:
+            order_data_line.write({"state": "done", "processed_at": datetime.now(),
+                                   "sale_order_id": sale_order.id})
+        _logger.info("Processed the Odoo Order %s process and Shopify Order (%s)"
+                     % (sale_order.name, order_number))
+
+        return sale_order
+
+    def get_existing_shopify_order(self, order_response, order_lookup):
+        """
+        Gives the order already imported for a Shopify order, by its id and number or by its name.
+        @param order_response: Dictionary of the order.
+        @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
+        """
+        return order_lookup["orders"].get((str(order_response.get("id")), str(order_response.get("order_number")))) \
+            or order_lookup["order_refs"].get(order_response.get("name"))
+
+    def prepare_shopify_order_responses(self, order_data_lines, is_queue_line=True):
+        """
+        Decodes the orders of queue lines or converts the orders got from Shopify to dictionaries.
+        @return: List of tuples of queue line or False and dictionary of the order.
+        """
+        data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
+        orders = []
+        for order_data_line in order_data_lines:
+            if is_queue_line:
+                orders.append((order_data_line, data_queue_mixin_obj.decode_shopify_queue_data(
+                    order_data_line.order_data)))
+            elif not isinstance(order_data_line, dict):
+                orders.append((False, order_data_line.to_dict()))
+            else:
+                orders.append((False, order_data_line))
+        return orders
+
+    def prepare_shopify_order_lookup(self, order_responses, instance):
+        """
+        Collects the order ids, variant ids, SKUs, taxes, gateways, shipping codes, currencies and locations
+        of all the orders of a batch and searches each of them once, so the orders are processed against
+        dictionaries instead of searching per order, order line and tax line.
+        Records found or created later while processing the batch are added by the methods using them.
+        @param order_responses: List of dictionaries of orders.
+        @param instance: Shopify Instance.
+        @return: Dictionary of dictionaries of records.
+        """
+        shopify_product_obj = self.env["shopify.product.product.ept"]
+        payment_gateway_obj = self.env["shopify.payment.gateway.ept"]
+        company = instance.shopify_warehouse_id.company_id
+
+        order_ids, order_names, variant_ids, skus, tax_names = set(), set(), set(), set(), set()
+        gateways, carrier_sources, carrier_titles, currencies = set(), set(), set(), set()
+        for order_response in order_responses:
+            order_ids.add(str(order_response.get("id")))
+            if order_response.get("name"):
+                order_names.add(order_response.get("name"))
+            gateways.add(order_response.get("gateway") or "no_payment_gateway")
+            if order_response.get("currency"):
+                currencies.add(order_response.get("currency"))
+
+            tax_lines = list(order_response.get("tax_lines") or [])
+            for line in order_response.get("line_items") or []:
+                if line.get("variant_id"):
+                    variant_ids.add(str(line.get("variant_id")))
+                if line.get("sku"):
+                    skus.add(line.get("sku"))
+                tax_lines += line.get("tax_lines") or []
+            for line in order_response.get("shipping_lines") or []:
+                carrier_sources.add(line.get("source"))
+                carrier_titles.add(line.get("title"))
+                tax_lines += line.get("tax_lines") or []
+            for tax in tax_lines:
+                tax_names.add(self.prepare_shopify_tax_name(tax, order_response.get("taxes_included") or False,
+                                                            company)[1])
+
+        order_lookup = {"orders": {}, "order_refs": {}, "variants": {}, "skus": {}, "taxes": {}, "gateways": {},
+                        "workflows": {}, "carriers": {}, "carrier_titles": {}, "pricelists": {}, "locations": {}}
+
+        for order in self.search([("shopify_instance_id", "=", instance.id), "|",
+                                  ("shopify_order_id", "in", list(order_ids)),
+                                  ("client_order_ref", "in", list(order_names))]):
+            order_lookup["orders"][(order.shopify_order_id, order.shopify_order_number)] = order
+            if order.client_order_ref:
+                order_lookup["order_refs"].setdefault(order.client_order_ref, order)
+
+        for shopify_product in shopify_product_obj.search([("shopify_instance_id", "=", instance.id), "|",
+                                                           ("variant_id", "in", list(variant_ids)),
+                                                           ("default_code", "in", list(skus))]):
+            if shopify_product.variant_id:
+                order_lookup["variants"].setdefault(shopify_product.variant_id, shopify_product)
+            if shopify_product.default_code:
+                order_lookup["skus"][shopify_product.default_code] = order_lookup["skus"].get(
+                    shopify_product.default_code, shopify_product_obj) | shopify_product
+
+        if tax_names:
+            for tax in self.env["account.tax"].search([("name", "in", list(tax_names)),
+                                                       ("type_tax_use", "=", "sale"),
+                                                       ("company_id", "=", company.id)]):
+                order_lookup["taxes"].setdefault((tax.name, round(tax.amount, 4), tax.price_include), tax)
+
+        payment_gateways = payment_gateway_obj.search([("code", "in", list(gateways)),
+                                                       ("shopify_instance_id", "=", instance.id)])
+        for payment_gateway in payment_gateways:
+            order_lookup["gateways"].setdefault(payment_gateway.code, payment_gateway)
+        for workflow_config in self.env["sale.auto.workflow.configuration.ept"].search(
+                [("shopify_instance_id", "=", instance.id), ("payment_gateway_id", "in", payment_gateways.ids)]):
+            order_lookup["workflows"][(workflow_config.payment_gateway_id.id,
+                                       workflow_config.financial_status)] = workflow_config
+
+        carrier_sources.discard(None)
+        if carrier_sources:
+            for carrier in self.env["delivery.carrier"].search(["|", ("shopify_source", "in", list(carrier_sources)),
+                                                                ("name", "in", list(carrier_titles))]):
+                if carrier.shopify_source:
+                    for code in {carrier.shopify_code, carrier.shopify_tracking_company} - {False}:
+                        order_lookup["carriers"].setdefault((carrier.shopify_source, code), carrier)
+                order_lookup["carrier_titles"].setdefault(carrier.name, carrier)
+
+        if currencies:
+            currency_records = self.env["res.currency"].search([("name", "in", list(currencies))])
+            for pricelist in self.env["product.pricelist"].search([("currency_id", "in", currency_records.ids)]):
+                order_lookup["pricelists"].setdefault(pricelist.currency_id.name, pricelist)
+
+        for location in self.env["shopify.location.ept"].search([("instance_id", "=", instance.id)]):
+            order_lookup["locations"].setdefault(location.shopify_location_id, location)
+
+        return order_lookup
 
     def check_mismatch_details(self, lines, instance, order_number, order_data_queue_line,
-                               log_book_id):
+                               log_book_id, order_lookup=None):
         """This method used to check the mismatch details in the order lines.
             @param : self, lines, instance, order_number, order_data_queue_line
+            @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
             @return:
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 11/11/2019.
             Task Id : 157350
         """
-        shopify_product_obj = self.env["shopify.product.product.ept"]
         shopify_product_template_obj = self.env["shopify.product.template.ept"]
         mismatch = False
 
         for line in lines:
-            shopify_variant = False
-            sku = line.get("sku") or False
-            if line.get("variant_id", None):
-                shopify_variant = shopify_product_obj.search(
-                    [("variant_id", "=", line.get("variant_id")),
-                     ("shopify_instance_id", "=", instance.id)])
-            if not shopify_variant and sku:
-                shopify_variant = shopify_product_obj.search(
-                    [("default_code", "=", sku),
-                     ("shopify_instance_id", "=", instance.id)])
+            shopify_variant = self.find_shopify_variant_for_order_line(line, instance, order_lookup)
             if shopify_variant:
                 continue
 
@@ -355,20 +488,15 @@ class SaleOrder(models.Model):
                     shopify_product_template_obj.shopify_sync_products(False, line_product_id,
                                                                        instance, log_book_id,
                                                                        order_data_queue_line)
-                    if line.get("variant_id"):
-                        shopify_variant = shopify_product_obj.search(
-                            [("variant_id", "=", line.get("variant_id")),
-                             ("shopify_instance_id", "=", instance.id)])
-                    if not shopify_variant and sku:
-                        shopify_variant = shopify_product_obj.search(
-                            [("default_code", "=", sku),
-                             ("shopify_instance_id", "=", instance.id)])
+                    shopify_variant = self.find_shopify_variant_for_order_line(line, instance)
                     if not shopify_variant:
                         message = "Product [%s][%s] not found for Order %s" % (
                             line.get("sku"), line.get("name"), order_number)
                         self.create_shopify_log_line(message, order_data_queue_line, log_book_id, order_number)
                         mismatch = True
                         break
+                    if order_lookup is not None:
+                        order_lookup["variants"][str(line_variant_id)] = shopify_variant
                 else:
                     message = "Product ID is not available in %s Order line response. It might " \
                               "have happened that product has been deleted after order was " \
@@ -378,10 +506,37 @@ class SaleOrder(models.Model):
                     break
         return mismatch
 
+    def find_shopify_variant_for_order_line(self, line, instance, order_lookup=None):
+        """
+        Finds the Shopify variant of an order line by variant id, then by SKU.
+        Without the lookup of the batch, it searches the variant.
+        @param line: Dictionary of the order line.
+        @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
+        """
+        shopify_product_obj = self.env["shopify.product.product.ept"]
+        variant_id = line.get("variant_id")
+        sku = line.get("sku") or False
+
+        if order_lookup is not None:
+            shopify_variant = variant_id and order_lookup["variants"].get(str(variant_id))
+            if not shopify_variant and sku:
+                shopify_variant = order_lookup["skus"].get(sku)
+            return shopify_variant or shopify_product_obj
+
+        shopify_variant = shopify_product_obj
+        if variant_id:
+            shopify_variant = shopify_product_obj.search([("variant_id", "=", variant_id),
+                                                          ("shopify_instance_id", "=", instance.id)])
+        if not shopify_variant and sku:
+            shopify_variant = shopify_product_obj.search([("default_code", "=", sku),
+                                                          ("shopify_instance_id", "=", instance.id)])
+        return shopify_variant
+
     def shopify_create_order(self, instance, partner, shipping_address, invoice_address,
-                             order_data_queue_line, order_response, log_book_id):
+                             order_data_queue_line, order_response, log_book_id, order_lookup=None):
         """This method used to create a sale order.
             @param : self, instance, partner, shipping_address, invoice_address,order_data_queue_line, order_response
+            @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
             @return: order
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 12/11/2019.
             Task Id : 157350
@@ -390,7 +545,8 @@ class SaleOrder(models.Model):
         payment_gateway, workflow = payment_gateway_obj.shopify_search_create_gateway_workflow(instance,
                                                                                                order_data_queue_line,
                                                                                                order_response,
-                                                                                               log_book_id)
+                                                                                               log_book_id,
+                                                                                               order_lookup)
 
         if not all([payment_gateway, workflow]):
             return False
@@ -398,14 +554,14 @@ class SaleOrder(models.Model):
         order_vals = self.prepare_shopify_order_vals(instance, partner, shipping_address,
                                                      invoice_address, order_response,
                                                      payment_gateway,
-                                                     workflow)
+                                                     workflow, order_lookup)
 
         order = self.create(order_vals)
         return order
 
     def prepare_shopify_order_vals(self, instance, partner, shipping_address,
                                    invoice_address, order_response, payment_gateway,
-                                   workflow):
+                                   workflow, order_lookup=None):
         """
         This method used to Prepare a order vals.
         @param : self, instance, partner, shipping_address,invoice_address, order_response, payment_gateway,workflow
@@ -420,7 +576,8 @@ class SaleOrder(models.Model):
             date_order = time.strftime("%Y-%m-%d %H:%M:%S")
             date_order = str(date_order)
 
-        pricelist_id = self.shopify_set_pricelist(order_response=order_response, instance=instance)
+        pricelist_id = self.shopify_set_pricelist(order_response=order_response, instance=instance,
+                                                  order_lookup=order_lookup)
         ordervals = {
             "company_id": instance.shopify_company_id.id if instance.shopify_company_id else False,
             "partner_id": partner.ids[0],
@@ -455,7 +612,7 @@ class SaleOrder(models.Model):
             ordervals.update({"name": name})
         return ordervals
 
-    def shopify_set_pricelist(self, instance, order_response):
+    def shopify_set_pricelist(self, instance, order_response, order_lookup=None):
         """
         Author:Bhavesh Jadav 09/12/2019 for the for set price list based on the order response currency because of if
         order currency different then the erp currency so we need to set proper pricelist for that sale order
@@ -464,6 +621,8 @@ class SaleOrder(models.Model):
         currency_obj = self.env["res.currency"]
         pricelist_obj = self.env["product.pricelist"]
         order_currency = order_response.get("currency") or False
+        if order_currency and order_lookup is not None and order_currency in order_lookup["pricelists"]:
+            return order_lookup["pricelists"][order_currency]
         if order_currency:
             currency = currency_obj.search([("name", "=", order_currency)])
             if not currency:
@@ -489,15 +648,26 @@ class SaleOrder(models.Model):
         pricelist = instance.shopify_pricelist_id.id if instance.shopify_pricelist_id else False
         return pricelist
 
-    def search_shopify_product_for_order_line(self, line, instance):
+    def search_shopify_product_for_order_line(self, line, instance, order_lookup=None):
         """This method used to search shopify product for order line.
             @param : self, line, instance
+            @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
             @return: shopify_product
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 14/11/2019.
             Task Id : 157350
         """
         shopify_product_obj = self.env["shopify.product.product.ept"]
         variant_id = line.get("variant_id")
+        if order_lookup is not None:
+            shopify_product = variant_id and order_lookup["variants"].get(str(variant_id))
+            if shopify_product:
+                return shopify_product
+            shopify_product = order_lookup["skus"].get(line.get("sku"))
+            if shopify_product:
+                shopify_product.write({"variant_id": variant_id})
+                if variant_id:
+                    order_lookup["variants"][str(variant_id)] = shopify_product
+                return shopify_product
         shopify_product = shopify_product_obj.search(
             [("shopify_instance_id", "=", instance.id), ("variant_id", "=", variant_id)])
         if shopify_product:
@@ -510,7 +680,7 @@ class SaleOrder(models.Model):
 
     def shopify_create_sale_order_line(self, line, product, quantity, product_name, price,
                                        order_response, is_shipping=False, previous_line=False,
-                                       is_discount=False):
+                                       is_discount=False, order_lookup=None):
         """
         This method used to create a sale order line.
         @param : self, line, product, quantity,product_name, order_id,price, is_shipping=False
@@ -541,16 +711,16 @@ class SaleOrder(models.Model):
                     # taxable
                     tax_ids = self.shopify_get_tax_id_ept(instance,
                                                           line.get("tax_lines"),
-                                                          taxes_included)
+                                                          taxes_included, order_lookup)
                 if is_shipping:
                     # In the Shopify store there is configuration regarding tax is applicable on shipping or not, if applicable then this use.
                     tax_ids = self.shopify_get_tax_id_ept(instance,
                                                           line.get("tax_lines"),
-                                                          taxes_included)
+                                                          taxes_included, order_lookup)
             elif not line:
                 tax_ids = self.shopify_get_tax_id_ept(instance,
                                                       order_response.get("tax_lines"),
-                                                      taxes_included)
+                                                      taxes_included, order_lookup)
             order_line_vals["tax_id"] = tax_ids
             # When the one order with two products one product with tax and another product
             # without tax and apply the discount on order that time not apply tax on discount
@@ -574,9 +744,10 @@ class SaleOrder(models.Model):
         return order_line
 
     @api.model
-    def shopify_get_tax_id_ept(self, instance, tax_lines, tax_included):
+    def shopify_get_tax_id_ept(self, instance, tax_lines, tax_included, order_lookup=None):
         """This method used to search tax in Odoo.
             @param : self,instance,order_line,tax_included
+            @param order_lookup: Records prefetched for the batch by prepare_shopify_order_lookup.
             @return: tax_id
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 18/11/2019.
             Task Id : 157350
@@ -585,28 +756,45 @@ class SaleOrder(models.Model):
         taxes = []
         company = instance.shopify_warehouse_id.company_id
         for tax in tax_lines:
-            rate = float(tax.get("rate", 0.0))
+            rate, name = self.prepare_shopify_tax_name(tax, tax_included, company)
             price = float(tax.get('price', 0.0))
-            title = tax.get("title")
-            rate = rate * 100
             if rate != 0.0 and price != 0.0:
-                if tax_included:
-                    name = "%s_(%s %s included)_%s" % (title, str(rate), "%", company.name)
+                tax_key = (name, round(rate, 4), tax_included)
+                if order_lookup is not None and tax_key in order_lookup["taxes"]:
+                    tax_id = order_lookup["taxes"][tax_key]
                 else:
-                    name = "%s_(%s %s excluded)_%s" % (title, str(rate), "%", company.name)
-                tax_id = self.env["account.tax"].search(
-                    [("price_include", "=", tax_included), ("type_tax_use", "=", "sale"),
-                     ("amount", "=", rate), ("name", "=", name),
-                     ("company_id", "=", instance.shopify_warehouse_id.company_id.id)], limit=1)
-                if not tax_id:
-                    tax_id = self.sudo().shopify_create_account_tax(instance, rate, tax_included,
-                                                                    company, name)
+                    tax_id = self.env["account.tax"].search(
+                        [("price_include", "=", tax_included), ("type_tax_use", "=", "sale"),
+                         ("amount", "=", rate), ("name", "=", name),
+                         ("company_id", "=", instance.shopify_warehouse_id.company_id.id)], limit=1)
+                    if not tax_id:
+                        tax_id = self.sudo().shopify_create_account_tax(instance, rate, tax_included,
+                                                                        company, name)
+                    if order_lookup is not None and tax_id:
+                        order_lookup["taxes"][tax_key] = tax_id
                 if tax_id:
                     taxes.append(tax_id.id)
         if taxes:
             tax_id = [(6, 0, taxes)]
         return tax_id
 
+    @api.model
+    def prepare_shopify_tax_name(self, tax, tax_included, company):
+        """
+        Gives the rate and the name of the tax of a Shopify tax line, by which the tax is searched in Odoo.
+        @param tax: Dictionary of the tax line.
+        @param tax_included: True, if the prices of order include taxes.
+        @param company: Company of the tax.
+        @return: Tuple of rate in percentage and name.
+        """
+        rate = float(tax.get("rate", 0.0)) * 100
+        title = tax.get("title")
+        if tax_included:
+            name = "%s_(%s %s included)_%s" % (title, str(rate), "%", company.name)
+        else:
+            name = "%s_(%s %s excluded)_%s" % (title, str(rate), "%", company.name)
+        return rate, name
+
     @api.model
     def shopify_create_account_tax(self, instance, value, price_included, company, name):
         """This method used to create tax in Odoo when importing orders from Shopify to Odoo.
@@ -745,7 +933,6 @@ class SaleOrder(models.Model):
         common_log_line_obj = self.env["common.log.lines.ept"]
         location_obj = self.env["stock.location"]
         stock_picking_obj = self.env["stock.picking"]
-        shopify_location_obj = self.env["shopify.location.ept"]
 
         model_id = common_log_line_obj.get_model_id(self._name)
         notify_customer = instance.notify_customer
@@ -763,22 +950,26 @@ class SaleOrder(models.Model):
                                                 ("state", "=", "done"),
                                                 ("location_dest_id", "in", customer_locations.ids)],
                                                order="date")
+
+        # Fulfillment status of all the orders is checked before anything is sent.
+        sale_orders = picking_ids.mapped("sale_id")
+        fulfilled_order_ids, found_order_ids = self.get_shopify_fulfillment_status(
+            instance, sale_orders.mapped("shopify_order_id"))
+        fulfilled_orders = sale_orders.filtered(lambda order: order.shopify_order_id in fulfilled_order_ids)
+        if fulfilled_orders:
+            _logger.info("Orders %s are already fulfilled" % ", ".join(fulfilled_orders.mapped("name")))
+            fulfilled_orders.picking_ids.filtered(lambda l: l.state == "done").write({"updated_in_shopify": True})
+
+        shopify_locations = self.prepare_shopify_fulfillment_locations(instance, sale_orders.mapped("warehouse_id"))
+        order_fulfillments = {}
+        fulfillment_locations = {}
         for picking in picking_ids:
-            carrier_name = self.get_shopify_carrier_code(picking)
             sale_order = picking.sale_id
+            if sale_order.shopify_order_id not in found_order_ids or sale_order in fulfilled_orders:
+                continue
 
             _logger.info("We are processing Sale order '%s' and Picking '%s'" % (sale_order.name, picking.name))
 
-            try:
-                order = shopify.Order.find(sale_order.shopify_order_id)
-                order_data = order.to_dict()
-                if order_data.get('fulfillment_status') == 'fulfilled':
-                    _logger.info('Order %s is already fulfilled' % sale_order.name)
-                    sale_order.picking_ids.filtered(lambda l: l.state == 'done').write({'updated_in_shopify': True})
-                    continue
-            except Exception as e:
-                continue
-
             order_lines = sale_order.order_line
             if order_lines and order_lines.filtered(lambda s: s.product_id.type != 'service' and not s.shopify_line_id):
                 message = (_(
@@ -799,52 +990,44 @@ class SaleOrder(models.Model):
                 self.create_shopify_log_line(message, False, log_book, sale_order.client_order_ref)
                 continue
 
-            shopify_location_id = sale_order.shopify_location_id or False
+            shopify_location_id = sale_order.shopify_location_id or shopify_locations.get(sale_order.warehouse_id.id)
             if not shopify_location_id:
-                shopify_location_id = shopify_location_obj.search(
-                    [("warehouse_for_order", "=", sale_order.warehouse_id.id), ("instance_id", "=", instance.id)])
-                if not shopify_location_id:
-                    shopify_location_id = shopify_location_obj.search([("is_primary_location", "=", True),
-                                                                       ("instance_id", "=", instance.id)])
-                if not shopify_location_id:
-                    message = "Primary Location not found for instance %s while update order " \
-                              "shipping status." % (
-                                  instance.name)
-                    _logger.info(message)
-                    self.create_shopify_log_line(message, False, log_book, sale_order.client_order_ref)
-                    continue
-
-            try:
-                fulfillment_vals = {"order_id": sale_order.shopify_order_id,
-                                    "location_id": shopify_location_id.shopify_location_id,
-                                    "tracking_numbers": list(set(tracking_numbers)),
-                                    "tracking_urls": [picking.carrier_tracking_url or ''],
-                                    "tracking_company": carrier_name, "line_items": line_items,
-                                    "notify_customer": notify_customer}
-
-                new_fulfillment = shopify.Fulfillment(fulfillment_vals)
-                fulfillment_result = new_fulfillment.save()
-                if not fulfillment_result:
-                    message = "Order [%s] status not updated due to some issue in fulfillment " \
-                              "request/response." % (
-                                  sale_order.name)
-                    _logger.info(message)
-                    self.create_shopify_log_line(message, False, log_book, sale_order.client_order_ref)
-                    continue
-
-            except ClientError as e:
-                if hasattr(e, "response"):
-                    if e.response.code == 429 and e.response.msg == "Too Many Requests":
-                        time.sleep(5)
-                        fulfillment_result = new_fulfillment.save()
-            except Exception as e:
-                message = "%s" % str(e)
+                message = "Primary Location not found for instance %s while update order " \
+                          "shipping status." % (
+                              instance.name)
                 _logger.info(message)
                 self.create_shopify_log_line(message, False, log_book, sale_order.client_order_ref)
                 continue
 
-            picking.write({"updated_in_shopify": True})
-            sale_order.shopify_location_id = shopify_location_id
+            fulfillment_vals = {"order_id": sale_order.shopify_order_id,
+                                "location_id": shopify_location_id.shopify_location_id,
+                                "tracking_numbers": list(set(tracking_numbers)),
+                                "tracking_urls": [picking.carrier_tracking_url or ''],
+                                "tracking_company": self.get_shopify_carrier_code(picking),
+                                "line_items": line_items,
+                                "notify_customer": notify_customer}
+            order_fulfillments.setdefault(sale_order.shopify_order_id, []).append(
+                (picking.id, sale_order.name, fulfillment_vals))
+            fulfillment_locations[picking.id] = shopify_location_id
+
+        fulfillment_results = self.push_shopify_fulfillments(instance, list(order_fulfillments.values()))
+
+        updated_pickings = stock_picking_obj.browse([picking_id for picking_id, error in fulfillment_results.items()
+                                                     if not error])
+        updated_pickings.write({"updated_in_shopify": True})
+        location_orders = {}
+        for picking in updated_pickings:
+            location_orders.setdefault(fulfillment_locations[picking.id], self.browse())
+            location_orders[fulfillment_locations[picking.id]] |= picking.sale_id
+        for shopify_location_id, orders in location_orders.items():
+            orders.filtered(lambda order: order.shopify_location_id != shopify_location_id).write(
+                {"shopify_location_id": shopify_location_id.id})
+
+        for picking in stock_picking_obj.browse([picking_id for picking_id, error in fulfillment_results.items()
+                                                 if error]):
+            message = fulfillment_results[picking.id]
+            _logger.info(message)
+            self.create_shopify_log_line(message, False, log_book, picking.sale_id.client_order_ref)
 
         if not log_book.log_lines:
             log_book.unlink()
@@ -852,6 +1035,95 @@ class SaleOrder(models.Model):
         self.closed_at(instance)
         return True
 
+    def get_shopify_fulfillment_status(self, instance, shopify_order_ids):
+        """
+        Fetches the fulfillment status of the orders from Shopify, 250 orders per request.
+        Orders which could not be fetched are left out of both the sets, so they are tried again by the
+        next run.
+        @param instance: Shopify Instance.
+        @param shopify_order_ids: List of Shopify order ids.
+        @return: Set of the fulfilled order ids and set of the order ids found in Shopify.
+        """
+        fulfilled_order_ids = set()
+        found_order_ids = set()
+        shopify_order_ids = [order_id for order_id in set(shopify_order_ids) if order_id]
+        for offset in range(0, len(shopify_order_ids), FULFILLMENT_STATUS_CHUNK_SIZE):
+            order_ids = shopify_order_ids[offset:offset + FULFILLMENT_STATUS_CHUNK_SIZE]
+            try:
+                orders = shopify.Order.find_raw(ids=",".join(order_ids), status="any", limit=len(order_ids),
+                                                fields="id,fulfillment_status")
+            except Exception as error:
+                _logger.info("Fulfillment status of orders %s could not be fetched from instance %s: %s" % (
+                    ", ".join(order_ids), instance.name, error))
+                continue
+            for order in orders:
+                found_order_ids.add(str(order.get("id")))
+                if order.get("fulfillment_status") == "fulfilled":
+                    fulfilled_order_ids.add(str(order.get("id")))
+        return fulfilled_order_ids, found_order_ids
+
+    def prepare_shopify_fulfillment_locations(self, instance, warehouses):
+        """
+        Finds the Shopify location of the warehouses with one search. Warehouses without a location
+        get the primary location of the instance.
+        @param instance: Shopify Instance.
+        @param warehouses: Warehouses of the orders.
+        @return: Dictionary of warehouse id and Shopify location.
+        """
+        shopify_locations = self.env["shopify.location.ept"].search(
+            ["|", ("warehouse_for_order", "in", warehouses.ids), ("is_primary_location", "=", True),
+             ("instance_id", "=", instance.id)])
+        primary_location = shopify_locations.filtered("is_primary_location")[:1]
+        warehouse_locations = {}
+        for warehouse in warehouses:
+            warehouse_locations[warehouse.id] = shopify_locations.filtered(
+                lambda location: location.warehouse_for_order == warehouse) or primary_location
+        return warehouse_locations
+
+    def push_shopify_fulfillments(self, instance, order_fulfillments):
+        """
+        Creates the fulfillments in Shopify in a bounded pool of threads. The fulfillments of one order are
+        sent in sequence by the same thread, and all the threads are paced by the rate limiter of the store.
+        @param instance: Shopify Instance.
+        @param order_fulfillments: List of lists of tuples of picking id, sale order name and fulfillment values,
+        one list per order.
+        @return: Dictionary of picking id and error message or False.
+        """
+        if not order_fulfillments:
+            return {}
+        shop_url = instance.prepare_shopify_shop_url()
+        fulfillment_results = {}
+        with ThreadPoolExecutor(max_workers=max(instance.shopify_fulfillment_export_threads, 1),
+                                thread_name_prefix="shopify_fulfillment_export") as executor:
+            for results in executor.map(partial(self.push_shopify_order_fulfillments, shop_url), order_fulfillments):
+                fulfillment_results.update(results)
+        return fulfillment_results
+
+    def push_shopify_order_fulfillments(self, shop_url, fulfillments):
+        """
+        Runs in a worker thread and creates the fulfillments of one order.
+        @param shop_url: Admin API url of the store, as the connection is thread local.
+        @param fulfillments: List of tuples of picking id, sale order name and fulfillment values.
+        @return: Dictionary of picking id and error message or False.
+        """
+        shopify.ShopifyResource.set_site(shop_url)
+        results = {}
+        for picking_id, order_name, fulfillment_vals in fulfillments:
+            try:
+                new_fulfillment = shopify.Fulfillment(fulfillment_vals)
+                if new_fulfillment.save():
+                    results[picking_id] = False
+                    continue
+                message = "Order [%s] status not updated due to some issue in fulfillment request/response." % (
+                    order_name)
+                errors = new_fulfillment.errors.full_messages()
+                if errors:
+                    message += "\n%s" % "\n".join(errors)
+                results[picking_id] = message
+            except Exception as error:
+                results[picking_id] = "%s" % str(error)
+        return results
+
     @api.model
     def process_shopify_order_via_webhook(self, order_data, instance, update_order=False):
         """
@@ -895,7 +1167,7 @@ class SaleOrder(models.Model):
         for queue_line in queue_lines:
             message = ""
             shopify_instance = queue_line.shopify_instance_id
-            order_data = json.loads(queue_line.order_data)
+            order_data = self.env["data.queue.mixin.ept"].decode_shopify_queue_data(queue_line.order_data)
             shopify_status = order_data.get("financial_status")
             order = self.search([("shopify_instance_id", "=", shopify_instance.id),
                                  ("shopify_order_id", "=", order_data.get("id"))])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models, fields
+
+
+class ShopifyInventoryLedgerEpt(models.Model):
+    _name = "shopify.inventory.ledger.ept"
+    _description = "Shopify Inventory Ledger"
+
+    shopify_product_id = fields.Many2one("shopify.product.product.ept", "Shopify Product", required=True,
+                                         ondelete="cascade", index=True)
+    shopify_location_id = fields.Many2one("shopify.location.ept", "Shopify Location", required=True,
+                                          ondelete="cascade")
+    instance_id = fields.Many2one("shopify.instance.ept", "Instance", required=True, ondelete="cascade",
+                                  index=True)
+    quantity = fields.Integer(help="Last quantity set in Shopify for the product at the location.")
+
+    _sql_constraints = [("unique_product_location", "unique(shopify_product_id, shopify_location_id)",
+                         "Only one ledger entry is allowed per product and location.")]
+
+    def get_shopify_pushed_quantities(self, instance):
+        """
+        Gives the quantities last set in Shopify for the products of the instance.
+        @param instance: Shopify Instance.
+        @return: Dictionary of tuple of Shopify product id and Shopify location id and the quantity.
+        """
+        self._cr.execute("""select shopify_product_id, shopify_location_id, quantity
+                            from shopify_inventory_ledger_ept where instance_id = %s""", (instance.id,))
+        return {(shopify_product_id, location_id): quantity
+                for shopify_product_id, location_id, quantity in self._cr.fetchall()}
+
+    def set_shopify_pushed_quantities(self, instance, pushed_quantities):
+        """
+        Records the quantities set in Shopify with one insert, updating the existing ledger entries.
+        @param instance: Shopify Instance.
+        @param pushed_quantities: Dictionary of tuple of Shopify product id and Shopify location id and the quantity.
+        """
+        if not pushed_quantities:
+            return True
+        rows = [self._cr.mogrify("(%s, %s, %s, %s, %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')",
+                                 (shopify_product_id, location_id, instance.id, quantity, self._uid,
+                                  self._uid)).decode()
+                for (shopify_product_id, location_id), quantity in pushed_quantities.items()]
+        self._cr.execute("""insert into shopify_inventory_ledger_ept (shopify_product_id, shopify_location_id,
+                            instance_id, quantity, create_uid, write_uid, create_date, write_date)
+                            values %s
+                            on conflict (shopify_product_id, shopify_location_id)
+                            do update set quantity = excluded.quantity, write_uid = excluded.write_uid,
+                            write_date = excluded.write_date""" % ", ".join(rows))
+        self.invalidate_cache()
+        return True
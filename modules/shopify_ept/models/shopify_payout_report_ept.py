@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 import logging
-import requests
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import split_every
 from datetime import datetime
+from .. import shopify
 
 _logger = logging.getLogger('Payout')
 
+# Statement lines reconciled in one savepoint by process_bank_statement.
+RECONCILIATION_BATCH_SIZE = 100
+
 
 class ShopifyPaymentReportEpt(models.Model):
     _name = "shopify.payout.report.ept"
@@ -281,21 +285,69 @@ class ShopifyPaymentReportEpt(models.Model):
         currency = moveline.currency_id.id
         return currency, amount_currency
 
+    def prepare_reconciliation_data(self, statement_lines):
+        """
+        Loads the payments, invoices and open receivable move lines of all the statement lines with a few
+        grouped queries, so the statement lines are matched in memory.
+        :param statement_lines: Statement lines to be reconciled.
+        :return: Dictionary of the maps used by process_bank_statement.
+        """
+        account_payment_obj = self.env['account.payment']
+        move_line_obj = self.env['account.move.line']
+
+        payments_by_name = {}
+        refs = [ref for ref in statement_lines.mapped('ref') if ref]
+        if refs:
+            for payment in account_payment_obj.search([('name', 'in', refs)]):
+                payments_by_name.setdefault(payment.name, payment)
+
+        invoices = statement_lines.mapped('shopify_order_ids.invoice_ids').filtered(
+            lambda record: record.type in ('out_invoice', 'out_refund') and record.state == 'posted')
+        payments_by_invoice = {}
+        if invoices:
+            for payment in account_payment_obj.search([('invoice_ids', 'in', invoices.ids)]):
+                for invoice in payment.invoice_ids:
+                    payments_by_invoice.setdefault(invoice.id, account_payment_obj.browse())
+                    payments_by_invoice[invoice.id] |= payment
+
+        receivable_lines_by_invoice = {}
+        if invoices:
+            for move_line in move_line_obj.search([('move_id', 'in', invoices.ids),
+                                                   ('account_id.user_type_id.type', '=', 'receivable'),
+                                                   ('reconciled', '=', False)]):
+                receivable_lines_by_invoice.setdefault(move_line.move_id.id, move_line_obj.browse())
+                receivable_lines_by_invoice[move_line.move_id.id] |= move_line
+
+        return {'payments_by_name': payments_by_name,
+                'payments_by_invoice': payments_by_invoice,
+                'receivable_lines_by_invoice': receivable_lines_by_invoice}
+
     def process_bank_statement(self):
+        """
+        Reconciles the statement lines of the payout. Payments, invoices and receivable lines of all the lines
+        are loaded first by prepare_reconciliation_data, the lines are matched in memory and the reconciliations
+        are submitted in batches by submit_reconciliations. The log lines are created together at the end.
+        """
         statement_line_obj = self.env['account.bank.statement.line']
         payout_logline_obj = self.env['shopify.payout.logline.ept']
-        invoice_obj = self.env['account.move']
         account_payment_obj = self.env['account.payment']
+        move_line_obj = self.env['account.move.line']
         bank_statement = self.statement_id
         _logger.info("Processing Bank Statement: {0}.".format(bank_statement.name))
-        for statement_line in bank_statement.line_ids.filtered(lambda x: x.journal_entry_ids.ids == []):
+        statement_lines = bank_statement.line_ids.filtered(lambda x: x.journal_entry_ids.ids == [])
+        reconciliation_data = self.prepare_reconciliation_data(statement_lines)
+        payments_by_invoice = reconciliation_data['payments_by_invoice']
+        receivable_lines_by_invoice = reconciliation_data['receivable_lines_by_invoice']
+        log_line_vals = []
+        reconciliations = []
+        for statement_line in statement_lines:
             try:
                 mv_list = []
                 payment_aml_rec = []
                 mv_line_dicts = []
                 ref = statement_line.ref
                 if ref:
-                    payment_id = account_payment_obj.search([('name', '=', ref)], limit=1)
+                    payment_id = reconciliation_data['payments_by_name'].get(ref)
                     if payment_id:
                         payment_aml_rec = payment_id.mapped('move_line_ids').filtered(
                             lambda line: line.account_internal_type == "liquidity")
@@ -311,51 +363,47 @@ class ShopifyPaymentReportEpt(models.Model):
                         else:
                             mv_dicts.update({'credit': statement_line.amount})
                         mv_list.append(mv_dicts)
-                invoices = invoice_obj.browse()
                 if not payment_aml_rec and not mv_list:
-                    for order in statement_line.shopify_order_ids:
-                        if statement_line.amount < 0.0:
-                            invoices += order.invoice_ids.filtered(
-                                lambda record: record.type == 'out_refund' and record.state == 'posted')
-                        else:
-                            invoices += order.invoice_ids.filtered(
-                                lambda record: record.type == 'out_invoice' and record.state == 'posted')
+                    invoice_type = 'out_refund' if statement_line.amount < 0.0 else 'out_invoice'
+                    invoices = statement_line.shopify_order_ids.mapped('invoice_ids').filtered(
+                        lambda record: record.type == invoice_type and record.state == 'posted')
+                    payment_ids = account_payment_obj.browse()
                     for invoice in invoices:
-                        if invoice.state == 'posted':
-                            payment_ids = account_payment_obj.search([('invoice_ids', 'in', invoice.ids)])
-                            if payment_ids:
-                                payment_aml_rec = payment_ids.mapped('move_line_ids').filtered(
-                                    lambda line: line.user_type_id.type == "liquidity")
-                            else:
-                                move_lines = invoices.mapped('line_ids').filtered(
-                                    lambda l: l.account_id.user_type_id.type == 'receivable' and not l.reconciled)
-                                move_line_total_amount = 0.0
-                                currency_ids = []
-                                for moveline in move_lines:
-                                    amount = moveline.debit - moveline.credit
-                                    amount_currency = 0.0
-                                    if moveline.amount_currency:
-                                        currency, amount_currency = self.convert_move_amount_currency(bank_statement,
-                                                                                                      moveline, amount)
-                                        if currency:
-                                            currency_ids.append(currency)
-                                    if amount_currency:
-                                        amount = amount_currency
-                                    mv_line_dicts.append({
-                                        'credit': abs(amount) if amount > 0.0 else 0.0,
-                                        'name': moveline.move_id.name,
-                                        'move_line': moveline,
-                                        'debit': abs(amount) if amount < 0.0 else 0.0
-                                    })
-                                    move_line_total_amount += amount
-
-                                if round(statement_line.amount, 10) == round(move_line_total_amount, 10) and (
-                                        not statement_line.currency_id or statement_line.currency_id.id == bank_statement.currency_id.id):
-                                    if currency_ids:
-                                        currency_ids = list(set(currency_ids))
-                                        if len(currency_ids) == 1:
-                                            statement_line.write({'amount_currency': move_line_total_amount,
-                                                                  'currency_id': currency_ids[0]})
+                        payment_ids |= payments_by_invoice.get(invoice.id, account_payment_obj.browse())
+                    if payment_ids:
+                        payment_aml_rec = payment_ids.mapped('move_line_ids').filtered(
+                            lambda line: line.user_type_id.type == "liquidity")
+                    if any(invoice.id not in payments_by_invoice for invoice in invoices):
+                        move_lines = move_line_obj.browse()
+                        for invoice in invoices:
+                            move_lines |= receivable_lines_by_invoice.get(invoice.id, move_line_obj.browse())
+                        move_line_total_amount = 0.0
+                        currency_ids = []
+                        for moveline in move_lines:
+                            amount = moveline.debit - moveline.credit
+                            amount_currency = 0.0
+                            if moveline.amount_currency:
+                                currency, amount_currency = self.convert_move_amount_currency(bank_statement,
+                                                                                              moveline, amount)
+                                if currency:
+                                    currency_ids.append(currency)
+                            if amount_currency:
+                                amount = amount_currency
+                            mv_line_dicts.append({
+                                'credit': abs(amount) if amount > 0.0 else 0.0,
+                                'name': moveline.move_id.name,
+                                'move_line': moveline,
+                                'debit': abs(amount) if amount < 0.0 else 0.0
+                            })
+                            move_line_total_amount += amount
+
+                        if round(statement_line.amount, 10) == round(move_line_total_amount, 10) and (
+                                not statement_line.currency_id or statement_line.currency_id.id == bank_statement.currency_id.id):
+                            if currency_ids:
+                                currency_ids = list(set(currency_ids))
+                                if len(currency_ids) == 1:
+                                    statement_line.write({'amount_currency': move_line_total_amount,
+                                                          'currency_id': currency_ids[0]})
                     already_reconciled = False
                     for aml_dict in mv_line_dicts:
                         if aml_dict['move_line'].reconciled:
@@ -370,24 +418,24 @@ class ShopifyPaymentReportEpt(models.Model):
                         already_reconciled = True
 
                     if already_reconciled:
-                        payout_logline_obj.create({'message': message,
-                                                   'instance_id': self.instance_id.id,
-                                                   'payout_transaction_ref': statement_line.shopify_transaction_id,
-                                                   'payout_id': self.id})
+                        log_line_vals.append({'message': message,
+                                              'instance_id': self.instance_id.id,
+                                              'payout_transaction_ref': statement_line.shopify_transaction_id,
+                                              'payout_id': self.id})
                         continue
 
-                statement_line.process_reconciliation(counterpart_aml_dicts=mv_line_dicts,
-                                                      payment_aml_rec=payment_aml_rec, new_aml_dicts=mv_list)
-                _logger.info(
-                    "Statement reconciled for Reference: {0}, Label: {1}, Amount: {2}.".format(statement_line.ref or '',
-                                                                                               statement_line.name or '',
-                                                                                               statement_line.amount))
+                reconciliations.append((statement_line, {'counterpart_aml_dicts': mv_line_dicts,
+                                                         'payment_aml_rec': payment_aml_rec,
+                                                         'new_aml_dicts': mv_list}))
             except Exception as error:
                 message = "statement line occurred while reconciliation : {0}.".format(error)
-                payout_logline_obj.create({'message': message,
-                                           'instance_id': self.instance_id.id,
-                                           'payout_transaction_ref': statement_line.shopify_transaction_id,
-                                           'payout_id': self.id})
+                log_line_vals.append({'message': message,
+                                      'instance_id': self.instance_id.id,
+                                      'payout_transaction_ref': statement_line.shopify_transaction_id,
+                                      'payout_id': self.id})
+        log_line_vals += self.submit_reconciliations(reconciliations)
+        if log_line_vals:
+            payout_logline_obj.create(log_line_vals)
         if statement_line_obj.search([('journal_entry_ids', '=', False), ('statement_id', '=', bank_statement.id)]):
             self.write({'state': 'partially_processed'})
         else:
@@ -395,90 +443,161 @@ class ShopifyPaymentReportEpt(models.Model):
 
         return True
 
+    def submit_reconciliations(self, reconciliations):
+        """
+        Reconciles the statement lines in batches of RECONCILIATION_BATCH_SIZE, each batch in one savepoint.
+        When a batch fails, it is rolled back and its lines are reconciled one by one, so only the failing
+        lines are logged.
+        :param reconciliations: List of tuples of statement line and values of process_reconciliation.
+        :return: List of values of the log lines of the failed reconciliations.
+        """
+        log_line_vals = []
+        for batch in split_every(RECONCILIATION_BATCH_SIZE, reconciliations):
+            try:
+                with self.env.cr.savepoint():
+                    for statement_line, reconciliation_vals in batch:
+                        statement_line.process_reconciliation(**reconciliation_vals)
+            except Exception as error:
+                _logger.info("Batch of statement lines could not be reconciled, reconciling them one by one: "
+                             "{0}".format(error))
+                batch_failed = True
+            else:
+                batch_failed = False
+
+            for statement_line, reconciliation_vals in batch:
+                if batch_failed:
+                    try:
+                        with self.env.cr.savepoint():
+                            statement_line.process_reconciliation(**reconciliation_vals)
+                    except Exception as error:
+                        message = "statement line occurred while reconciliation : {0}.".format(error)
+                        log_line_vals.append({'message': message,
+                                              'instance_id': self.instance_id.id,
+                                              'payout_transaction_ref': statement_line.shopify_transaction_id,
+                                              'payout_id': self.id})
+                        continue
+                _logger.info("Statement reconciled for Reference: {0}, Label: {1}, Amount: {2}.".format(
+                    statement_line.ref or '', statement_line.name or '', statement_line.amount))
+        return log_line_vals
+
     def get_payout_report(self, start_date, end_date, instance):
         """
         Use : Using this method get Payout records as per date given.
         Added by : Deval Jagad (02/06/2020)
         Task ID : 164126
+        The payouts and their transactions are fetched page by page, through the connection of the instance.
         :param start_date:From Date(year-month-day)
         :param end_date: To Date(year-month-day)
         :param instance: Browsable shopify instance.
         :return: True
         """
-        shopify_payout_report_line_obj = self.env['shopify.payout.report.line.ept']
-        log_book_obj = self.env['common.log.book.ept']
-        log_line_obj = self.env['common.log.lines.ept']
-        if not instance.shopify_api_url:
-            raise UserError(_("Shopify API URL is blank!"))
-
-        shop = instance.shopify_host.split("//")
-        headers = {"Accept": "application/json",
-                   "Content-Type": "application/json; charset=utf-8"}
-        params = {"status": 'paid', "date_min": start_date, "date_max": end_date, "limit": 250}
+        instance.connect_in_shopify()
+        currency_ids = {currency.name: currency.id for currency in self.env['res.currency'].search([])}
+        log_book_id = False
         try:
-            shopify_api_url = instance.shopify_api_url + 'payouts.json'
-            payout_ids = []
-            if len(shop) == 2:
-                url = "{0}//{1}:{2}@{3}/{4}".format(shop[0], instance.shopify_api_key, instance.shopify_password,
-                                                    shop[1], shopify_api_url)
-            else:
-                url = "https://{0}:{1}@{2}/{3}".format(instance.shopify_api_key, instance.shopify_password, shop[0],
-                                                       shopify_api_url)
-            response = requests.get(url, params=params, headers=headers)
-            payout_response = response.json()
-            payout_ids = payout_ids + payout_response.get('payouts', [])
+            payout_pages = shopify.PaginatedIterator(shopify.Payouts.find_raw(status='paid', date_min=start_date,
+                                                                              date_max=end_date, limit=250))
+            for payout_page in payout_pages:
+                existing_payout_ids = set(self.search(
+                    [('instance_id', '=', instance.id),
+                     ('payout_reference_id', 'in', [str(payout.get('id')) for payout in payout_page])]).mapped(
+                    'payout_reference_id'))
+                for payout in payout_page:
+                    _logger.info("Payout ID %s ", payout.get('id'))
+                    if str(payout.get('id')) in existing_payout_ids:
+                        continue
+                    # A failing payout is rolled back alone and logged, the other payouts are imported.
+                    try:
+                        with self.env.cr.savepoint():
+                            self.create_payout_with_transactions(payout, instance, currency_ids)
+                    except Exception as error:
+                        message = "Something is wrong while import the payout {0} : {1}".format(payout.get('id'),
+                                                                                                 error)
+                        log_book_id = self.create_payout_import_log(instance, message, log_book_id)
         except Exception as error:
             message = "Something is wrong while import the payout records : {0}".format(error)
-            model = "shopify.payout.report.ept"
-            model_id = self.env["common.log.lines.ept"].get_model_id(model)
-            log_book_id = log_book_obj.create({'type': 'import',
-                                               'module': 'shopify_ept',
-                                               'shopify_instance_id': instance.id,
-                                               'model_id': model_id and model_id.id,
-                                               'create_date': datetime.now(),
-                                               'active': True})
-            log_line_obj.create({'log_book_id': log_book_id,
-                                 'message': message,
-                                 'model_id': model_id and model_id.id or False,
-                                 })
+            self.create_payout_import_log(instance, message, log_book_id)
             return False
 
-        for payout in payout_ids:
-            _logger.info("Payout ID %s ", payout.get('id'))
-            payout_id = self.search([('instance_id', '=', instance.id),
-                                     ('payout_reference_id', '=', payout.get('id'))])
-            if payout_id:
-                continue
-            payout_vals = self.prepare_payout_vals(payout, instance)
-            payout_id = self.create(payout_vals)
-
-            if not payout_id:
-                continue
-            # Get Payout Transaction data and Create record.
-            transaction_ids = self.get_payout_transactions_data(payout_id, instance)
-            for transaction in transaction_ids:
-                _logger.info("Transaction ID %s ", transaction.get('id'))
-                transaction_vals = self.prepare_transaction_vals(transaction, payout_id,
-                                                                 instance)
-                shopify_payout_report_line_obj.create(transaction_vals)
-            # Create fees line
-            fees_amount = float(payout.get('summary').get('charges_fee_amount', 0.0)) + float(
-                payout.get('summary').get('refunds_fee_amount', 0.0)) + float(
-                payout.get('summary').get('adjustments_fee_amount', 0.0))
-            shopify_payout_report_line_obj.create({
-                'payout_id': payout_id.id or False,
-                'transaction_id': '',
-                'source_order_id': '',
-                'transaction_type': 'fees',
-                'order_id': '',
-                'amount': -fees_amount,
-                'fee': 0.0,
-                'net_amount': fees_amount,
-            })
-        instance.write({'payout_last_import_date': datetime.now()})
+        # The failed payouts are fetched again by the next import.
+        if not log_book_id:
+            instance.write({'payout_last_import_date': datetime.now()})
         return True
 
-    def prepare_transaction_vals(self, data, payout_id, instance):
+    def create_payout_with_transactions(self, payout, instance, currency_ids):
+        """
+        Use : Creates the payout record with its transaction lines and fees line.
+        :param payout: Payout data in dict{}.
+        :param instance: Browsable shopify instance.
+        :param currency_ids: Dictionary of currency name and id.
+        :return: Payout record.
+        """
+        shopify_payout_report_line_obj = self.env['shopify.payout.report.line.ept']
+        payout_vals = self.prepare_payout_vals(payout, instance, currency_ids)
+        payout_id = self.create(payout_vals)
+
+        # Get Payout Transaction data and Create records.
+        transaction_ids = self.get_payout_transactions_data(payout_id, instance)
+        order_ids = self.get_payout_order_ids(transaction_ids, instance)
+        transaction_vals_list = [self.prepare_transaction_vals(transaction, payout_id, instance, order_ids,
+                                                               currency_ids)
+                                 for transaction in transaction_ids]
+        # Create fees line
+        fees_amount = float(payout.get('summary').get('charges_fee_amount', 0.0)) + float(
+            payout.get('summary').get('refunds_fee_amount', 0.0)) + float(
+            payout.get('summary').get('adjustments_fee_amount', 0.0))
+        transaction_vals_list.append({
+            'payout_id': payout_id.id or False,
+            'transaction_id': '',
+            'source_order_id': '',
+            'transaction_type': 'fees',
+            'order_id': '',
+            'amount': -fees_amount,
+            'fee': 0.0,
+            'net_amount': fees_amount,
+        })
+        shopify_payout_report_line_obj.create(transaction_vals_list)
+        return payout_id
+
+    def create_payout_import_log(self, instance, message, log_book_id=False):
+        """
+        Use : Logs an error of the payout import, in a new log book if not given.
+        :param instance: Browsable shopify instance.
+        :param message: Message of the log line.
+        :param log_book_id: Log book of the import.
+        :return: Log book.
+        """
+        model_id = self.env["common.log.lines.ept"].get_model_id("shopify.payout.report.ept")
+        if not log_book_id:
+            log_book_id = self.env['common.log.book.ept'].create({'type': 'import',
+                                                                  'module': 'shopify_ept',
+                                                                  'shopify_instance_id': instance.id,
+                                                                  'model_id': model_id,
+                                                                  'create_date': datetime.now(),
+                                                                  'active': True})
+        self.env['common.log.lines.ept'].create({'log_book_id': log_book_id.id,
+                                                 'message': message,
+                                                 'model_id': model_id or False,
+                                                 })
+        return log_book_id
+
+    def get_payout_order_ids(self, transactions, instance):
+        """
+        Use : Finds the orders of the transactions with one search.
+        :param transactions: List of transaction data in dict{}.
+        :param instance: Browsable record of instance.
+        :return: Dictionary of Shopify order id and sale order id.
+        """
+        source_order_ids = list({str(transaction.get('source_order_id')) for transaction in transactions
+                                 if transaction.get('source_order_id')})
+        if not source_order_ids:
+            return {}
+        orders = self.env['sale.order'].search_read([('shopify_order_id', 'in', source_order_ids),
+                                                     ('shopify_instance_id', '=', instance.id)],
+                                                    ['shopify_order_id'], order='id desc')
+        return {order['shopify_order_id']: order['id'] for order in orders}
+
+    def prepare_transaction_vals(self, data, payout_id, instance, order_ids=None, currency_ids=None):
         """
         Use : Based on transaction data prepare transaction vals.
         Added by : Deval Jagad
@@ -487,10 +606,10 @@ class ShopifyPaymentReportEpt(models.Model):
         :param data: Transaction data in dict{}.
         :param payout_id: Browsable record of payout_id.
         :param instance: Browsable record of instance.
+        :param order_ids: Dictionary of Shopify order id and sale order id, searched when not given.
+        :param currency_ids: Dictionary of currency code and currency id, searched when not given.
         :return: Payout vals{}
         """
-        currency_obj = self.env['res.currency']
-        sale_order_obj = self.env['sale.order']
         transaction_id = data.get('id', '')
         source_order_id = data.get('source_order_id', '')
         transaction_type = data.get('type', '')
@@ -499,30 +618,29 @@ class ShopifyPaymentReportEpt(models.Model):
         net_amount = data.get('net', 0.0)
         currency = data.get('currency', '')
 
-        order_id = False
-        if source_order_id:
-            order_id = sale_order_obj.search([('shopify_order_id', '=', source_order_id),
-                                              ('shopify_instance_id', '=', instance.id)],
-                                             limit=1)
+        if order_ids is None:
+            order_ids = self.get_payout_order_ids([data], instance)
+        if currency_ids is None:
+            currency_ids = {currency_id.name: currency_id.id for currency_id in
+                            self.env['res.currency'].search([('name', '=', currency)], limit=1)}
 
         transaction_vals = {
             'payout_id': payout_id.id or False,
             'transaction_id': transaction_id,
             'source_order_id': source_order_id,
             'transaction_type': transaction_type,
-            'order_id': order_id and order_id.id,
+            'order_id': order_ids.get(str(source_order_id), False) if source_order_id else False,
             'amount': amount,
             'fee': fee,
             'net_amount': net_amount,
         }
 
-        currency_id = currency_obj.search([('name', '=', currency)], limit=1)
-        if currency_id:
-            transaction_vals.update({'currency_id': currency_id.id})
+        if currency_ids.get(currency):
+            transaction_vals.update({'currency_id': currency_ids.get(currency)})
 
         return transaction_vals
 
-    def prepare_payout_vals(self, data, instance):
+    def prepare_payout_vals(self, data, instance, currency_ids=None):
         """
         Use : Based on payout data prepare payout vals.
         Added by : Deval Jagad
@@ -530,9 +648,9 @@ class ShopifyPaymentReportEpt(models.Model):
         Task ID : 164126
         :param data: Payout data in dict{}.
         :param instance: Browsable record of instance.
+        :param currency_ids: Dictionary of currency code and currency id, searched when not given.
         :return: Payout vals{}
         """
-        currency_obj = self.env['res.currency']
         payout_reference_id = data.get('id')
         payout_date = data.get('date', '')
         payout_status = data.get('status', '')
@@ -546,9 +664,11 @@ class ShopifyPaymentReportEpt(models.Model):
             'amount': amount,
             'instance_id': instance.id
         }
-        currency_id = currency_obj.search([('name', '=', currency)], limit=1)
-        if currency_id:
-            payout_vals.update({'currency_id': currency_id.id})
+        if currency_ids is None:
+            currency_ids = {currency_id.name: currency_id.id for currency_id in
+                            self.env['res.currency'].search([('name', '=', currency)], limit=1)}
+        if currency_ids.get(currency):
+            payout_vals.update({'currency_id': currency_ids.get(currency)})
         return payout_vals
 
     def get_payout_transactions_data(self, payout_id, instance):
@@ -557,32 +677,14 @@ class ShopifyPaymentReportEpt(models.Model):
         Added by : Deval Jagad
         Added on : 05/06/2020
         Task ID : 164126
-        :param payout_id:
-        :param instance:
-        :return:
-        """
-        shop = instance.shopify_host.split("//")
-        headers = {"Accept": "application/json",
-                   "Content-Type": "application/json; charset=utf-8"}
-        params = {'payout_id': payout_id.payout_reference_id, "limit": 250}
-        shopify_api_url = instance.shopify_api_url + 'balance/transactions.json'
-        transaction_ids = []
-        if len(shop) == 2:
-            url = "{0}//{1}:{2}@{3}/{4}".format(shop[0], instance.shopify_api_key, instance.shopify_password,
-                                                shop[1], shopify_api_url)
-        else:
-            url = "https://{0}:{1}@{2}/{3}".format(instance.shopify_api_key, instance.shopify_password,
-                                                   shop[0],
-                                                   shopify_api_url)
-        response = requests.get(url, params=params, headers=headers)
-        if response.status_code not in [200, 201]:
-            return True
-        try:
-            transaction_response = response.json()
-        except Exception as error:
-            raise UserError(error)
-        transaction_ids = transaction_ids + transaction_response.get('transactions', [])
-        return transaction_ids
+        All pages of the transactions are fetched, the next page while the current one is decoded.
+        :param payout_id: Browsable record of payout.
+        :param instance: Browsable record of instance.
+        :return: List of transaction data in dict{}.
+        """
+        instance.connect_in_shopify()
+        transactions = shopify.Transactions.find_raw(payout_id=payout_id.payout_reference_id, limit=250)
+        return list(shopify.PaginatedIterator(transactions, prefetch=True).items())
 
     def closed_statement(self):
         """
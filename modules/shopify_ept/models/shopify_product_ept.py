@@ -1,17 +1,29 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import json
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 
 from odoo import models, fields, api
-from odoo.exceptions import UserError
 from .. import shopify
 from ..shopify.pyactiveresource.connection import ClientError
 
 _logger = logging.getLogger("Shopify")
 
+INVENTORY_API_VERSION = "2024-07"
+INVENTORY_CHUNK_SIZE = 250
+SET_INVENTORY_QUERY = """
+mutation inventorySetQuantities($input: InventorySetQuantitiesInput!) {
+  inventorySetQuantities(input: $input) {
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
 
 class ShopifyProductProductEpt(models.Model):
     _name = "shopify.product.product.ept"
@@ -326,11 +338,6 @@ class ShopifyProductProductEpt(models.Model):
                 continue
             try:
                 new_product = shopify.Product().find(template.shopify_tmpl_id)
-            except ClientError as error:
-                if hasattr(error, "response"):
-                    if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                        time.sleep(5)
-                        new_product = shopify.Product().find(template.shopify_tmpl_id)
             except Exception as error:
                 message = "Template %s not found in shopify while updating Product.\nError: %s" % (
                     template.shopify_tmpl_id, str(error))
@@ -515,10 +522,8 @@ class ShopifyProductProductEpt(models.Model):
         try:
             shopify_images = shopify.Image().find(product_id=int(shopify_template.shopify_tmpl_id))
         except ClientError as error:
-            if hasattr(error, "response"):
-                if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(5)
-                    shopify_images = shopify.Image().find(product_id=shopify_template.shopify_tmpl_id)
+            _logger.info("Images of product %s not found in Shopify.\nError: %s" % (shopify_template.shopify_tmpl_id,
+                                                                                   str(error)))
 
         for image in shopify_template.shopify_image_ids:
             if not image.shopify_image_id:
@@ -544,7 +549,7 @@ class ShopifyProductProductEpt(models.Model):
         return True
 
     @api.model
-    def export_stock_in_shopify(self, instance, product_ids):
+    def export_stock_in_shopify(self, instance, product_ids, force_export=False):
         """
         Find products with below condition
             1. shopify_instance_id = instance.id
@@ -553,13 +558,19 @@ class ShopifyProductProductEpt(models.Model):
         Find Shopify location for the particular instance
         Check export_stock_warehouse_ids is configured in location or not
         Get the total stock of the product with configured warehouses and update that stock in shopify location
-        here we use InventoryLevel shopify API for export stock
+        Stock of all the products and locations is set together by shopify_set_inventory_levels.
+        Only the quantities, which differ from the ones last set in Shopify as per the inventory ledger, are sent
+        unless force_export is passed.
         @author: Maulik Barad on Date 15-Sep-2020.
         """
         common_log_line_obj = self.env["common.log.lines.ept"]
         product_obj = self.env["product.product"]
+        inventory_ledger_obj = self.env["shopify.inventory.ledger.ept"]
 
         log_line_array = []
+        inventory_levels = []
+        level_products = {}
+        level_ledger_quantities = {}
         model = "shopify.product.product.ept"
         model_id = common_log_line_obj.get_model_id(model)
 
@@ -569,7 +580,7 @@ class ShopifyProductProductEpt(models.Model):
         if not shopify_products:
             return True
 
-        instance.connect_in_shopify()
+        pushed_quantities = {} if force_export else inventory_ledger_obj.get_shopify_pushed_quantities(instance)
         location_ids = self.env["shopify.location.ept"].search([("instance_id", "=", instance.id)])
         if not location_ids:
             message = "Location not found for instance %s while update stock" % instance.name
@@ -605,34 +616,112 @@ class ShopifyProductProductEpt(models.Model):
                         if percentage_stock < quantity:
                             quantity = percentage_stock
 
-                    try:
-                        shopify.InventoryLevel.set(location_id.shopify_location_id, shopify_product.inventory_item_id,
-                                                   int(quantity))
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(5)
-                                shopify.InventoryLevel.set(location_id.shopify_location_id,
-                                                           shopify_product.inventory_item_id,
-                                                           int(quantity))
-                                continue
-                            message = "Error while Export stock for Product ID: %s & Product Name: '%s' for instance:" \
-                                      "'%s'\nError: %s\n%s" % (odoo_product.id, odoo_product.name, instance.name,
-                                                               str(error.response.code) + " " + error.response.msg,
-                                                               json.loads(error.response.body.decode()).get("errors")[0]
-                                                               )
-                            log_line_array = self.shopify_create_log(message, model_id, odoo_product, log_line_array)
-
-                    except Exception as error:
-                        message = "Error while Export stock for Product ID: %s & Product Name: '%s' for instance: " \
-                                  "'%s'\nError: %s" % (odoo_product.id, odoo_product.name, instance.name, str(error))
-                        log_line_array = self.shopify_create_log(message, model_id, odoo_product, log_line_array)
+                    ledger_key = (shopify_product.id, location_id.id)
+                    if pushed_quantities.get(ledger_key) == int(quantity):
+                        continue
+                    inventory_level = (str(shopify_product.inventory_item_id), str(location_id.shopify_location_id))
+                    inventory_levels.append(inventory_level + (int(quantity),))
+                    level_products[inventory_level] = odoo_product
+                    level_ledger_quantities[inventory_level] = (ledger_key, int(quantity))
+
+        if not inventory_levels:
+            _logger.info("Stock of the products is already up to date in Shopify for instance %s." % instance.name)
+
+        inventory_results = self.shopify_set_inventory_levels(instance, inventory_levels)
+        inventory_ledger_obj.set_shopify_pushed_quantities(
+            instance, dict(level_ledger_quantities[inventory_level] for inventory_level, error in
+                           inventory_results.items() if not error))
+        for inventory_level, error in inventory_results.items():
+            if not error:
+                continue
+            odoo_product = level_products.get(inventory_level)
+            message = "Error while Export stock for Product ID: %s & Product Name: '%s' for instance: " \
+                      "'%s'\nError: %s" % (odoo_product.id, odoo_product.name, instance.name, error)
+            log_line_array = self.shopify_create_log(message, model_id, odoo_product, log_line_array)
 
         if len(log_line_array) > 0:
             self.create_log(log_line_array, "export", instance)
 
         return True
 
+    def shopify_set_inventory_levels(self, instance, inventory_levels):
+        """
+        Sets the available quantity of the inventory items at the Shopify locations with the GraphQL
+        inventorySetQuantities mutation, 250 items per call. The calls run in a bounded pool of threads and
+        are paced by the GraphQL cost bucket of the store.
+        @param instance: Shopify Instance.
+        @param inventory_levels: List of tuples of inventory item id, Shopify location id and quantity.
+        @return: Dictionary of tuple of inventory item id and location id as string and error message or False.
+        """
+        if not inventory_levels:
+            return {}
+        instance.connect_in_shopify()
+        graphql = shopify.GraphQL(version=INVENTORY_API_VERSION)
+        bucket = shopify.GraphQLCostBucket.for_shop(instance.shopify_host)
+
+        chunks = [inventory_levels[offset:offset + INVENTORY_CHUNK_SIZE]
+                  for offset in range(0, len(inventory_levels), INVENTORY_CHUNK_SIZE)]
+        inventory_results = {}
+        with ThreadPoolExecutor(max_workers=max(instance.shopify_stock_export_threads, 1),
+                                thread_name_prefix="shopify_stock_export") as executor:
+            for chunk_results in executor.map(partial(self.push_shopify_inventory_levels, graphql, bucket), chunks):
+                inventory_results.update(chunk_results)
+        return inventory_results
+
+    def push_shopify_inventory_levels(self, graphql, bucket, inventory_levels):
+        """
+        Runs in a worker thread and sets the quantities of one chunk of inventory levels.
+        Shopify rejects the whole mutation when any item has an error, so the items having errors are
+        removed and the rest of the chunk is sent again.
+        @param graphql: GraphQL client of the store.
+        @param bucket: GraphQL cost bucket of the store.
+        @param inventory_levels: List of tuples of inventory item id, Shopify location id and quantity.
+        @return: Dictionary of tuple of inventory item id and location id as string and error message or False.
+        """
+        inventory_results = {}
+        for _ in range(3):
+            if not inventory_levels:
+                break
+            keys = [(str(item_id), str(location_id)) for item_id, location_id, _quantity in inventory_levels]
+            variables = {"input": {"name": "available", "reason": "correction", "ignoreCompareQuantity": True,
+                                   "quantities": [{"inventoryItemId": "gid://shopify/InventoryItem/%s" % item_id,
+                                                   "locationId": "gid://shopify/Location/%s" % location_id,
+                                                   "quantity": quantity}
+                                                  for item_id, location_id, quantity in inventory_levels]}}
+            try:
+                result = bucket.execute(graphql, SET_INVENTORY_QUERY, variables)
+            except Exception as error:
+                inventory_results.update(dict.fromkeys(keys, str(error)))
+                return inventory_results
+
+            if result.get("errors"):
+                message = "; ".join(error.get("message", "") for error in result.get("errors"))
+                inventory_results.update(dict.fromkeys(keys, message))
+                return inventory_results
+
+            user_errors = ((result.get("data") or {}).get("inventorySetQuantities") or {}).get("userErrors")
+            if not user_errors:
+                inventory_results.update(dict.fromkeys(keys, False))
+                return inventory_results
+
+            failed_indexes = set()
+            for user_error in user_errors:
+                field = user_error.get("field") or []
+                if len(field) > 2 and str(field[2]).isdigit() and int(field[2]) < len(keys):
+                    failed_indexes.add(int(field[2]))
+                    inventory_results[keys[int(field[2])]] = user_error.get("message")
+                else:
+                    # The error is not about an item, so the chunk can not be sent without it.
+                    for key in keys:
+                        inventory_results[key] = inventory_results.get(key) or user_error.get("message")
+                    return inventory_results
+            inventory_levels = [inventory_level for index, inventory_level in enumerate(inventory_levels)
+                                if index not in failed_indexes]
+
+        for item_id, location_id, _quantity in inventory_levels:
+            inventory_results[(str(item_id), str(location_id))] = "Stock not set after retrying the other items."
+        return inventory_results
+
     def check_stock(self, instance, product_ids, prod_obj, warehouse):
         """
         This Method relocates check type of stock.
@@ -693,9 +782,12 @@ class ShopifyProductProductEpt(models.Model):
                 _logger.info(message)
                 return False
 
+            inventory_item_products = {shopify_product.inventory_item_id: shopify_product
+                                       for shopify_product in templates if shopify_product.inventory_item_id}
+            imported_quantities = {}
             for location_id in location_ids:
                 stock_inventory_array = []
-                product_ids_list = []
+                product_ids = set()
                 shopify_location_warehouse = location_id.import_stock_warehouse_id or False
                 if not shopify_location_warehouse:
                     message = "No Warehouse found for importing stock in Shopify Location: %s" % location_id.name
@@ -703,40 +795,39 @@ class ShopifyProductProductEpt(models.Model):
                     _logger.info(message)
                     continue
 
-                try:
-                    inventory_levels = shopify.InventoryLevel.find(location_ids=location_id.shopify_location_id,
-                                                                   limit=250)
-                    if len(inventory_levels) == 250:
-                        inventory_levels = self.shopify_list_all_inventory_level(inventory_levels)
-                except Exception as error:
-                    message = "Error while import stock for instance %s\nError: %s" % (
-                        instance.name, str(error.response.code) + " " + error.response.msg)
-                    log_line_array = self.shopify_create_log(message, model_id, False, log_line_array)
-                    _logger.info(message)
-                    self.create_log(log_line_array, "import", instance)
-                    return False
-
-                _logger.info("Length of the total inventory item id : %s" % len(inventory_levels))
                 lot_stock_id = location_id.import_stock_warehouse_id.lot_stock_id.id
-                for inventory_level in inventory_levels:
-                    inventory_level = inventory_level.to_dict()
-                    inventory_item_id = inventory_level.get("inventory_item_id")
-                    qty = inventory_level.get("available")
-
-                    shopify_product = self.env["shopify.product.product.ept"].search(
-                        [("inventory_item_id", "=", inventory_item_id), ("exported_in_shopify", "=", True),
-                         ("shopify_instance_id", "=", instance.id)], limit=1)
-                    if shopify_product:
+                level_count = 0
+                try:
+                    inventory_levels = shopify.InventoryLevel.find_raw(location_ids=location_id.shopify_location_id,
+                                                                       limit=250)
+                    for inventory_level in self.shopify_list_all_inventory_level(inventory_levels):
+                        level_count += 1
+                        qty = inventory_level.get("available")
+
+                        shopify_product = inventory_item_products.get(str(inventory_level.get("inventory_item_id")))
+                        if not shopify_product:
+                            continue
+                        if qty is not None:
+                            imported_quantities[(shopify_product.id, location_id.id)] = int(qty)
                         product_id = shopify_product.product_id
-                        if product_id not in product_ids_list:
+                        if product_id.id not in product_ids:
                             stock_inventory_line = {
                                 "product_id": product_id,
                                 "location_id": lot_stock_id,
                                 "product_qty": qty
                             }
                             stock_inventory_array.append(stock_inventory_line)
-                            product_ids_list.append(product_id)
+                            product_ids.add(product_id.id)
+                except Exception as error:
+                    if hasattr(error, "response"):
+                        error = str(error.response.code) + " " + error.response.msg
+                    message = "Error while import stock for instance %s\nError: %s" % (instance.name, str(error))
+                    log_line_array = self.shopify_create_log(message, model_id, False, log_line_array)
+                    _logger.info(message)
+                    self.create_log(log_line_array, "import", instance)
+                    return False
 
+                _logger.info("Length of the total inventory item id : %s" % level_count)
                 if len(stock_inventory_array) > 0:
                     inventories = stock_inventory_obj.create_stock_inventory_ept(
                         stock_inventory_array, location_id.import_stock_warehouse_id.lot_stock_id, False)
@@ -746,6 +837,9 @@ class ShopifyProductProductEpt(models.Model):
                         inventories.write({'is_shopify_product_adjustment': True, 'name': inventory_name})
                         _logger.info("Created %s." % inventory_name)
 
+            # Stock now known to be in Shopify is not exported again until it changes in Odoo.
+            self.env["shopify.inventory.ledger.ept"].set_shopify_pushed_quantities(instance, imported_quantities)
+
         if len(log_line_array) > 0:
             self.create_log(log_line_array, "import", instance)
 
@@ -754,33 +848,14 @@ class ShopifyProductProductEpt(models.Model):
     def shopify_list_all_inventory_level(self, result):
         """
             This method used to call the page wise data import for product stock from Shopify to Odoo.
+            It yields the inventory levels page by page, so the levels of big locations are not kept in memory,
+            and the next page is fetched from Shopify while the current one is processed.
             @param : self, result, shopify_location_id
             @author: Angel Patel @Emipro Technologies Pvt. Ltd on date 21/12/2019.
             Modify by Haresh Mori on 28/12/2019 API and Pagination changes
         """
-        sum_inventory_list = []
-        catch = ""
-        while result:
-            page_info = ""
-            sum_inventory_list += result
-            link = shopify.ShopifyResource.connection.response.headers.get("Link")
-            if not link or not isinstance(link, str):
-                return sum_inventory_list
-            for page_link in link.split(","):
-                if page_link.find("next") > 0:
-                    page_info = page_link.split(";")[0].strip("<>").split("page_info=")[1]
-                    try:
-                        result = shopify.InventoryLevel.find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(5)
-                                result = shopify.InventoryLevel.find(page_info=page_info, limit=250)
-                    except Exception as error:
-                        raise UserError(error)
-            if catch == page_info:
-                break
-        return sum_inventory_list
+        for inventory_level in shopify.PaginatedIterator(result, prefetch=True).items():
+            yield inventory_level
 
     def shopify_create_log(self, message=False, model_id=False, product=False, log_line_array=False):
         """
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+from .res_partner import SHOPIFY_ADDRESS_KEY_FIELDS
 
+# Order of the partners found by email, the oldest partner of an email is used.
+SHOPIFY_EMAIL_PARTNER_ORDER = "id"
 
 class ShopifyResPartnerEpt(models.Model):
     _name = "shopify.res.partner.ept"
@@ -11,9 +14,64 @@ class ShopifyResPartnerEpt(models.Model):
     shopify_instance_id = fields.Many2one("shopify.instance.ept", "Instances")
     shopify_customer_id = fields.Char("Shopify Customer Id")
 
-    def shopify_create_contact_partner(self, vals, instance, queue_line, log_book):
+    def prepare_shopify_partner_cache(self, customers, instance):
+        """
+        Resolves the existing partners of a batch of Shopify customers with three searches: the Shopify
+        customers, the partners by normalised email and the addresses of those partners by their match key.
+        @param customers: List of Shopify customer data.
+        @param instance: Shopify Instance.
+        @return: Dictionary used as partner_cache by shopify_create_contact_partner and
+        shopify_create_or_update_address.
+        """
+        partner_obj = self.env["res.partner"]
+        partner_cache = {"shopify_partners": {}, "email_partners": {}, "address_partners": {},
+                         "address_parent_ids": set()}
+
+        customer_ids = [str(customer.get("id")) for customer in customers if customer.get("id")]
+        if customer_ids:
+            for shopify_partner in self.search([("shopify_customer_id", "in", customer_ids),
+                                                ("shopify_instance_id", "=", instance.id)]):
+                partner_cache["shopify_partners"].setdefault(shopify_partner.shopify_customer_id,
+                                                             shopify_partner.partner_id)
+
+        partner_cache["email_partners"] = self.search_shopify_partners_by_email(
+            [customer.get("email") for customer in customers])
+
+        parent_ids = set(partner.id for partner in partner_cache["shopify_partners"].values()) | set(
+            partner.id for partner in partner_cache["email_partners"].values())
+        if parent_ids:
+            for partner in partner_obj.search([("parent_id", "in", list(parent_ids))]):
+                self.add_shopify_address_to_cache(partner, partner_cache)
+        partner_cache["address_parent_ids"] = parent_ids
+        return partner_cache
+
+    def search_shopify_partners_by_email(self, emails):
+        """
+        Finds the partners of the emails with one search. When several partners have the same email, the first
+        one as per SHOPIFY_EMAIL_PARTNER_ORDER is used, with and without the partner cache.
+        @param emails: List of emails.
+        @return: Dictionary of normalised email and partner.
+        """
+        email_partners = {}
+        emails = list({tools.email_normalize(email) for email in emails if email} - {False})
+        if emails:
+            for partner in self.env["res.partner"].search([("email_normalized", "in", emails)],
+                                                          order=SHOPIFY_EMAIL_PARTNER_ORDER):
+                email_partners.setdefault(partner.email_normalized, partner)
+        return email_partners
+
+    def add_shopify_address_to_cache(self, partner, partner_cache):
+        """
+        Adds an address partner in the partner cache, under its parent and match key.
+        """
+        key = (partner.parent_id.id, partner.shopify_address_key)
+        partner_cache["address_partners"][key] = partner_cache["address_partners"].get(key, partner) | partner
+
+    def shopify_create_contact_partner(self, vals, instance, queue_line, log_book, partner_cache=None):
         """
         This method used to create a contact type customer.
+        @param partner_cache: Partners resolved by prepare_shopify_partner_cache, searched one by one when not
+        given.
         @author: Maulik Barad on Date 09-Sep-2020.
         """
         partner_obj = self.env["res.partner"]
@@ -32,21 +90,32 @@ class ShopifyResPartnerEpt(models.Model):
             return False
 
         name = "%s %s" % (first_name, last_name)
-        shopify_partner = self.search([("shopify_customer_id", "=", shopify_customer_id),
-                                       ("shopify_instance_id", "=", shopify_instance_id)], limit=1)
-        if shopify_partner:
-            partner = shopify_partner.partner_id
-            return partner
+        if partner_cache is not None:
+            partner = partner_cache["shopify_partners"].get(str(shopify_customer_id))
+            if partner:
+                return partner
+        else:
+            shopify_partner = self.search([("shopify_customer_id", "=", shopify_customer_id),
+                                           ("shopify_instance_id", "=", shopify_instance_id)], limit=1)
+            if shopify_partner:
+                partner = shopify_partner.partner_id
+                return partner
 
         shopify_partner_values = {"shopify_customer_id": shopify_customer_id,
                                   "shopify_instance_id": shopify_instance_id}
         if email:
-            partner = partner_obj.search_partner_by_email(email)
+            if partner_cache is not None:
+                email_partners = partner_cache["email_partners"]
+            else:
+                email_partners = self.search_shopify_partners_by_email([email])
+            partner = email_partners.get(tools.email_normalize(email))
 
             if partner:
                 partner.write({"is_shopify_customer": True})
                 shopify_partner_values.update({"partner_id": partner.id})
                 self.create(shopify_partner_values)
+                if partner_cache is not None:
+                    partner_cache["shopify_partners"][str(shopify_customer_id)] = partner
                 return partner
 
         partner_vals = self.shopify_prepare_partner_vals(vals.get("default_address", {}), instance)
@@ -61,13 +130,24 @@ class ShopifyResPartnerEpt(models.Model):
 
         shopify_partner_values.update({"partner_id": partner.id})
         self.create(shopify_partner_values)
+        if partner_cache is not None:
+            # A new partner has no addresses yet, so its addresses are not searched.
+            partner_cache["shopify_partners"][str(shopify_customer_id)] = partner
+            partner_cache["address_parent_ids"].add(partner.id)
+            if partner.email_normalized:
+                partner_cache["email_partners"].setdefault(partner.email_normalized, partner)
 
         return partner
 
     @api.model
-    def shopify_create_or_update_address(self, shopify_customer_data, instance, parent_partner, partner_type="contact"):
+    def shopify_create_or_update_address(self, shopify_customer_data, instance, parent_partner, partner_type="contact",
+                                         partner_cache=None):
         """
         Creates or updates existing partner from Shopify customer's data.
+        The existing address is found by its match key, in the partner cache when its parent is in it. When the
+        key misses, the address is searched by its non-empty fields, so addresses having more data in Odoo, like
+        a phone or a company, are still matched.
+        @param partner_cache: Partners resolved by prepare_shopify_partner_cache.
         @author: Maulik Barad on Date 09-Sep-2020.
         """
         partner_obj = self.env["res.partner"]
@@ -80,18 +160,25 @@ class ShopifyResPartnerEpt(models.Model):
 
         company_name = shopify_customer_data.get("company")
         partner_vals = self.shopify_prepare_partner_vals(shopify_customer_data, instance)
-        address_key_list = ["street", "street2", "city", "zip", "phone", "state_id", "country_id"]
-
         if company_name:
-            address_key_list.append("company_name")
             partner_vals.update({"company_name": company_name})
 
-        partner = partner_obj._find_partner_ept(partner_vals, address_key_list,
-                                                [("parent_id", "=", parent_partner.id), ("type", "=", partner_type)])
-
+        address_key = partner_obj.get_shopify_address_key(partner_vals)
+        if partner_cache is not None and parent_partner.id in partner_cache["address_parent_ids"]:
+            partners = partner_cache["address_partners"].get((parent_partner.id, address_key), partner_obj)
+        else:
+            partners = partner_obj.search([("parent_id", "=", parent_partner.id),
+                                           ("shopify_address_key", "=", address_key)])
+        partner = partners.filtered(lambda x: x.type == partner_type)[:1] or partners[:1]
         if not partner:
-            partner = partner_obj._find_partner_ept(partner_vals, address_key_list,
-                                                    [("parent_id", "=", parent_partner.id)])
+            partner = partner_obj._find_partner_ept(partner_vals, SHOPIFY_ADDRESS_KEY_FIELDS,
+                                                    [("parent_id", "=", parent_partner.id),
+                                                     ("type", "=", partner_type)])
+            if not partner:
+                partner = partner_obj._find_partner_ept(partner_vals, SHOPIFY_ADDRESS_KEY_FIELDS,
+                                                        [("parent_id", "=", parent_partner.id)])
+            if partner and partner_cache is not None and parent_partner.id in partner_cache["address_parent_ids"]:
+                partner_cache["address_partners"][(parent_partner.id, address_key)] = partner
         if partner:
             return partner
 
@@ -99,6 +186,8 @@ class ShopifyResPartnerEpt(models.Model):
         partner = partner_obj.create(partner_vals)
 
         company_name and partner.write({"company_name": company_name})
+        if partner_cache is not None and parent_partner.id in partner_cache["address_parent_ids"]:
+            self.add_shopify_address_to_cache(partner, partner_cache)
         return partner
 
     def shopify_prepare_partner_vals(self, vals, instance):
@@ -1,12 +1,9 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import base64
 import hashlib
 import json
 import logging
-import time
 from datetime import datetime
-import requests
 from dateutil import parser
 import pytz
 
@@ -17,6 +14,17 @@ from ..shopify.pyactiveresource.connection import ClientError
 utc = pytz.utc
 _logger = logging.getLogger("Shopify : Product Import")
 
+# Keys of the product response which are applied to Odoo, by section. A section is applied again only when the
+# hash of its keys changes, so moves of other keys, like the updated_at of the variants, are ignored.
+PRODUCT_SYNC_SECTIONS = {
+    "details": ("title", "body_html", "product_type", "tags", "created_at", "published_at", "published_scope"),
+    "options": ("name", "position", "values"),
+    "variants": ("id", "position", "sku", "barcode", "price", "option1", "option2", "option3", "inventory_item_id",
+                 "inventory_management", "inventory_policy", "taxable", "created_at"),
+    "images": ("id", "src", "variant_ids")}
+# Published scope of the REST API by the publishing state of the template.
+SHOPIFY_PUBLISHED_SCOPES = {"published_global": "global", "published_web": "web"}
+
 
 class ProductCategory(models.Model):
     """
@@ -55,6 +63,14 @@ class ShopifyProductTemplateEpt(models.Model):
     shopify_product_category = fields.Many2one("product.category", "Product Category")
     active = fields.Boolean(default=True)
     shopify_image_ids = fields.One2many("shopify.product.image.ept", "shopify_template_id")
+    shopify_details_hash = fields.Char(copy=False, readonly=True,
+                                       help="Hash of the product details last applied from Shopify.")
+    shopify_options_hash = fields.Char(copy=False, readonly=True,
+                                       help="Hash of the product options last applied from Shopify.")
+    shopify_variants_hash = fields.Char(copy=False, readonly=True,
+                                        help="Hash of the product variants last applied from Shopify.")
+    shopify_images_hash = fields.Char(copy=False, readonly=True,
+                                      help="Hash of the product images last applied from Shopify.")
 
     @api.depends("shopify_product_ids.exported_in_shopify", "shopify_product_ids.variant_id")
     def _compute_total_sync_variants(self):
@@ -171,10 +187,6 @@ class ShopifyProductTemplateEpt(models.Model):
             result = [shopify.Product().find(template_id)]
         except ClientError as error:
             if hasattr(error, "response"):
-                if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(5)
-                    result = [shopify.Product().find(template_id)]
-                    return result
                 message = "Error while importing product for order. Product ID: %s.\nError: %s\n%s" % (
                     template_id, str(error.response.code) + " " + error.response.msg,
                     json.loads(error.response.body.decode()).get("errors")[0])
@@ -260,7 +272,7 @@ class ShopifyProductTemplateEpt(models.Model):
         return product_category
 
     def shopify_sync_products(self, product_data_line_id, shopify_tmpl_id, instance, log_book_id,
-                              order_data_line_id=False):
+                              order_data_line_id=False, prefetched_data=None):
         """
         This method is used to sync products from queue line or shopify template id for Order.
         @param product_data_line_id: Product Queue Line.
@@ -269,6 +281,8 @@ class ShopifyProductTemplateEpt(models.Model):
         @param instance: Shopify Instance.
         @param log_book_id: Common Log Book.
         @param order_data_line_id: Order Queue Line, when needed to import a product for a order.
+        @param prefetched_data: Data of the queue prepared by prefetch_product_queue_data. Templates and variants
+        not found in it are searched, as they may be created by the previous lines of the queue.
         @author: Maulik Barad on Date 01-Sep-2020.
         """
         common_log_line_obj = self.env["common.log.lines.ept"]
@@ -286,8 +300,10 @@ class ShopifyProductTemplateEpt(models.Model):
             remove_dict_result = result.pop()
             template_data = remove_dict_result.to_dict()
         else:
-            template_data = product_data_line_id.synced_product_data
-            template_data = json.loads(template_data)
+            template_data = (prefetched_data or {}).get("product_data", {}).get(product_data_line_id.id)
+            if template_data is None:
+                template_data = self.env["data.queue.mixin.ept"].decode_shopify_queue_data(
+                    product_data_line_id.synced_product_data)
             skip_existing_product = product_data_line_id.product_data_queue_id.skip_existing_product
 
         if not template_data:
@@ -298,22 +314,44 @@ class ShopifyProductTemplateEpt(models.Model):
 
         product_category = self.get_product_category(template_data.get("product_type"))
 
-        shopify_template = self.search(
-            [("shopify_tmpl_id", "=", template_data.get("id")),
-             ("shopify_instance_id", "=", instance.id)])
-
+        variant_cache = (prefetched_data or {}).get("variants")
+        shopify_template = self.browse((prefetched_data or {}).get("templates", {}).get(
+            str(template_data.get("id")))).exists()
+        if not shopify_template:
+            shopify_template = self.search(
+                [("shopify_tmpl_id", "=", template_data.get("id")),
+                 ("shopify_instance_id", "=", instance.id)])
+
+        # Products of a bulk operation have no published scope, so the scope of the template is kept.
+        if "published_scope" not in template_data and shopify_template:
+            template_data["published_scope"] = SHOPIFY_PUBLISHED_SCOPES.get(shopify_template[:1].website_published)
+
+        section_hashes = self.prepare_shopify_section_hashes(template_data, instance)
+        log_line_count = len(log_book_id.log_lines) if log_book_id else 0
+        changed_sections = True
         if shopify_template:
-            self.sync_product_with_existing_template(shopify_template, skip_existing_product, template_data, instance,
-                                                     product_category, model_id, log_book_id, product_data_line_id,
-                                                     order_data_line_id)
-            if not skip_existing_product and instance.sync_product_with_images:
-                shopify_template.shopify_sync_product_images(template_data)
+            changed_sections = shopify_template.get_shopify_changed_sections(template_data, section_hashes)
+            if not changed_sections:
+                _logger.info("Product- %s || %s is up to date, skipped." % (template_data.get("id"),
+                                                                           template_data.get("title")))
+            elif not skip_existing_product:
+                self.sync_product_with_existing_template(shopify_template, skip_existing_product, template_data,
+                                                         instance, product_category, model_id, log_book_id,
+                                                         product_data_line_id, order_data_line_id, changed_sections,
+                                                         variant_cache)
+                if instance.sync_product_with_images and changed_sections & {"images", "variants"}:
+                    shopify_template.shopify_sync_product_images(template_data)
         else:
             shopify_template = self.sync_new_product(template_data, instance, product_category, model_id, log_book_id,
-                                                     product_data_line_id, order_data_line_id)
+                                                     product_data_line_id, order_data_line_id, variant_cache)
             if shopify_template and instance.sync_product_with_images:
                 shopify_template.shopify_sync_product_images(template_data)
 
+        # The hashes are kept only when the whole product is applied, so a product with errors is applied again.
+        if shopify_template and changed_sections and not skip_existing_product and log_line_count == (
+                len(log_book_id.log_lines) if log_book_id else 0):
+            shopify_template.write(section_hashes)
+
         if shopify_template and product_data_line_id:
             product_data_line_id.write({"state": "done", "last_process_date": datetime.now()})
 
@@ -322,17 +360,64 @@ class ShopifyProductTemplateEpt(models.Model):
 
         return shopify_template
 
+    def prepare_shopify_section_hashes(self, template_data, instance):
+        """
+        Prepares the hash of every section of the product response, as per PRODUCT_SYNC_SECTIONS.
+        Images are hashed only when the images are synced, so they are applied once the option is set.
+        @param template_data: Data of Shopify Template.
+        @param instance: Shopify Instance.
+        @return: Dictionary of hash field name and hash.
+        """
+        sections = {"details": {key: template_data.get(key) for key in PRODUCT_SYNC_SECTIONS["details"]}}
+        for section in ("options", "variants", "images"):
+            sections[section] = [{key: item.get(key) for key in PRODUCT_SYNC_SECTIONS[section]}
+                                 for item in template_data.get(section) or []]
+
+        section_hashes = {}
+        for section, data in sections.items():
+            section_hash = hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+            section_hashes["shopify_%s_hash" % section] = section_hash
+        if not instance.sync_product_with_images:
+            section_hashes["shopify_images_hash"] = False
+        return section_hashes
+
+    def get_shopify_changed_sections(self, template_data, section_hashes):
+        """
+        Compares the hashes of the product response with the hashes last applied to the template.
+        Variants are applied again when variants of the template were removed in Odoo, and nothing is applied
+        when the response is older than the one last applied.
+        @param template_data: Data of Shopify Template.
+        @param section_hashes: Hashes prepared by prepare_shopify_section_hashes.
+        @return: Set of the changed section names.
+        """
+        updated_at = self.convert_shopify_date_into_odoo_format(template_data.get("updated_at"))
+        if updated_at and self.updated_at and updated_at < fields.Datetime.to_string(self.updated_at):
+            _logger.info("Product- %s is older than the one imported last, skipped." % template_data.get("id"))
+            return set()
+
+        changed_sections = {section for section in PRODUCT_SYNC_SECTIONS
+                            if section_hashes.get("shopify_%s_hash" % section) and
+                            self["shopify_%s_hash" % section] != section_hashes.get("shopify_%s_hash" % section)}
+        if len(self.shopify_product_ids) < len(template_data.get("variants") or []):
+            changed_sections.add("variants")
+        return changed_sections
+
     def sync_product_with_existing_template(self, shopify_template, skip_existing_product, template_data, instance,
                                             product_category, model_id, log_book_id, product_data_line_id,
-                                            order_data_line_id):
+                                            order_data_line_id, changed_sections=None, variant_cache=None):
         """
         This method is used for importing existing template.
+        @param changed_sections: Set of the changed section names, the variants are applied only when the
+        variants or options are changed. All sections are applied when not passed.
+        @param variant_cache: Dictionary of Shopify variant id and id of the existing variant in Odoo.
         @author: Maulik Barad on Date 03-Sep-2020.
         """
         shopify_product_obj = self.env["shopify.product.product.ept"]
 
         if skip_existing_product:
             return shopify_template
+        if changed_sections is not None and not changed_sections & {"details", "options", "variants"}:
+            return shopify_template
 
         need_to_archive = False
         variant_ids = []
@@ -344,6 +429,8 @@ class ShopifyProductTemplateEpt(models.Model):
         name = template_vals.get("template_title", "")
 
         self.create_or_update_shopify_template(template_vals, len(variant_data), shopify_template)
+        if changed_sections is not None and not changed_sections & {"options", "variants"}:
+            return shopify_template
 
         for variant in variant_data:
             variant_id = variant.get("id")
@@ -357,7 +444,8 @@ class ShopifyProductTemplateEpt(models.Model):
                 continue
             # Here we are not passing SKU and Barcode while searching shopify product, Because We
             # are updating same existing product so.
-            shopify_product, odoo_product = self.shopify_search_odoo_product_variant(instance, variant_id, False, False)
+            shopify_product, odoo_product = self.shopify_search_odoo_product_variant(instance, variant_id, False, False,
+                                                                                     variant_cache)
 
             if not shopify_product:
                 shopify_product = shopify_product_obj.search([("default_code", "=", sku),
@@ -429,9 +517,10 @@ class ShopifyProductTemplateEpt(models.Model):
         return shopify_template
 
     def sync_new_product(self, template_data, instance, product_category, model_id, log_book_id, product_data_line_id,
-                         order_data_line_id):
+                         order_data_line_id, variant_cache=None):
         """
         This method is used for importing new product.
+        @param variant_cache: Dictionary of Shopify variant id and id of the existing variant in Odoo.
         @author: Maulik Barad on Date 05-Sep-2020.
         """
         shopify_product_obj = self.env["shopify.product.product.ept"]
@@ -454,7 +543,8 @@ class ShopifyProductTemplateEpt(models.Model):
                                                     order_data_line_id, sku)
                 continue
 
-            shopify_product, odoo_product = self.shopify_search_odoo_product_variant(instance, variant_id, sku, barcode)
+            shopify_product, odoo_product = self.shopify_search_odoo_product_variant(instance, variant_id, sku, barcode,
+                                                                                     variant_cache)
 
             message = self.is_product_importable(template_data, instance, odoo_product, shopify_product)
             if message:
@@ -647,6 +737,20 @@ class ShopifyProductTemplateEpt(models.Model):
             if not key:
                 continue
             existing_common_template_images.update({key: odoo_image.id})
+
+        # Images which are not mapped yet are downloaded together, unchanged ones are taken from the image cache.
+        mapped_images = {(mapping.shopify_variant_id.id, mapping.shopify_image_id) for mapping in
+                         shopify_product_image_obj.search([("shopify_template_id", "=", self.id)])}
+        image_urls = []
+        for image in template_data.get("images", {}):
+            variant_ids = image.get("variant_ids")
+            variant_layer_ids = self.shopify_product_ids.filtered(
+                lambda x: int(x.variant_id) in variant_ids).ids if variant_ids else [False]
+            if any((variant_layer_id, str(image.get("id"))) not in mapped_images
+                   for variant_layer_id in variant_layer_ids):
+                image_urls.append(image.get("src"))
+        cached_images = self.env["common.image.cache.ept"].get_images_ept(image_urls)
+
         for image in template_data.get("images", {}):
             if image.get("src"):
                 shopify_image_id = str(image.get("id"))
@@ -661,9 +765,8 @@ class ShopifyProductTemplateEpt(models.Model):
                          ("shopify_image_id", "=", shopify_image_id)])
                     if not shopify_product_image:
                         try:
-                            response = requests.get(url, stream=True, verify=False, timeout=10)
-                            if response.status_code == 200:
-                                image = base64.b64encode(response.content)
+                            if cached_images.get(url):
+                                image = cached_images[url].image
                                 key = hashlib.md5(image).hexdigest()
                                 if key in existing_common_template_images.keys():
                                     shopify_product_image = shopify_product_image_obj.create(
@@ -708,9 +811,8 @@ class ShopifyProductTemplateEpt(models.Model):
                              ("shopify_image_id", "=", shopify_image_id)])
                         if not shopify_product_image:
                             try:
-                                response = requests.get(url, stream=True, verify=False, timeout=10)
-                                if response.status_code == 200:
-                                    image = base64.b64encode(response.content)
+                                if cached_images.get(url):
+                                    image = cached_images[url].image
                                     key = hashlib.md5(image).hexdigest()
                                     if key in existing_common_variant_images.keys():
                                         shopify_product_image = shopify_product_image_obj.create(
@@ -806,21 +908,26 @@ class ShopifyProductTemplateEpt(models.Model):
         shopify_product_date = parser.parse(product_date).astimezone(utc).strftime("%Y-%m-%d %H:%M:%S")
         return shopify_product_date
 
-    def shopify_search_odoo_product_variant(self, shopify_instance, variant_id, product_sku, barcode):
+    def shopify_search_odoo_product_variant(self, shopify_instance, variant_id, product_sku, barcode,
+                                            variant_cache=None):
         """
         Searches for Shopify/Odoo product with SKU and/or Barcode.
         @param shopify_instance: It is the browsable object of shopify instance
         @param product_sku : It is the default code of product and its type is String
         @param variant_id : It is the id of the product variant and its type is Integer
         @param barcode: Barcode from Shopify product.
+        @param variant_cache: Dictionary of Shopify variant id and id of the existing variant in Odoo, the variant
+        is searched when it is not in it.
         @author: Maulik Barad on Date 01-Sep-2020.
         """
         odoo_product = self.env["product.product"]
         shopify_product_obj = self.env["shopify.product.product.ept"]
 
-        shopify_product = shopify_product_obj.search([("variant_id", "=", variant_id),
-                                                      ("shopify_instance_id", "=", shopify_instance.id)],
-                                                     limit=1)
+        shopify_product = shopify_product_obj.browse((variant_cache or {}).get(str(variant_id))).exists()
+        if not shopify_product:
+            shopify_product = shopify_product_obj.search([("variant_id", "=", variant_id),
+                                                          ("shopify_instance_id", "=", shopify_instance.id)],
+                                                         limit=1)
 
         if shopify_instance.shopify_sync_product_with == "sku" and product_sku:
             if not shopify_product:
@@ -2,7 +2,7 @@
 # See LICENSE file for full copyright and licensing details.
 import logging
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError
 from .. import shopify
 
@@ -64,6 +64,7 @@ class ShopifyWebhookEpt(models.Model):
                 except:
                     raise UserError("Something went wrong while deleting the webhook.")
         unlink_main = super(ShopifyWebhookEpt, self).unlink()
+        self.clear_caches()
         self.deactivate_auto_create_webhook(instance)
         return unlink_main
 
@@ -103,8 +104,31 @@ class ShopifyWebhookEpt(models.Model):
 
         result = super(ShopifyWebhookEpt, self).create(values)
         result.get_webhook()
+        self.clear_caches()
         return result
 
+    def write(self, vals):
+        """
+        Inherited for clearing the cached webhook routes.
+        """
+        self.clear_caches()
+        return super(ShopifyWebhookEpt, self).write(vals)
+
+    @api.model
+    @tools.ormcache("host", "route")
+    def get_webhook_route_info(self, host, route):
+        """
+        Gives the instance receiving a webhook route for a shop. It is cached, so the webhooks do not search
+        the instance and the webhook on every delivery.
+        @param host: Domain of the shop given by Shopify.
+        @param route: Route of the webhook.
+        @return: Tuple of id of the instance, whether the instance and webhook are active and shared secret.
+        """
+        instance = self.env["shopify.instance.ept"].with_context(active_test=False).search(
+            [("shopify_host", "ilike", host)], limit=1)
+        webhook = self.search([("delivery_url", "ilike", route), ("instance_id", "=", instance.id)], limit=1)
+        return instance.id, bool(instance.active and webhook.state == "active"), instance.shopify_shared_secret
+
     def get_route(self):
         """
         Gives delivery URL for the webhook as per the Webhook Action.
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import logging
+from datetime import datetime
+
+from odoo import models, fields
+from ..shopify.pyactiveresource import jsoncodec
+
+_logger = logging.getLogger("Shopify Webhook")
+
+
+class ShopifyWebhookInboxEpt(models.Model):
+    _name = "shopify.webhook.inbox.ept"
+    _description = "Shopify Webhook Inbox"
+    _order = "id"
+
+    instance_id = fields.Many2one("shopify.instance.ept", "Instance", ondelete="cascade", index=True)
+    route = fields.Char(help="Route of Odoo, which received the webhook.")
+    topic = fields.Char(help="Topic of the webhook given by Shopify.")
+    shopify_webhook_event_id = fields.Char("Webhook Event Id", help="Id of the delivery given by Shopify.")
+    payload = fields.Text(help="Data received from Shopify.")
+    resource_id = fields.Char(help="Id of the resource in Shopify.")
+    resource_updated_at = fields.Datetime(help="Time when the resource was updated in Shopify.")
+    state = fields.Selection([("draft", "Draft"), ("done", "Done"), ("failed", "Failed")], default="draft",
+                             index=True)
+    processed_at = fields.Datetime()
+    message = fields.Text()
+
+    _sql_constraints = [("unique_webhook_event", "unique(instance_id, shopify_webhook_event_id)",
+                         "Webhook is already received.")]
+
+    def add_shopify_webhook(self, instance, route, topic, webhook_event_id, payload, response):
+        """
+        Stores a webhook in the inbox. Webhooks delivered again by Shopify with the same webhook id are dropped.
+        @param instance: Shopify Instance.
+        @param route: Route of the webhook.
+        @param topic: Topic of the webhook.
+        @param webhook_event_id: Value of X-Shopify-Webhook-Id header.
+        @param payload: Raw data of the webhook.
+        @param response: Decoded data of the webhook.
+        @return: True if the webhook is stored.
+        """
+        resource_id = response.get("id")
+        updated_at = self.env["data.queue.mixin.ept"].get_shopify_updated_at(response)
+        self._cr.execute("""insert into shopify_webhook_inbox_ept (instance_id, route, topic,
+                            shopify_webhook_event_id, payload, resource_id, resource_updated_at, state,
+                            create_uid, write_uid, create_date, write_date)
+                            values (%s, %s, %s, %s, %s, %s, %s, 'draft', %s, %s, now() at time zone 'UTC',
+                            now() at time zone 'UTC')
+                            on conflict (instance_id, shopify_webhook_event_id) do nothing
+                            returning id""",
+                         (instance.id, route, topic, webhook_event_id or None, payload,
+                          resource_id and str(resource_id) or None, updated_at or None, self._uid, self._uid))
+        if not self._cr.fetchone():
+            _logger.info("Webhook %s of route %s is already received." % (webhook_event_id, route))
+            return False
+        return True
+
+    def coalesce_shopify_webhooks(self):
+        """
+        Keeps only the most recent webhook of every resource, as processing it covers the older updates of
+        the resource. The older webhooks are marked as done.
+        @return: Webhooks to be processed.
+        """
+        latest_webhooks = {}
+        superseded_webhooks = self.browse()
+        for inbox_webhook in self:
+            if not inbox_webhook.resource_id:
+                latest_webhooks[inbox_webhook.id] = inbox_webhook
+                continue
+            key = (inbox_webhook.instance_id.id, inbox_webhook.route, inbox_webhook.resource_id)
+            latest_webhook = latest_webhooks.get(key)
+            if latest_webhook and (latest_webhook.resource_updated_at or datetime.min) > \
+                    (inbox_webhook.resource_updated_at or datetime.min):
+                superseded_webhooks |= inbox_webhook
+                continue
+            if latest_webhook:
+                superseded_webhooks |= latest_webhook
+            latest_webhooks[key] = inbox_webhook
+
+        if superseded_webhooks:
+            superseded_webhooks.write({"state": "done", "processed_at": datetime.now(),
+                                       "message": "Skipped as a newer webhook of the resource is received."})
+            self._cr.commit()
+        return self.browse([inbox_webhook.id for inbox_webhook in latest_webhooks.values()]).sorted("id")
+
+    def process_shopify_webhook_inbox(self, limit=1000):
+        """
+        This method processes the webhooks received in deferred mode, in the order they were received.
+        It will be called from the webhook inbox cron. Every webhook is committed on its own, as the processes
+        called for the webhooks commit their work.
+        @param limit: Number of webhooks processed in one run.
+        """
+        shopify_instance_obj = self.env["shopify.instance.ept"]
+
+        inbox_webhooks = self.search([("state", "=", "draft")], limit=limit).coalesce_shopify_webhooks()
+        instances = {instance.id: instance for instance in inbox_webhooks.instance_id}
+        for inbox_webhook in inbox_webhooks:
+            instance = instances.get(inbox_webhook.instance_id.id) or shopify_instance_obj
+            try:
+                self.process_shopify_webhook(inbox_webhook.route, jsoncodec.loads(inbox_webhook.payload), instance)
+                inbox_webhook.write({"state": "done", "processed_at": datetime.now()})
+            except Exception as error:
+                self._cr.rollback()
+                _logger.exception("Webhook %s of route %s could not be processed." % (inbox_webhook.id,
+                                                                                     inbox_webhook.route))
+                inbox_webhook.write({"state": "failed", "processed_at": datetime.now(), "message": str(error)})
+            self._cr.commit()
+        return True
+
+    def process_shopify_webhook(self, route, response, instance):
+        """
+        Processes the data of a webhook as per the route, which received it.
+        @param route: Route of the webhook.
+        @param response: Data of the webhook.
+        @param instance: Shopify Instance.
+        """
+        webhook_processes = {
+            "shopify_odoo_webhook_for_product_update": self.process_product_update_webhook,
+            "shopify_odoo_webhook_for_product_delete": self.process_product_delete_webhook,
+            "shopify_odoo_webhook_for_customer_create": self.process_customer_webhook,
+            "shopify_odoo_webhook_for_customer_update": self.process_customer_webhook,
+            "shopify_odoo_webhook_for_orders_partially_updated": self.process_order_update_webhook,
+        }
+        webhook_process = webhook_processes.get(route)
+        if not webhook_process:
+            _logger.info("No process found for the webhook route %s." % route)
+            return False
+        return webhook_process(response, instance)
+
+    def process_product_update_webhook(self, response, instance):
+        """
+        Creates product queue for the product update webhook of Shopify.
+        @author: Dipak Gogiya on Date 10-Jan-2020.
+        """
+        _logger.info("PRODUCT WEBHOOK call for product: %s" % response.get("title"))
+
+        shopify_template = self.env["shopify.product.template.ept"].with_context(
+            active_test=False).search([("shopify_tmpl_id", "=", response.get("id")),
+                                       ("shopify_instance_id", "=", instance.id)], limit=1)
+
+        if shopify_template or (response.get("published_scope") == "web" and response.get("published_at")):
+            self.env["shopify.product.data.queue.ept"].create_shopify_product_queue_from_webhook(response,
+                                                                                                  instance)
+        return True
+
+    def process_product_delete_webhook(self, response, instance):
+        """
+        Archives the product for the product delete webhook of Shopify.
+        @author: Dipak Gogiya on Date 10-Jan-2020.
+        """
+        _logger.info("DELETE PRODUCT WEBHOOK call for product: %s" % response.get("title"))
+        shopify_template = self.env["shopify.product.template.ept"].search(
+            [("shopify_tmpl_id", "=", response.get("id")),
+             ("shopify_instance_id", "=", instance.id)], limit=1)
+        if shopify_template:
+            shopify_template.write({"active": False})
+        return True
+
+    def process_customer_webhook(self, response, instance):
+        """
+        Creates customer queue for the customer create and update webhooks of Shopify.
+        @author: Maulik Barad on Date 23-Sep-2020.
+        """
+        _logger.info("CUSTOMER WEBHOOK call for Customer: %s %s" % (response.get("first_name") or "",
+                                                                   response.get("last_name") or ""))
+        self.env["shopify.process.import.export"].webhook_customer_create_process(response, instance)
+        return True
+
+    def process_order_update_webhook(self, response, instance):
+        """
+        Imports or updates the order for the order update webhook of Shopify.
+        @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 13-Jan-2020..
+        """
+        sale_order_obj = self.env["sale.order"]
+        _logger.info("UPDATE ORDER WEBHOOK call for order: %s" % response.get("name"))
+
+        fulfillment_status = response.get("fulfillment_status") or "unfulfilled"
+        if sale_order_obj.search_read([("shopify_instance_id", "=", instance.id),
+                                       ("shopify_order_id", "=", response.get("id")),
+                                       ("shopify_order_number", "=", response.get("order_number"))], ["id"]):
+            sale_order_obj.process_shopify_order_via_webhook(response, instance, True)
+        elif fulfillment_status in ["fulfilled", "unfulfilled"]:
+            response["fulfillment_status"] = fulfillment_status
+            sale_order_obj.process_shopify_order_via_webhook(response, instance)
+        return True
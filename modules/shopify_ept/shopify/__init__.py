@@ -1,6 +1,7 @@
 from .version import VERSION
 from .session import Session, ValidationException
 from .resources import *
-from .limits import Limits
+from .limits import Limits, LeakyBucket, GraphQLCostBucket
 from .api_version import *
 from .collection import PaginatedIterator
+from .bulk_operation import BulkOperation, BulkOperationError
@@ -1,15 +1,18 @@
 from . import pyactiveresource
 from .pyactiveresource import connection
 from .pyactiveresource.activeresource import ActiveResource, ResourceMeta, formats
+from .pyactiveresource.transport import KeepAliveTransport
+from .limits import LeakyBucket
 from . import yamlobjects
 from . import mixins as mixins
 from .. import shopify
 import threading
 import sys
+import time
 from six.moves import urllib
 import six
 
-from .collection import PaginatedCollection
+from .collection import PaginatedCollection, RawPage
 from .pyactiveresource.collection import Collection
 
 # Store the response from the last request in the connection object
@@ -17,19 +20,44 @@ from .pyactiveresource.collection import Collection
 
 class ShopifyConnection(pyactiveresource.connection.Connection):
     response = None
+    # Shared by all the connections, it keeps one keep-alive connection per thread and shop.
+    transport = KeepAliveTransport(accept_gzip=True)
+    RETRYABLE_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
 
     def __init__(self, site, user=None, password=None, timeout=None,
-                 format=formats.JSONFormat):
-        super(ShopifyConnection, self).__init__(site, user, password, timeout, format)
-
-    def _open(self, *args, **kwargs):
-        self.response = None
-        try:
-            self.response = super(ShopifyConnection, self)._open(*args, **kwargs)
-        except pyactiveresource.connection.ConnectionError as err:
-            self.response = err.response
-            raise
-        return self.response
+                 format=formats.JSONFormat, transport=None):
+        super(ShopifyConnection, self).__init__(site, user, password, timeout, format,
+                                                transport or ShopifyConnection.transport)
+
+    def _open(self, method, path, headers=None, data=None):
+        """Performs the request paced by the leaky bucket of the shop.
+
+        Requests answered with 429 are sent again after Retry-After, and
+        idempotent requests failing with a server error are sent again after an
+        exponential backoff, so callers do not need their own retries.
+        """
+        bucket = LeakyBucket.for_shop(urllib.parse.urlparse(self.site).hostname)
+        for attempt in range(bucket.max_retries + 1):
+            bucket.acquire()
+            self.response = None
+            try:
+                self.response = super(ShopifyConnection, self)._open(method, path, headers=headers, data=data)
+            except pyactiveresource.connection.ClientError as err:
+                self.response = err.response
+                if err.code != 429 or attempt == bucket.max_retries:
+                    raise
+                bucket.penalize(err.response, attempt)
+                continue
+            except pyactiveresource.connection.ConnectionError as err:
+                self.response = err.response
+                raise
+            except pyactiveresource.connection.ServerError:
+                if method not in self.RETRYABLE_METHODS or attempt == bucket.max_retries:
+                    raise
+                time.sleep(bucket.backoff_delay(attempt))
+                continue
+            bucket.update(self.response)
+            return self.response
 
 # Inherit from pyactiveresource's metaclass in order to use ShopifyConnection
 
@@ -213,3 +241,27 @@ class ShopifyResource(ActiveResource, mixins.Countable):
         if isinstance(collection, Collection) and "headers" in collection.metadata:
             return PaginatedCollection(collection, metadata={"resource_class": cls}, **kwargs)
         return collection
+
+    @classmethod
+    def find_raw(cls, from_=None, **kwargs):
+        """Finds a page of resources as dictionaries, without building resource objects.
+
+        The records are returned as decoded from the response body, so no
+        resource and nested collection objects are built only to be converted
+        back with to_dict.
+
+        Returns:
+            A RawPage, a list of dictionaries with the pagination of the response.
+        """
+        prefix_options, query_options = cls._split_options(kwargs)
+        if from_:
+            query_options.update(prefix_options)
+            path = from_ + cls._query_string(query_options)
+        else:
+            path = cls._collection_path(prefix_options, query_options)
+
+        response = cls.connection.get(path, cls.headers)
+        records = cls.format.decode(response.body) if response.body.strip() else []
+        if isinstance(records, dict):
+            records = [records]
+        return RawPage(records, metadata={"resource_class": cls, "headers": response.headers})
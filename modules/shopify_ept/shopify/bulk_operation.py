@@ -0,0 +1,145 @@
+import time
+
+from six.moves import urllib
+
+from .. import shopify
+from .pyactiveresource import jsoncodec
+
+
+class BulkOperationError(Exception):
+    """A bulk operation could not be started or did not complete."""
+
+
+class BulkOperation(object):
+    """
+    Runs a GraphQL bulk query and streams its result.
+
+    Shopify runs the query in the background and writes the result in a JSONL
+    file, one object per line. Objects of nested connections are written on
+    their own lines after their parent, with a __parentId key.
+
+    >>> operation = BulkOperation.for_shop("my-shop.myshopify.com")
+    >>> url = operation.run(query)
+    >>> for product, children in operation.iter_objects(url):
+    ...     variants = children.get("ProductVariant", [])
+    """
+    API_VERSION = "2024-07"
+    FINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELED", "EXPIRED")
+
+    RUN_QUERY = """
+    mutation bulkOperationRunQuery($query: String!) {
+      bulkOperationRunQuery(query: $query) {
+        bulkOperation { id status }
+        userErrors { field message }
+      }
+    }"""
+
+    STATUS_QUERY = """
+    query bulkOperationStatus($id: ID!) {
+      node(id: $id) {
+        ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+      }
+    }"""
+
+    def __init__(self, graphql, bucket, poll_interval=5, timeout=4 * 3600, download_timeout=300):
+        self.graphql = graphql
+        self.bucket = bucket
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.download_timeout = download_timeout
+        self.operation_id = None
+
+    @classmethod
+    def for_shop(cls, host, **kwargs):
+        """Bulk operation for the shop of the current session, paced by the GraphQL cost bucket of the shop."""
+        return cls(shopify.GraphQL(version=cls.API_VERSION), shopify.GraphQLCostBucket.for_shop(host), **kwargs)
+
+    def run(self, query):
+        """Starts the bulk query and waits for it.
+
+        Returns:
+            The url of the JSONL result, or None when the query found no objects.
+        Raises:
+            BulkOperationError when the operation can not be started or fails.
+        """
+        self.start(query)
+        return self.wait()
+
+    def start(self, query):
+        result = self.bucket.execute(self.graphql, self.RUN_QUERY, {"query": query}, cost=10)
+        if result.get("errors"):
+            raise BulkOperationError(result["errors"])
+        data = (result.get("data") or {}).get("bulkOperationRunQuery") or {}
+        if data.get("userErrors"):
+            raise BulkOperationError("; ".join(error.get("message") for error in data["userErrors"]))
+        self.operation_id = data["bulkOperation"]["id"]
+        return self.operation_id
+
+    def status(self):
+        result = self.bucket.execute(self.graphql, self.STATUS_QUERY, {"id": self.operation_id}, cost=1)
+        if result.get("errors"):
+            raise BulkOperationError(result["errors"])
+        return (result.get("data") or {}).get("node") or {}
+
+    def wait(self):
+        """Polls the operation until it reaches a final status."""
+        deadline = time.time() + self.timeout
+        while True:
+            operation = self.status()
+            status = operation.get("status")
+            if status == "COMPLETED":
+                return operation.get("url")
+            if status in self.FINAL_STATUSES:
+                raise BulkOperationError("Bulk operation %s is %s: %s" % (self.operation_id, status,
+                                                                          operation.get("errorCode")))
+            if time.time() > deadline:
+                raise BulkOperationError("Bulk operation %s did not complete in %s seconds" % (self.operation_id,
+                                                                                               self.timeout))
+            time.sleep(self.poll_interval)
+
+    def iter_lines(self, url):
+        """Iterates over the objects of the JSONL result as it is downloaded."""
+        if not url:
+            return
+        response = urllib.request.urlopen(url, timeout=self.download_timeout)
+        try:
+            for line in response:
+                if line.strip():
+                    yield jsoncodec.loads(line)
+        finally:
+            response.close()
+
+    def iter_objects(self, url):
+        """Iterates over the top level objects of the result with their children.
+
+        Children follow their parent in the result, so only one object is kept in
+        memory at a time.
+
+        Yields:
+            Tuples of the object and a dictionary of its children by type name,
+            as found in their global id.
+        """
+        parent = children = None
+        for item in self.iter_lines(url):
+            parent_id = item.pop("__parentId", None)
+            if parent_id is None:
+                if parent is not None:
+                    yield parent, children
+                parent, children = item, {}
+            elif parent is not None and parent_id == parent.get("id"):
+                children.setdefault(self.get_type_name(item.get("id")), []).append(item)
+        if parent is not None:
+            yield parent, children
+
+    @staticmethod
+    def get_type_name(global_id):
+        """Type name of a global id, like ProductVariant for gid://shopify/ProductVariant/1."""
+        return (global_id or "").split("/")[-2] if (global_id or "").count("/") >= 3 else ""
+
+    @staticmethod
+    def get_legacy_id(global_id):
+        """Numeric id of a global id, as used by the REST API."""
+        if not global_id:
+            return None
+        legacy_id = global_id.split("/")[-1].split("?")[0]
+        return int(legacy_id) if legacy_id.isdigit() else legacy_id
@@ -1,7 +1,25 @@
 from .pyactiveresource.collection import Collection
 from six.moves.urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
 import cgi
 
+
+def parse_pagination(headers):
+    """Parses the cursors of the Link header into a dictionary of urls by rel."""
+    if not headers:
+        return {}
+
+    values = headers.get("Link", headers.get("link", None))
+    if values is None:
+        return {}
+
+    result = {}
+    for value in values.split(", "):
+        link, rel = value.split("; ")
+        result[rel.split('"')[1]] = link[1:-1]
+    return result
+
+
 class PaginatedCollection(Collection):
     """
     A subclass of Collection which allows cycling through pages of
@@ -31,7 +49,7 @@ class PaginatedCollection(Collection):
         if not ("resource_class" in self.metadata):
             raise AttributeError("Cursor-based pagination requires a \"resource_class\" attribute in the metadata.")
 
-        self.metadata["pagination"] = self.__parse_pagination()
+        self.metadata["pagination"] = parse_pagination(self.metadata.get("headers"))
         self.next_page_url = self.metadata["pagination"].get('next', None)
         self.previous_page_url = self.metadata["pagination"].get('previous', None)
 
@@ -40,20 +58,6 @@ class PaginatedCollection(Collection):
         self._current_iter = None
         self._no_iter_next = kwargs.pop("no_iter_next", True)
 
-    def __parse_pagination(self):
-        if "headers" not in self.metadata:
-            return {}
-
-        values = self.metadata["headers"].get("Link", self.metadata["headers"].get("link", None))
-        if values is None:
-            return {}
-
-        result = {}
-        for value in values.split(", "):
-            link, rel = value.split("; ")
-            result[rel.split('"')[1]] = link[1:-1]
-        return result
-
     def has_previous_page(self):
         """Returns true if the current page has any previous pages before it.
         """
@@ -128,6 +132,39 @@ class PaginatedCollection(Collection):
         return count + super(PaginatedCollection, self).__len__()
 
 
+class RawPage(list):
+    """
+    A page of resources as dictionaries, returned by ShopifyResource.find_raw.
+
+    The records are the dictionaries decoded from the response body, no
+    resource objects are built for them. The page follows the same cursors as
+    PaginatedCollection, so it can be iterated with PaginatedIterator.
+    """
+
+    def __init__(self, records, metadata):
+        super(RawPage, self).__init__(records)
+        self.metadata = metadata
+        pagination = parse_pagination(metadata.get("headers"))
+        self.next_page_url = pagination.get('next', None)
+        self.previous_page_url = pagination.get('previous', None)
+
+    def has_previous_page(self):
+        return bool(self.previous_page_url)
+
+    def has_next_page(self):
+        return bool(self.next_page_url)
+
+    def previous_page(self, no_cache=True):
+        if not self.has_previous_page():
+            raise IndexError("No previous page")
+        return self.metadata["resource_class"].find_raw(from_=self.previous_page_url)
+
+    def next_page(self, no_cache=True):
+        if not self.has_next_page():
+            raise IndexError("No next page")
+        return self.metadata["resource_class"].find_raw(from_=self.next_page_url)
+
+
 class PaginatedIterator(object):
     """
     This class implements an iterator over paginated collections which aims to
@@ -140,15 +177,27 @@ class PaginatedIterator(object):
     ...         do_something(item)
     ...
     # every page and the page items are iterated
+
+    With prefetch, the next page is fetched on a background thread while the
+    current page is processed, so at most two pages are kept in memory.
+
+    >>> for item in PaginatedIterator(Product.find(limit=250), prefetch=True).items():
+    ...     do_something(item)
     """
-    def __init__(self, collection):
-        if not isinstance(collection, PaginatedCollection):
-            raise TypeError("PaginatedIterator expects a PaginatedCollection instance")
+    def __init__(self, collection, prefetch=False):
+        if not isinstance(collection, (PaginatedCollection, RawPage)):
+            raise TypeError("PaginatedIterator expects a PaginatedCollection or RawPage instance")
         self.collection = collection
         self.collection._no_iter_next = True
+        self.prefetch = prefetch
 
     def __iter__(self):
         """Iterate over pages, returning one page at a time."""
+        if self.prefetch:
+            for page in self.__prefetched_pages():
+                yield page
+            return
+
         current_page = self.collection
         while True:
             yield current_page
@@ -156,3 +205,36 @@ class PaginatedIterator(object):
                 current_page = current_page.next_page(no_cache=True)
             except IndexError:
                 return
+
+    def items(self):
+        """Iterate over the items of every page."""
+        for page in self:
+            for item in page:
+                yield item
+
+    def __prefetched_pages(self):
+        """Iterate over pages, fetching the next page while the current one is used.
+
+        The connection of a resource is local to its thread, so the session of the
+        calling thread is copied to the thread fetching the pages.
+        """
+        resource_class = self.collection.metadata["resource_class"]
+        session = (resource_class.site, resource_class.user, resource_class.password,
+                   dict(resource_class.headers))
+
+        with ThreadPoolExecutor(max_workers=1, initializer=self.__start_session,
+                                initargs=(resource_class,) + session) as executor:
+            current_page = self.collection
+            while current_page is not None:
+                next_page = None
+                if current_page.has_next_page():
+                    next_page = executor.submit(current_page.next_page, no_cache=True)
+                yield current_page
+                current_page = next_page.result() if next_page else None
+
+    @staticmethod
+    def __start_session(resource_class, site, user, password, headers):
+        resource_class.site = site
+        resource_class.user = user
+        resource_class.password = password
+        resource_class.headers = headers
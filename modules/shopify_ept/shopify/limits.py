@@ -1,4 +1,11 @@
+import random
+import threading
+import time
+
+from six.moves.urllib.error import HTTPError
+
 from .. import shopify
+from .pyactiveresource import jsoncodec
 
 
 class Limits(object):
@@ -59,3 +66,156 @@ class Limits(object):
         How many API calls have I made?
         """
         return int(cls.api_credit_limit_param()[0])
+
+
+class LeakyBucket(object):
+    """
+    Client side mirror of the Shopify leaky bucket of one shop.
+
+    The bucket is shared by every thread talking to the same shop. Each call takes
+    one unit, the bucket leaks at the documented rate and its level is corrected
+    from the X-Shopify-Shop-Api-Call-Limit header of every response, so calls are
+    paced before Shopify starts answering with 429.
+
+    ShopifyConnection takes a unit from the bucket of its shop before every request
+    and retries the requests answered with 429 or a server error.
+
+    >>> bucket = LeakyBucket.for_shop("my-shop.myshopify.com")
+    >>> bucket.acquire()
+    """
+    RETRY_AFTER_HEADER = 'Retry-After'
+    MAX_BACKOFF = 32
+
+    _buckets = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, capacity=40, leak_rate=2.0, reserve=2, max_retries=5):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.reserve = reserve
+        self.max_retries = max_retries
+        self.level = 0.0
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_shop(cls, shop):
+        """Returns the bucket shared by all the threads of the given shop."""
+        with cls._registry_lock:
+            bucket = cls._buckets.get(shop)
+            if bucket is None:
+                bucket = cls._buckets[shop] = cls()
+            return bucket
+
+    def _leak(self):
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.updated_at) * self.leak_rate)
+        self.updated_at = now
+        return now
+
+    def acquire(self):
+        """Blocks until one more call fits in the bucket."""
+        while True:
+            with self.lock:
+                now = self._leak()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    overflow = self.level + 1 - (self.capacity - self.reserve)
+                    if overflow <= 0:
+                        self.level += 1
+                        return
+                    wait = overflow / self.leak_rate
+            time.sleep(wait)
+
+    def update(self, response):
+        """Resyncs the bucket with the call limit header of a response."""
+        headers = getattr(response, "headers", None) or {}
+        credits = headers.get(Limits.CREDIT_LIMIT_HEADER_PARAM) or headers.get(
+            Limits.CREDIT_LIMIT_HEADER_PARAM.lower())
+        if not credits:
+            return
+        used, limit = credits.split('/')
+        with self.lock:
+            self._leak()
+            self.capacity = int(limit)
+            self.level = max(self.level, float(used))
+
+    def penalize(self, response, attempt=0):
+        """Stops every thread of the shop after a 429, for Retry-After seconds plus a jittered backoff."""
+        headers = getattr(response, "headers", None) or {}
+        try:
+            retry_after = float(headers.get(self.RETRY_AFTER_HEADER) or
+                                headers.get(self.RETRY_AFTER_HEADER.lower()) or 1.0)
+        except ValueError:
+            retry_after = 1.0
+        delay = retry_after + random.uniform(0, 2 ** attempt)
+        with self.lock:
+            self._leak()
+            self.level = float(self.capacity)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    def backoff_delay(self, attempt=0):
+        """Exponential backoff with jitter, used to retry the calls failing on server errors."""
+        return min(2 ** attempt, self.MAX_BACKOFF) + random.uniform(0, 1)
+
+
+class GraphQLCostBucket(LeakyBucket):
+    """
+    Client side mirror of the GraphQL cost bucket of one shop.
+
+    GraphQL calls are limited by query cost instead of by request count. Each call
+    takes its estimated cost from the bucket and the bucket is resynced with the
+    throttleStatus returned in the cost extension of every response.
+
+    >>> bucket = GraphQLCostBucket.for_shop("my-shop.myshopify.com")
+    >>> result = bucket.execute(shopify.GraphQL(), query, variables, cost=10)
+    """
+    _buckets = {}
+
+    def __init__(self, capacity=1000, leak_rate=50.0, reserve=0, max_retries=5):
+        super(GraphQLCostBucket, self).__init__(capacity, leak_rate, reserve, max_retries)
+
+    def acquire(self, cost=1):
+        """Blocks until the cost fits in the bucket."""
+        while True:
+            with self.lock:
+                now = self._leak()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    overflow = self.level + min(cost, self.capacity) - (self.capacity - self.reserve)
+                    if overflow <= 0:
+                        self.level += cost
+                        return
+                    wait = overflow / self.leak_rate
+            time.sleep(wait)
+
+    def update(self, result):
+        """Resyncs the bucket with the throttle status of a GraphQL result."""
+        status = (((result or {}).get('extensions') or {}).get('cost') or {}).get('throttleStatus')
+        if not status:
+            return
+        with self.lock:
+            self._leak()
+            self.capacity = float(status.get('maximumAvailable', self.capacity))
+            self.leak_rate = float(status.get('restoreRate', self.leak_rate))
+            self.level = self.capacity - float(status.get('currentlyAvailable', self.capacity - self.level))
+
+    def execute(self, graphql, query, variables=None, cost=10):
+        """Executes a GraphQL query once the bucket has room for its cost, retrying throttled calls."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(cost)
+            try:
+                result = jsoncodec.loads(graphql.execute(query, variables))
+            except HTTPError as error:
+                if error.code != 429 or attempt == self.max_retries:
+                    raise
+                self.penalize(error, attempt)
+                continue
+            self.update(result)
+            throttled = any((error.get('extensions') or {}).get('code') == 'THROTTLED'
+                            for error in result.get('errors') or [])
+            if not throttled or attempt == self.max_retries:
+                return result
+            time.sleep(min(cost, self.capacity) / self.leak_rate + random.uniform(0, 2 ** attempt))
+        return result
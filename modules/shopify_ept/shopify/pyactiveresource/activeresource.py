@@ -115,7 +115,7 @@ class Errors(object):
             None
         """
         try:
-            decoded = util.json_to_dict(json_string.decode('utf-8'))
+            decoded = util.json_to_dict(json_string)
         except ValueError:
             decoded = {}
         if not decoded:
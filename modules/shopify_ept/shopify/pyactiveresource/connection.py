@@ -9,6 +9,7 @@ import sys
 import six
 from six.moves import urllib
 from . import formats
+from . import transport as transports
 
 
 class Error(Exception):
@@ -189,7 +190,7 @@ class Connection(object):
     """A connection object to interface with REST services."""
 
     def __init__(self, site, user=None, password=None, timeout=None,
-                 format=formats.JSONFormat):
+                 format=formats.JSONFormat, transport=None):
 
         """Initialize a new Connection object.
 
@@ -199,6 +200,7 @@ class Connection(object):
             password: password for basic authentication.
             timeout: socket timeout.
             format: format object for en/decoding resource data.
+            transport: transport object sending the requests, urllib by default.
         """
 
         if site is None:
@@ -214,6 +216,7 @@ class Connection(object):
         self.timeout = timeout
         self.log = logging.getLogger('pyactiveresource.connection')
         self.format = format
+        self.transport = transport or transports.UrllibTransport()
 
     def _parse_site(self, site):
         """Retrieve the auth information and base url for a site.
@@ -313,9 +316,9 @@ class Connection(object):
             urllib.error.URLError on IO errors.
         """
         if _urllib_has_timeout():
-          return urllib.request.urlopen(request, timeout=self.timeout)
+          return self.transport.open(request, timeout=self.timeout)
         else:
-          return urllib.request.urlopen(request)
+          return self.transport.open(request)
 
     def get(self, path, headers=None):
         """Perform an HTTP get request.
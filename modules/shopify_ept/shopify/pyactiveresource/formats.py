@@ -5,6 +5,7 @@
 __author__ = 'Mark Roach (mrroach@google.com)'
 
 import logging
+from . import jsoncodec
 from . import util
 
 
@@ -52,7 +53,8 @@ class JSONFormat(Base):
         log = logging.getLogger('pyactiveresource.format')
         log.debug('decoding resource: %s', resource_string)
         try:
-            data = util.json_to_dict(resource_string.decode('utf-8'))
+            # The codec decodes the UTF-8 bytes itself, without an intermediate string.
+            data = util.json_to_dict(resource_string)
         except ValueError as err:
             raise Error(err)
         return remove_root(data)
@@ -62,4 +64,4 @@ class JSONFormat(Base):
         """Convert a dictionary to a resource string."""
         log = logging.getLogger('pyactiveresource.format')
         log.debug('encoding resource: %r', data)
-        return util.to_json(data).encode('utf-8')
+        return jsoncodec.dumps({'object': data})
@@ -0,0 +1,68 @@
+"""JSON codec used to encode and decode the resources.
+
+orjson is used when it is installed, the json module of the standard library
+otherwise. Another codec can be plugged in with set_codec.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibCodec(object):
+    """Codec of the json module of the standard library."""
+
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj):
+        """Convert an object to JSON encoded in UTF-8 bytes."""
+        return json.dumps(obj).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        """Convert JSON bytes or string to an object."""
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(object):
+    """Codec of orjson, which encodes and decodes several times faster."""
+
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+codec = OrjsonCodec() if orjson else StdlibCodec()
+
+
+def set_codec(new_codec):
+    """Replace the codec, an object with dumps returning bytes and loads."""
+    global codec
+    codec = new_codec
+
+
+def dumps(obj):
+    """Convert an object to JSON encoded in UTF-8 bytes."""
+    return codec.dumps(obj)
+
+
+def dumps_str(obj):
+    """Convert an object to a JSON string."""
+    return codec.dumps(obj).decode('utf-8')
+
+
+def loads(data):
+    """Convert JSON bytes or string to an object."""
+    return codec.loads(data)
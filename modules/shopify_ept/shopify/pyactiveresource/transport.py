@@ -0,0 +1,181 @@
+"""Transports used by Connection to send the HTTP requests."""
+
+import gzip
+import select
+import threading
+import zlib
+
+import six
+from six.moves import http_client
+from six.moves import urllib
+
+
+class UrllibTransport(object):
+    """Opens a new urllib connection for every request."""
+
+    def open(self, request, timeout=None):
+        """Send a request.
+
+        Args:
+            request: A Request object.
+            timeout: socket timeout.
+        Returns:
+            An httplib.HTTPResponse object.
+        Raises:
+            urllib.error.HTTPError on server errors.
+            urllib.error.URLError on IO errors.
+        """
+        return urllib.request.urlopen(request, timeout=timeout)
+
+
+class PooledResponse(object):
+    """A response read from a pooled connection.
+
+    It has the attributes of the responses of urllib used by Connection, and
+    its body is read at once, so the connection can serve the next request.
+    """
+
+    def __init__(self, url, code, msg, headers, body):
+        self.url = url
+        self.code = code
+        self.msg = msg
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        return self.body
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+    def close(self):
+        pass
+
+
+class KeepAliveTransport(object):
+    """Reuses the HTTP connections to a host.
+
+    Every thread keeps its own connection per host, as http.client connections
+    are not thread safe, so the TCP and TLS handshakes are done once per thread
+    and host instead of once per request. Responses compressed with gzip are
+    decoded when accept_gzip is set. Requests going through a proxy are sent by
+    urllib.
+    """
+    MAX_REDIRECTS = 5
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+    RETRYABLE_ERRORS = (http_client.BadStatusLine, http_client.CannotSendRequest, ConnectionError)
+
+    def __init__(self, accept_gzip=True):
+        self.accept_gzip = accept_gzip
+        self.fallback = UrllibTransport()
+        self._local = threading.local()
+
+    def _connections(self):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        return connections
+
+    def _get_connection(self, scheme, netloc, timeout):
+        key = (scheme, netloc)
+        connection = self._connections().get(key)
+        if connection is None:
+            connection_class = http_client.HTTPSConnection if scheme == 'https' else http_client.HTTPConnection
+            connection = self._connections()[key] = connection_class(netloc, timeout=timeout)
+        elif connection.sock is not None and self._is_dropped(connection.sock):
+            # The server closed the idle connection.
+            connection.close()
+        if connection.timeout != timeout:
+            connection.timeout = timeout
+            if connection.sock:
+                connection.sock.settimeout(timeout)
+        return connection
+
+    def _is_dropped(self, sock):
+        """An idle connection is readable only when the server has closed it."""
+        try:
+            return bool(select.select([sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def _drop_connection(self, scheme, netloc):
+        connection = self._connections().pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        """Closes the connections of the current thread."""
+        for scheme, netloc in list(self._connections()):
+            self._drop_connection(scheme, netloc)
+
+    def open(self, request, timeout=None):
+        """Send a request on the pooled connection of its host.
+
+        Args:
+            request: A Request object.
+            timeout: socket timeout.
+        Returns:
+            A PooledResponse object.
+        Raises:
+            urllib.error.HTTPError on server errors.
+            urllib.error.URLError on IO errors.
+        """
+        url = request.get_full_url()
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme in urllib.request.getproxies() or parts.username or parts.password:
+            return self.fallback.open(request, timeout)
+
+        method = request.get_method()
+        headers = dict(request.header_items())
+        if self.accept_gzip:
+            headers.setdefault('Accept-Encoding', 'gzip')
+        body = request.data
+
+        for _redirect in range(self.MAX_REDIRECTS + 1):
+            response = self._send(parts, method, headers, body, timeout)
+            location = response.headers.get('Location')
+            if response.code in (301, 302, 303, 307, 308) and location and method in ('GET', 'HEAD'):
+                url = urllib.parse.urljoin(url, location)
+                parts = urllib.parse.urlsplit(url)
+                continue
+            break
+
+        if not 200 <= response.code < 300:
+            raise urllib.error.HTTPError(url, response.code, response.msg, response.headers,
+                                         six.BytesIO(response.body))
+        return response
+
+    def _send(self, parts, method, headers, body, timeout):
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        url = urllib.parse.urlunsplit(parts)
+        for attempt in range(2):
+            connection = self._get_connection(parts.scheme, parts.netloc, timeout)
+            reused = connection.sock is not None
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                http_response = connection.getresponse()
+                data = http_response.read()
+            except self.RETRYABLE_ERRORS as err:
+                self._drop_connection(parts.scheme, parts.netloc)
+                # The server may close an idle connection, the request is sent again on a new one.
+                if reused and attempt == 0 and method in self.IDEMPOTENT_METHODS:
+                    continue
+                raise urllib.error.URLError(err)
+            except (http_client.HTTPException, OSError) as err:
+                self._drop_connection(parts.scheme, parts.netloc)
+                raise urllib.error.URLError(err)
+
+            response_headers = http_response.msg
+            if http_response.will_close:
+                self._drop_connection(parts.scheme, parts.netloc)
+            encoding = (response_headers.get('Content-Encoding') or '').lower()
+            if data and encoding == 'gzip':
+                data = gzip.GzipFile(fileobj=six.BytesIO(data)).read()
+                del response_headers['Content-Encoding'], response_headers['Content-Length']
+            elif data and encoding == 'deflate':
+                data = zlib.decompress(data)
+                del response_headers['Content-Encoding'], response_headers['Content-Length']
+            return PooledResponse(url, http_response.status, http_response.reason, response_headers, data)
@@ -18,13 +18,7 @@ try:
 except ImportError:
     yaml = None
 
-try:
-    import simplejson as json
-except ImportError:
-    try:
-        import json
-    except ImportError:
-        json = None
+from . import jsoncodec
 
 try:
     from dateutil.parser import parse as date_parse
@@ -299,18 +293,18 @@ def to_json(obj, root='object'):
     """
     if root:
         obj = { root: obj }
-    return json.dumps(obj)
+    return jsoncodec.dumps_str(obj)
 
 
 def json_to_dict(jsonstr):
     """Parse the json into a dictionary of attributes.
 
     Args:
-        jsonstr: A JSON formatted string.
+        jsonstr: A JSON formatted string or UTF-8 bytes.
     Returns:
         The deserialized object.
     """
-    return json.loads(jsonstr)
+    return jsoncodec.loads(jsonstr)
 
 
 def _to_xml_element(obj, root, dasherize):
@@ -72,5 +72,7 @@ from .publication import Publication
 from .collection_publication import CollectionPublication
 from .product_publication import ProductPublication
 from .graphql import GraphQL
+from .payouts import Payouts
+from .transactions import Transactions
 
 from ..base import ShopifyResource
@@ -5,9 +5,16 @@ import json
 
 class GraphQL():
 
-    def __init__(self):
-        self.endpoint = (shopify.ShopifyResource.get_site() + "/graphql.json")
+    def __init__(self, version=None):
+        site = shopify.ShopifyResource.get_site()
+        if version:
+            site = site.rsplit('/', 1)[0] + '/' + version
+        self.endpoint = (site + "/graphql.json")
         self.headers = shopify.ShopifyResource.get_headers()
+        # Private apps authenticate with their password, which is the access token of the app.
+        password = shopify.ShopifyResource.get_password()
+        if password and 'X-Shopify-Access-Token' not in self.headers:
+            self.headers = self.merge_headers(self.headers, {'X-Shopify-Access-Token': password})
 
     def merge_headers(self, *headers):
         merged_headers = {}
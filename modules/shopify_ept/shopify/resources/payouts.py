@@ -0,0 +1,7 @@
+from ..base import ShopifyResource
+
+
+class Payouts(ShopifyResource):
+    _prefix_source = "/shopify_payments/"
+    _singular = "payout"
+    _plural = "payouts"
@@ -0,0 +1,8 @@
+from ..base import ShopifyResource
+
+
+class Transactions(ShopifyResource):
+    """Balance transactions of Shopify Payments."""
+    _prefix_source = "/shopify_payments/balance/"
+    _singular = "transaction"
+    _plural = "transactions"
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from . import test_leaky_bucket
+from . import test_bulk_operation
+from . import test_queue_data_codec
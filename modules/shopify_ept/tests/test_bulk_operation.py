@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import io
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase, TransactionCase
+from odoo.addons.shopify_ept.shopify import bulk_operation
+from odoo.addons.shopify_ept.shopify.bulk_operation import BulkOperation
+
+
+class TestBulkOperation(BaseCase):
+
+    def setUp(self):
+        super(TestBulkOperation, self).setUp()
+        self.operation = BulkOperation(graphql=None, bucket=None)
+
+    def iter_objects(self, lines):
+        with patch.object(BulkOperation, "iter_lines", return_value=iter(lines)):
+            return list(self.operation.iter_objects("https://example.com/result.jsonl"))
+
+    def test_iter_objects_groups_children_by_parent(self):
+        objects = self.iter_objects([
+            {"id": "gid://shopify/Product/1", "title": "Shirt"},
+            {"id": "gid://shopify/ProductVariant/11", "__parentId": "gid://shopify/Product/1"},
+            {"id": "gid://shopify/ProductImage/21", "__parentId": "gid://shopify/Product/1"},
+            {"id": "gid://shopify/ProductVariant/12", "__parentId": "gid://shopify/Product/1"},
+            {"id": "gid://shopify/Product/2", "title": "Cap"},
+        ])
+
+        self.assertEqual(len(objects), 2)
+        product, children = objects[0]
+        self.assertEqual(product, {"id": "gid://shopify/Product/1", "title": "Shirt"})
+        self.assertEqual([variant["id"] for variant in children["ProductVariant"]],
+                         ["gid://shopify/ProductVariant/11", "gid://shopify/ProductVariant/12"])
+        self.assertEqual(len(children["ProductImage"]), 1)
+        self.assertNotIn("__parentId", children["ProductImage"][0])
+        self.assertEqual(objects[1], ({"id": "gid://shopify/Product/2", "title": "Cap"}, {}))
+
+    def test_iter_objects_skips_orphan_children(self):
+        objects = self.iter_objects([
+            {"id": "gid://shopify/ProductVariant/10", "__parentId": "gid://shopify/Product/9"},
+            {"id": "gid://shopify/Product/1"},
+            {"id": "gid://shopify/ProductVariant/11", "__parentId": "gid://shopify/Product/9"},
+        ])
+        self.assertEqual(objects, [({"id": "gid://shopify/Product/1"}, {})])
+
+    def test_iter_objects_without_result(self):
+        self.assertEqual(list(self.operation.iter_objects(None)), [])
+
+    def test_iter_lines_parses_jsonl(self):
+        result = io.BytesIO(b'{"id": "gid://shopify/Order/1"}\n\n'
+                            b'{"id": "gid://shopify/LineItem/2", "__parentId": "gid://shopify/Order/1"}\n')
+        with patch.object(bulk_operation.urllib.request, "urlopen", return_value=result):
+            lines = list(self.operation.iter_lines("https://example.com/result.jsonl"))
+        self.assertEqual(lines, [{"id": "gid://shopify/Order/1"},
+                                 {"id": "gid://shopify/LineItem/2", "__parentId": "gid://shopify/Order/1"}])
+        self.assertTrue(result.closed)
+
+    def test_global_ids(self):
+        self.assertEqual(BulkOperation.get_type_name("gid://shopify/ProductVariant/11"), "ProductVariant")
+        self.assertEqual(BulkOperation.get_type_name("11"), "")
+        self.assertEqual(BulkOperation.get_legacy_id("gid://shopify/ProductImage/21?v=2"), 21)
+        self.assertEqual(BulkOperation.get_legacy_id("123"), 123)
+        self.assertIsNone(BulkOperation.get_legacy_id(None))
+
+
+class TestBulkOperationMapping(TransactionCase):
+
+    def test_prepare_order_from_bulk_operation(self):
+        order = {"id": "gid://shopify/Order/1001", "legacyResourceId": "1001", "name": "EU2-1001-B",
+                 "email": "jane@example.com", "createdAt": "2021-01-01T10:00:00Z", "currencyCode": "EUR",
+                 "taxesIncluded": True, "sourceName": "pos", "displayFinancialStatus": "PAID",
+                 "displayFulfillmentStatus": "PARTIALLY_FULFILLED", "paymentGatewayNames": ["manual", "cash"],
+                 "tags": ["vip", "eu"], "totalDiscountsSet": {"shopMoney": {"amount": "5.00"}},
+                 "taxLines": [{"title": "VAT", "rate": 0.2, "priceSet": {"shopMoney": {"amount": "4.00"}}}],
+                 "customer": {"legacyResourceId": "7", "firstName": "Jane", "lastName": "Doe",
+                              "defaultAddress": {"firstName": "Jane", "city": "Paris", "countryCodeV2": "FR"}},
+                 "shippingAddress": {"address1": "1 Rue", "provinceCode": "IDF", "countryCodeV2": "FR"},
+                 "fulfillments": [{"location": {"legacyResourceId": "55"}}]}
+        children = {
+            "LineItem": [{"id": "gid://shopify/LineItem/1", "title": "Shirt", "sku": "SH-1", "quantity": 2,
+                          "originalUnitPriceSet": {"shopMoney": {"amount": "10.00"}},
+                          "product": {"legacyResourceId": "3"}, "variant": {"legacyResourceId": "4"},
+                          "discountAllocations": [{"allocatedAmountSet": {"shopMoney": {"amount": "1.00"}}}]}],
+            "ShippingLine": [{"id": "gid://shopify/ShippingLine/9", "title": "Express",
+                              "originalPriceSet": {"shopMoney": {"amount": "6.00"}}}]}
+        rest_fields = {"id": 1001, "order_number": 1001, "checkout_id": 8001, "location_id": 55}
+
+        order_data = self.env["shopify.order.data.queue.ept"].prepare_order_from_bulk_operation(
+            order, children, rest_fields)
+
+        self.assertEqual(order_data["id"], 1001)
+        self.assertEqual(order_data["name"], "EU2-1001-B")
+        self.assertEqual(order_data["order_number"], 1001, "The order number is not parsed from the name.")
+        self.assertEqual(order_data["checkout_id"], 8001)
+        self.assertEqual(order_data["location_id"], 55)
+        self.assertEqual(order_data["financial_status"], "paid")
+        self.assertEqual(order_data["fulfillment_status"], "partial")
+        self.assertEqual(order_data["gateway"], "manual")
+        self.assertEqual(order_data["tags"], "vip, eu")
+        self.assertEqual(order_data["total_discounts"], "5.00")
+        self.assertEqual(order_data["tax_lines"], [{"title": "VAT", "rate": 0.2, "price": "4.00"}])
+        self.assertEqual(order_data["customer"]["id"], 7)
+        self.assertEqual(order_data["customer"]["default_address"]["country_code"], "FR")
+        self.assertEqual(order_data["shipping_address"]["province_code"], "IDF")
+        self.assertIsNone(order_data["billing_address"])
+        self.assertEqual(order_data["fulfillments"], [{"location_id": 55}])
+
+        line = order_data["line_items"][0]
+        self.assertEqual((line["id"], line["product_id"], line["variant_id"]), (1, 3, 4))
+        self.assertEqual(line["price"], "10.00")
+        self.assertEqual(line["discount_allocations"], [{"amount": "1.00"}])
+        self.assertEqual(order_data["shipping_lines"][0]["price"], "6.00")
+
+    def test_prepare_order_from_bulk_operation_without_rest_fields(self):
+        order_data = self.env["shopify.order.data.queue.ept"].prepare_order_from_bulk_operation(
+            {"legacyResourceId": "1002", "name": "#1002"}, {})
+        self.assertIsNone(order_data["order_number"])
+        self.assertIsNone(order_data["checkout_id"])
+        self.assertEqual(order_data["total_discounts"], "0.00")
+        self.assertEqual(order_data["line_items"], [])
+
+    def test_prepare_product_from_bulk_operation(self):
+        product = {"id": "gid://shopify/Product/1", "title": "Shirt", "status": "ACTIVE", "tags": ["summer"],
+                   "publishedAt": "2021-01-01T10:00:00Z",
+                   "options": [{"id": "gid://shopify/ProductOption/6", "name": "Color", "position": 2,
+                                "values": ["Red"]},
+                               {"id": "gid://shopify/ProductOption/5", "name": "Size", "position": 1,
+                                "values": ["M"]}]}
+        children = {
+            "ProductVariant": [{"id": "gid://shopify/ProductVariant/11", "sku": "SH-M-RED", "price": "10.00",
+                                "inventoryPolicy": "DENY", "image": {"id": "gid://shopify/ProductImage/21"},
+                                "inventoryItem": {"legacyResourceId": "31", "tracked": True},
+                                "selectedOptions": [{"name": "Color", "value": "Red"},
+                                                    {"name": "Size", "value": "M"}]}],
+            "ProductImage": [{"id": "gid://shopify/ProductImage/21", "url": "https://cdn.example.com/1.png"}]}
+
+        product_data = self.env["shopify.product.data.queue.ept"].prepare_product_from_bulk_operation(
+            product, children)
+
+        self.assertEqual(product_data["id"], 1)
+        self.assertEqual(product_data["status"], "active")
+        self.assertNotIn("published_scope", product_data, "The published scope of the template is kept.")
+        self.assertEqual([option["name"] for option in product_data["options"]], ["Size", "Color"])
+
+        variant = product_data["variants"][0]
+        self.assertEqual((variant["option1"], variant["option2"], variant["option3"]), ("M", "Red", None))
+        self.assertEqual(variant["inventory_management"], "shopify")
+        self.assertEqual(variant["inventory_policy"], "deny")
+        self.assertEqual(variant["inventory_item_id"], 31)
+        self.assertEqual(product_data["images"][0]["variant_ids"], [11])
+        self.assertEqual(product_data["image"], product_data["images"][0])
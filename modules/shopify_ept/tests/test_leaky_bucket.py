@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase
+from odoo.addons.shopify_ept.shopify import limits
+from odoo.addons.shopify_ept.shopify.limits import LeakyBucket
+
+
+class FakeClock(object):
+    """ Clock of the bucket, which moves only when the bucket sleeps. """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestLeakyBucket(BaseCase):
+
+    def setUp(self):
+        super(TestLeakyBucket, self).setUp()
+        self.clock = FakeClock()
+        patcher = patch.object(limits, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(limits.random, "uniform", return_value=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_acquire_paces_calls_above_capacity(self):
+        bucket = LeakyBucket(capacity=40, leak_rate=2.0, reserve=2)
+        for _ in range(38):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [], "Calls below the capacity less the reserve are not paced.")
+
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5], "The call waits until one unit has leaked.")
+        self.assertEqual(bucket.level, 38)
+
+    def test_bucket_leaks_over_time(self):
+        bucket = LeakyBucket(capacity=40, leak_rate=2.0, reserve=2)
+        for _ in range(38):
+            bucket.acquire()
+        self.clock.now += 10
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(bucket.level, 19)
+
+    def test_update_resyncs_with_call_limit_header(self):
+        bucket = LeakyBucket()
+        bucket.update(SimpleNamespace(headers={"X-Shopify-Shop-Api-Call-Limit": "39/80"}))
+        self.assertEqual(bucket.capacity, 80)
+        self.assertEqual(bucket.level, 39)
+
+        bucket.update(SimpleNamespace(headers={}))
+        self.assertEqual(bucket.level, 39, "Responses without the header do not change the bucket.")
+
+    def test_penalize_blocks_for_retry_after(self):
+        bucket = LeakyBucket(capacity=40, leak_rate=2.0, reserve=2)
+        bucket.penalize(SimpleNamespace(headers={"Retry-After": "2.0"}), attempt=0)
+        self.assertEqual(bucket.level, 40, "The bucket is full after a 429.")
+
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [2.0])
+        self.assertEqual(bucket.level, 37)
+
+    def test_penalize_with_invalid_retry_after(self):
+        bucket = LeakyBucket()
+        bucket.penalize(SimpleNamespace(headers={"Retry-After": "soon"}), attempt=0)
+        self.assertEqual(bucket.blocked_until, self.clock.now + 1.0)
+
+    def test_backoff_delay_is_exponential_and_capped(self):
+        bucket = LeakyBucket()
+        self.assertEqual(bucket.backoff_delay(0), 1)
+        self.assertEqual(bucket.backoff_delay(3), 8)
+        self.assertEqual(bucket.backoff_delay(10), LeakyBucket.MAX_BACKOFF)
+
+    def test_bucket_is_shared_by_shop(self):
+        bucket = LeakyBucket.for_shop("test-bucket-1.myshopify.com")
+        self.assertIs(LeakyBucket.for_shop("test-bucket-1.myshopify.com"), bucket)
+        self.assertIsNot(LeakyBucket.for_shop("test-bucket-2.myshopify.com"), bucket)
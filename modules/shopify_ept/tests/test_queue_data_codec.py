@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import json
+import unittest
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase, TransactionCase
+from odoo.addons.shopify_ept.models import data_queue_mixin_ept
+from odoo.addons.shopify_ept.shopify.pyactiveresource import jsoncodec
+
+ORDER_DATA = {"id": 1001, "name": "#1001", "note": "Café", "taxes_included": True, "customer": None,
+              "line_items": [{"id": index, "title": "Shirt %s" % index, "price": "10.00", "quantity": 1}
+                             for index in range(50)]}
+
+
+class TestJsonCodec(BaseCase):
+
+    def test_round_trip(self):
+        data = jsoncodec.dumps(ORDER_DATA)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(jsoncodec.loads(data), ORDER_DATA)
+        self.assertEqual(jsoncodec.loads(jsoncodec.dumps_str(ORDER_DATA)), ORDER_DATA)
+
+    def test_stdlib_codec(self):
+        data = jsoncodec.StdlibCodec.dumps(ORDER_DATA)
+        self.assertEqual(json.loads(data.decode("utf-8")), ORDER_DATA)
+        self.assertEqual(jsoncodec.StdlibCodec.loads(data), ORDER_DATA)
+        self.assertEqual(jsoncodec.StdlibCodec.loads(data.decode("utf-8")), ORDER_DATA)
+
+    @unittest.skipIf(jsoncodec.orjson is None, "orjson is not installed")
+    def test_orjson_codec_matches_stdlib(self):
+        data = jsoncodec.OrjsonCodec.dumps(ORDER_DATA)
+        self.assertEqual(jsoncodec.StdlibCodec.loads(data), ORDER_DATA)
+        self.assertEqual(jsoncodec.OrjsonCodec.loads(jsoncodec.StdlibCodec.dumps(ORDER_DATA)), ORDER_DATA)
+
+    def test_set_codec(self):
+        current_codec = jsoncodec.codec
+        self.addCleanup(jsoncodec.set_codec, current_codec)
+        jsoncodec.set_codec(jsoncodec.StdlibCodec())
+        self.assertEqual(jsoncodec.codec.name, "json")
+        self.assertEqual(jsoncodec.loads(jsoncodec.dumps({"id": 1})), {"id": 1})
+
+
+class TestQueueDataCodec(TransactionCase):
+
+    def setUp(self):
+        super(TestQueueDataCodec, self).setUp()
+        self.data_queue_mixin_obj = self.env["data.queue.mixin.ept"]
+
+    def test_small_data_is_stored_as_json(self):
+        value = self.data_queue_mixin_obj.encode_shopify_queue_data({"id": 1})
+        self.assertEqual(json.loads(value), {"id": 1})
+        self.assertEqual(self.data_queue_mixin_obj.decode_shopify_queue_data(value), {"id": 1})
+
+    def test_big_data_is_compressed(self):
+        value = self.data_queue_mixin_obj.encode_shopify_queue_data(ORDER_DATA)
+        prefix = "zstd:" if data_queue_mixin_ept.zstandard else "zlib:"
+        self.assertTrue(value.startswith(prefix))
+        self.assertLess(len(value), len(json.dumps(ORDER_DATA)))
+        self.assertEqual(self.data_queue_mixin_obj.decode_shopify_queue_data(value), ORDER_DATA)
+
+    def test_zlib_without_zstandard(self):
+        with patch.object(data_queue_mixin_ept, "zstandard", None):
+            value = self.data_queue_mixin_obj.encode_shopify_queue_data(ORDER_DATA)
+            self.assertTrue(value.startswith("zlib:"))
+            self.assertEqual(self.data_queue_mixin_obj.decode_shopify_queue_data(value), ORDER_DATA)
+
+    @unittest.skipIf(data_queue_mixin_ept.zstandard is None, "zstandard is not installed")
+    def test_zstd_data_needs_zstandard(self):
+        value = self.data_queue_mixin_obj.encode_shopify_queue_data(ORDER_DATA)
+        with patch.object(data_queue_mixin_ept, "zstandard", None):
+            with self.assertRaises(ImportError):
+                self.data_queue_mixin_obj.decode_shopify_queue_data(value)
+
+    def test_legacy_json_is_decoded(self):
+        value = json.dumps(ORDER_DATA, indent=4)
+        self.assertEqual(self.data_queue_mixin_obj.decode_shopify_queue_data(value), ORDER_DATA)
+
+    def test_empty_data(self):
+        self.assertEqual(self.data_queue_mixin_obj.decode_shopify_queue_data(False), {})
+        self.assertFalse(self.data_queue_mixin_obj.get_shopify_queue_data_preview(False))
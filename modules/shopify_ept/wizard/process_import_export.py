@@ -13,7 +13,6 @@ from odoo.tools.misc import split_every
 
 from odoo import models, fields, api, _
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
 
 _logger = logging.getLogger("Shopify")
 
@@ -75,6 +74,10 @@ class ShopifyProcessImportExport(models.TransientModel):
     payout_end_date = fields.Date(string="End Date")
     skip_existing_product = fields.Boolean(string="Do Not Update Existing Products",
                                            help="Check if you want to skip existing products.")
+    shopify_use_bulk_operation = fields.Boolean(string="Use Bulk Operation",
+                                                help="Check to fetch all the records with one GraphQL bulk operation "
+                                                     "instead of paging them, useful for the first import of a "
+                                                     "store.")
     csv_file = fields.Binary(filters="*.csv", help="Select CSV file to upload.")
     file_name = fields.Char(help="Name of CSV file.")
 
@@ -89,8 +92,8 @@ class ShopifyProcessImportExport(models.TransientModel):
 
         instance = self.shopify_instance_id
         if self.shopify_operation == "sync_product":
-            product_queue_ids = product_data_queue_obj.shopify_create_product_data_queue(instance,
-                                                                                         self.skip_existing_product)
+            product_queue_ids = product_data_queue_obj.shopify_create_product_data_queue(
+                instance, self.skip_existing_product, use_bulk_operation=self.shopify_use_bulk_operation)
             if product_queue_ids:
                 queue_ids = product_queue_ids
                 action_name = "shopify_ept.action_shopify_product_data_queue"
@@ -122,13 +125,13 @@ class ShopifyProcessImportExport(models.TransientModel):
         elif self.shopify_operation == "import_unshipped_orders":
             order_date_queue_obj.shopify_create_order_data_queues(instance, self.orders_from_date,
                                                                   self.orders_to_date,
-                                                                  order_type="unshipped")
+                                                                  order_type="unshipped",
+                                                                  use_bulk_operation=self.shopify_use_bulk_operation)
 
         elif self.shopify_operation == "import_shipped_orders":
-            order_queues = order_date_queue_obj.shopify_create_order_data_queues(instance,
-                                                                                 self.orders_from_date,
-                                                                                 self.orders_to_date,
-                                                                                 order_type="shipped")
+            order_queues = order_date_queue_obj.shopify_create_order_data_queues(
+                instance, self.orders_from_date, self.orders_to_date, order_type="shipped",
+                use_bulk_operation=self.shopify_use_bulk_operation)
             if order_queues:
                 queue_ids = order_queues
                 action_name = "shopify_ept.action_shopify_order_data_queue_ept"
@@ -263,14 +266,12 @@ class ShopifyProcessImportExport(models.TransientModel):
 
         self.shopify_instance_id.connect_in_shopify()
         if not self.shopify_instance_id.shopify_last_date_customer_import:
-            customer_ids = shopify.Customer().find(limit=250)
+            customer_ids = shopify.Customer.find_raw(limit=250)
         else:
-            customer_ids = shopify.Customer().find(
+            customer_ids = shopify.Customer.find_raw(
                 updated_at_min=self.shopify_instance_id.shopify_last_date_customer_import, limit=250)
         if customer_ids:
-            customer_queues_ids = self.create_customer_data_queues(customer_ids)
-            if len(customer_ids) == 250:
-                customer_queues_ids += self.shopify_list_all_customer(customer_ids)
+            customer_queues_ids = self.shopify_list_all_customer(customer_ids)
 
             self.shopify_instance_id.shopify_last_date_customer_import = datetime.now()
         if not customer_ids:
@@ -329,35 +330,21 @@ class ShopifyProcessImportExport(models.TransientModel):
 
     def shopify_list_all_customer(self, result):
         """
-        This method used to call the page wise data import for customers from Shopify to Odoo.
+        This method used to create the customer queues page wise, starting from the given page.
+        The next page is fetched from Shopify while the queues of the current page are created.
         @param : self,result
         @author: Angel Patel @Emipro Technologies Pvt. Ltd on date 14/10/2019.
         :Task ID: 157065
         Modify by Haresh Mori on date 26/12/2019, Taken Changes for the pagination and API version.
         """
-        catch = ""
         customer_queue_list = []
-        while result:
-            page_info = ""
-            link = shopify.ShopifyResource.connection.response.headers.get('Link')
-            if not link or not isinstance(link, str):
-                return customer_queue_list
-            for page_link in link.split(','):
-                if page_link.find('next') > 0:
-                    page_info = page_link.split(';')[0].strip('<>').split('page_info=')[1]
-                    try:
-                        result = shopify.Customer().find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(5)
-                                result = shopify.Customer().find(page_info=page_info, limit=250)
-                    except Exception as error:
-                        raise UserError(error)
-                    if result:
-                        customer_queue_list += self.create_customer_data_queues(result)
-            if catch == page_info:
-                break
+        try:
+            for page in shopify.PaginatedIterator(result, prefetch=True):
+                customer_queue_list += self.create_customer_data_queues(page)
+        except UserError:
+            raise
+        except Exception as error:
+            raise UserError(error)
         return customer_queue_list
 
     @api.model
@@ -413,7 +400,7 @@ class ShopifyProcessImportExport(models.TransientModel):
                 ('shopify_template_id', 'in', shopify_template_ids)])
             odoo_product_ids = shopify_products.product_id.ids
             if odoo_product_ids:
-                shopify_product_obj.export_stock_in_shopify(instance, odoo_product_ids)
+                shopify_product_obj.export_stock_in_shopify(instance, odoo_product_ids, force_export=True)
 
         return True
 
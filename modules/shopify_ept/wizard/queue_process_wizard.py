@@ -10,11 +10,30 @@ class ShopifyQueueProcessEpt(models.TransientModel):
     def manual_queue_process(self):
         queue_process = self._context.get('queue_process')
         if queue_process == "process_product_queue_manually":
-            self.sudo().process_product_queue_manually()
+            return self.sudo().process_product_queue_manually()
         if queue_process == "process_customer_queue_manually":
-            self.sudo().process_customer_queue_manually()
+            return self.sudo().process_customer_queue_manually()
         if queue_process == "process_order_queue_manually":
-            self.sudo().process_order_queue_manually()
+            return self.sudo().process_order_queue_manually()
+        return True
+
+    def prepare_skipped_queue_notification(self, queue_model, queue_ids):
+        """
+        Gives the notification of the queues, which could not be processed manually as a queue worker is
+        processing them.
+        @param queue_model: Model name of the queue.
+        @param queue_ids: Ids of the queues, which could not be claimed.
+        @return: Notification action or True, when no queue is skipped.
+        """
+        skipped_queues = self.env[queue_model].browse(queue_ids).filtered("is_process_queue")
+        if not skipped_queues:
+            return True
+        return {"type": "ir.actions.client", "tag": "display_notification",
+                "params": {"title": "Shopify",
+                           "message": _("Queues %s are being processed by the scheduler, please try again "
+                                        "later.") % ", ".join(skipped_queues.mapped("name")),
+                           "sticky": True,
+                           "next": {"type": "ir.actions.act_window_close"}}}
 
     def process_product_queue_manually(self):
         """This method used to process the product queue manually. You can call the method from here :
@@ -24,12 +43,22 @@ class ShopifyQueueProcessEpt(models.TransientModel):
         """
         shopify_product_queue_line_obj = self.env["shopify.product.data.queue.line.ept"]
         product_queue_ids = self._context.get('active_ids')
+        skipped_queue_ids = []
         for product_queue_id in product_queue_ids:
+            # Queues being processed by a queue worker are skipped.
+            queue = shopify_product_queue_line_obj.claim_product_queue([product_queue_id], ("draft", "failed"),
+                                                                       include_action_required=True)
+            if not queue:
+                skipped_queue_ids.append(product_queue_id)
+                continue
             product_queue_line_batch = shopify_product_queue_line_obj.search(
                 [("product_data_queue_id", "=", product_queue_id),
                  ("state", "in", ('draft', 'failed'))])
             product_queue_line_batch.process_product_queue_line_data()
-        return True
+            # Only a completed queue leaves the action required state, failed lines still need attention.
+            if queue.state == "completed":
+                queue.write({"is_action_require": False, "queue_process_count": 0})
+        return self.prepare_skipped_queue_notification("shopify.product.data.queue.ept", skipped_queue_ids)
 
     def process_customer_queue_manually(self):
         """
@@ -40,13 +69,24 @@ class ShopifyQueueProcessEpt(models.TransientModel):
         """
         customer_queue_line_obj = self.env["shopify.customer.data.queue.line.ept"]
         customer_queue_ids = self._context.get("active_ids")
+        skipped_queue_ids = []
 
         for customer_queue_id in customer_queue_ids:
+            # Queues being processed by a queue worker are skipped.
+            queue = customer_queue_line_obj.claim_customer_queue([customer_queue_id], ("draft", "failed"),
+                                                                 include_action_required=True)
+            if not queue:
+                skipped_queue_ids.append(customer_queue_id)
+                continue
             synced_customer_queue_line_ids = customer_queue_line_obj.search(
                 [("synced_customer_queue_id", "=", customer_queue_id),
                  ("state", "in", ["draft", "failed"])])
             if synced_customer_queue_line_ids:
                 synced_customer_queue_line_ids.process_customer_queue_lines()
+            # Only a completed queue leaves the action required state, failed lines still need attention.
+            if queue.state == "completed":
+                queue.write({"is_action_require": False, "queue_process_count": 0})
+        return self.prepare_skipped_queue_notification("shopify.customer.data.queue.ept", skipped_queue_ids)
 
     def process_order_queue_manually(self):
         """This method used to process the order queue manually. You can call the method from here :
@@ -56,16 +96,23 @@ class ShopifyQueueProcessEpt(models.TransientModel):
         """
         shopify_order_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
         order_queue_ids = self._context.get('active_ids')
+        skipped_queue_ids = []
 
-        self.env.cr.execute(
-            """update shopify_order_data_queue_ept set is_process_queue = False where is_process_queue = True""")
-        self._cr.commit()
         for order_queue_id in order_queue_ids:
+            # Queues being processed by a queue worker are skipped.
+            queue = shopify_order_queue_line_obj.claim_order_queue([order_queue_id], ("draft", "failed"),
+                                                                   include_action_required=True)
+            if not queue:
+                skipped_queue_ids.append(order_queue_id)
+                continue
             order_queue_line_batch = shopify_order_queue_line_obj.search(
                 [("shopify_order_data_queue_id", "=", order_queue_id),
                  ("state", "in", ('draft', 'failed'))])
             order_queue_line_batch.process_import_order_queue_data()
-        return True
+            # Only a completed queue leaves the action required state, failed lines still need attention.
+            if queue.state == "completed":
+                queue.write({"is_action_require": False, "queue_process_count": 0})
+        return self.prepare_skipped_queue_notification("shopify.order.data.queue.ept", skipped_queue_ids)
 
     def set_to_completed_queue(self):
         """